@@ -73,6 +73,16 @@ iau_shower_table_npy = os.path.join('wmpl', 'share', 'streamfulldata.npy')
 if os.path.isfile(iau_shower_table_npy):
     os.remove(iau_shower_table_npy)
 
+# Delete the cached VSOP87 coefficients
+vsop87_npy = os.path.join('wmpl', 'share', 'VSOP87D.npy')
+if os.path.isfile(vsop87_npy):
+    os.remove(vsop87_npy)
+
+# Delete the cached solar longitude fits
+sol_lon_cheb_npz = os.path.join('wmpl', 'share', 'SolarLongitudeChebyshev.npz')
+if os.path.isfile(sol_lon_cheb_npz):
+    os.remove(sol_lon_cheb_npz)
+
 
 # Get all data files in 'share'
 share_files = [os.path.join('wmpl', 'share', file_name) for file_name in os.listdir(os.path.join(dir_path, 'wmpl', 'share'))]
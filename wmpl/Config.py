@@ -159,6 +159,12 @@ class ConfigStruct(object):
         # DE430 JPL ephemerids file location
         self.jpl_ephem_file = os.path.join(abs_path, 'share', 'de430.bsp')
 
+        # Chebyshev fits of the solar longitude computed from the JPL ephemerids (generated on first use)
+        self.sol_lon_cheb_file = os.path.join(abs_path, 'share', 'SolarLongitudeChebyshev.npz')
+
+        # Range of years covered by the solar longitude Chebyshev fits
+        self.sol_lon_cheb_years = (1950, 2100)
+
         ###
 
 
@@ -9,7 +9,7 @@ import scipy.interpolate
 from wmpl.TrajSim.SporadicSourcesModel import RadiantSample, extractRadiantSampleParameters, \
     initSporadicModel, SporadicModel
 from wmpl.Utils.TrajConversions import date2JD, jd2Date, rotatePolar, raDec2Ecliptic
-from wmpl.Utils.SolarLongitude import solLon2jdJPL, jd2SolLonJPL, jd2SolLonJPL_vect
+from wmpl.Utils.SolarLongitude import solLon2jdCheb, jd2SolLonJPL, jd2SolLonJPL_vect
 from wmpl.Utils.PlotCelestial import CelestialPlot
 
 
@@ -122,7 +122,7 @@ class MeteorShower(object):
                 la_sun = sampleActivityModel(self.sol_slope, self.sol_max)[0]
 
                 # Calculate the corresponding Julian date for the drawn solar longitude
-                jd = solLon2jdJPL(self.year, self.month, la_sun)
+                jd = solLon2jdCheb(self.year, self.month, la_sun)
 
             else:
 
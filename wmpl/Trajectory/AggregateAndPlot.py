@@ -22,7 +22,7 @@ from wmpl.Utils.Physics import calcMass
 from wmpl.Utils.Pickling import loadPickle
 from wmpl.Utils.PlotCelestial import CelestialPlot
 from wmpl.Utils.PlotMap import MapColorScheme
-from wmpl.Utils.ShowerAssociation import associateShowerTraj, MeteorShower
+from wmpl.Utils.ShowerAssociation import associateShowerTrajBatch, MeteorShower
 from wmpl.Utils.SolarLongitude import jd2SolLonSteyaert, solLon2jdSteyaert
 from wmpl.Utils.TrajConversions import jd2Date, datetime2JD
 
@@ -209,16 +209,18 @@ def writeOrbitSummaryFile(dir_path, traj_list, traj_summary_file_name=TRAJ_SUMMA
     # Add a horizontal line
     out_str += "# {:s}\n\r".format("; ".join(["-"*len(entry) for entry in header]))
 
+    # Perform shower association of all trajectories at once
+    shower_obj_list = associateShowerTrajBatch(traj_list)
+
     # Write lines of data
-    for traj in traj_list:
+    for traj, shower_obj in zip(traj_list, shower_obj_list):
 
         line_info = []
 
         line_info.append("{:20.12f}".format(traj.jdt_ref))
         line_info.append("{:26s}".format(str(jd2Date(traj.jdt_ref, dt_obj=True))))
 
-        # Perform shower association
-        shower_obj = associateShowerTraj(traj)
+        # Add the shower association
         if shower_obj is None:
             shower_no = -1
             shower_code = '...'
@@ -637,10 +639,16 @@ def generateTrajectoryPlots(output_dir, traj_list, plot_name='scecliptic', plot_
     shower_no_list = []
     shower_obj_dict = {}
 
+    # Perform shower association of all trajectories at once
+    if plot_showers:
+        traj_shower_objs = associateShowerTrajBatch(traj_list)
+    else:
+        traj_shower_objs = [None]*len(traj_list)
+
     hypo_count = 0
     jd_min = np.inf
     jd_max = 0
-    for traj in traj_list:
+    for traj, shower_obj in zip(traj_list, traj_shower_objs):
 
         # Reject all hyperbolic orbits
         if traj.orbit.e > 1:
@@ -662,9 +670,6 @@ def generateTrajectoryPlots(output_dir, traj_list, plot_name='scecliptic', plot_
 
         if plot_showers:
 
-            # Perform shower association and track the list of all showers
-            shower_obj = associateShowerTraj(traj)
-
             # If the trajectory was associated, sort it to the appropriate shower
             if shower_obj is not None:
                 if shower_obj.IAU_no not in shower_no_list:
@@ -847,23 +852,23 @@ def generateShowerPlots(dir_path, traj_list, min_members=30, max_radiant_err=0.5
 
 
 
+    # Perform shower association of all good quality orbits at once
+    reject_indices_set = set(reject_indices)
+    good_trajs = [traj for i, traj in enumerate(traj_list) if i not in reject_indices_set]
+    good_shower_objs = associateShowerTrajBatch(good_trajs)
+
     # Generate a dictionary of showers and trajectories
     shower_no_list = []
     shower_traj_dict = {}
-    for i, traj in enumerate(traj_list):
-
-        # Skip low quality orbits
-        if i in reject_indices:
-            continue
-
-        # Perform shower association and track the list of all showers
-        shower_obj = associateShowerTraj(traj)
+    shower_code_dict = {}
+    for traj, shower_obj in zip(good_trajs, good_shower_objs):
 
         # If the trajectory was associated, sort it to the appropriate shower
         if shower_obj is not None:
             if shower_obj.IAU_no not in shower_no_list:
                 shower_no_list.append(shower_obj.IAU_no)
                 shower_traj_dict[shower_obj.IAU_no] = [traj]
+                shower_code_dict[shower_obj.IAU_no] = shower_obj.IAU_code
             else:
                 shower_traj_dict[shower_obj.IAU_no].append(traj)
 
@@ -890,7 +895,7 @@ def generateShowerPlots(dir_path, traj_list, min_members=30, max_radiant_err=0.5
 
 
         # Get shower letter code
-        shower_code = associateShowerTraj(shower_trajs[0]).IAU_code
+        shower_code = shower_code_dict[shower_no]
 
         print("Processing shower:", shower_no, shower_code)
 
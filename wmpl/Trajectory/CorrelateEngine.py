@@ -2,21 +2,30 @@
 
 from __future__ import print_function, division, absolute_import
 
+import os
 import copy
+import json
+import hashlib
 import datetime
 import multiprocessing
+import multiprocessing.util
 
 import numpy as np
 
 from wmpl.Trajectory.Trajectory import ObservedPoints, PlaneIntersection, Trajectory
 from wmpl.Utils.Earth import greatCircleDistance
 from wmpl.Utils.Math import vectNorm, vectMag, angleBetweenVectors, vectorFromPointDirectionAndAngle, \
-    findClosestPoints, generateDatetimeBins, meanAngle, angleBetweenSphericalCoords
+    findClosestPoints, generateDatetimeBins, angleBetweenSphericalCoords
 from wmpl.Utils.ShowerAssociation import associateShowerTraj
-from wmpl.Utils.TrajConversions import J2000_JD, geo2Cartesian, cartesian2Geo, raDec2AltAz, altAz2RADec, \
+from wmpl.Utils.TrajConversions import EARTH, J2000_JD, geo2Cartesian, cartesian2Geo, raDec2AltAz, altAz2RADec, \
     raDec2ECI, datetime2JD, jd2Date, equatorialCoordPrecession_vect
 
 
+# Version of the station pair checks, increment when stationRangeCheck or checkFOVOverlap change so the saved
+#   station pair graphs are discarded
+STATION_PAIR_GRAPH_VERSION = 1
+
+
 
 
 class TrajectoryConstraints(object):
@@ -31,6 +40,10 @@ class TrajectoryConstraints(object):
         # Max time difference between meteor observations
         self.max_toffset = 10.0
 
+        # Max gap between the end of one observation and the beginning of the other, in frames of the 
+        #   observation with the longer frame time
+        self.max_time_gap_frames = 5
+
 
         # Minimum distance between stations (km)
         self.min_station_dist = 5.0
@@ -107,6 +120,10 @@ class TrajectoryConstraints(object):
         if self.mc_cores < 2:
             self.mc_cores = 2
 
+        # Number of processes in which candidate trajectories are solved in parallel. If larger than 1, 
+        #   every candidate is solved in a separate process and its MC runs are done on a single core
+        self.solver_cores = 1
+
         # MC runs to run for error estimation
         self.error_mc_runs = 10
 
@@ -141,6 +158,349 @@ class TrajectoryConstraints(object):
 
 
 
+class StationPairGraph(object):
+    def __init__(self, file_path=None):
+        """ Cache of station pair compatibility (distance limits and FOV overlap). Station positions and 
+            pointings only change when platepars change, so the checks are done once per pair of platepar
+            versions and afterwards a pair is checked by a set lookup. The graph can be saved to a file and 
+            loaded, so it is reused between time bins and runs.
+
+        Keyword arguments:
+            file_path: [str] Path to the JSON file the graph is loaded from and saved to. None by default, 
+                in which case the graph is not saved.
+        """
+
+        self.file_path = file_path
+
+        # Constraints which the results of the checks depend on, see setConstraints. The graph is only valid
+        #   for these values
+        self.constraints = None
+
+        # Sets of keys of compatible and incompatible station pairs
+        self.compatible = set()
+        self.incompatible = set()
+
+        # Cache of platepar keys (platepar objects are reused between observations of the same folder)
+        self.pp_keys = {}
+
+
+    def setConstraints(self, traj_constraints):
+        """ Set the constraints the station pair checks are done with. If they differ from the current ones,
+            all stored pairs are dropped and the pairs saved with the same constraints are loaded from the 
+            file.
+
+        Arguments:
+            traj_constraints: [TrajectoryConstraints]
+        """
+
+        constraints = {
+            "version": STATION_PAIR_GRAPH_VERSION,
+            "min_station_dist": traj_constraints.min_station_dist,
+            "max_station_dist": traj_constraints.max_station_dist
+            }
+
+        if constraints == self.constraints:
+            return
+
+        self.constraints = constraints
+        self.compatible = set()
+        self.incompatible = set()
+
+        if self.file_path is not None:
+            self.load()
+
+
+    def plateparKey(self, pp):
+        """ Compute the key of the platepar, a hash of the station code and the values which define the
+            station position and the pointing. The pointing is represented by the alt/az of the FOV centre 
+            (rounded to 0.01 deg), as RA/Dec and the reference time change with every recalibration.
+
+        Arguments:
+            pp: [Platepar] Platepar object.
+
+        Return:
+            [str] Platepar key.
+        """
+
+        if id(pp) in self.pp_keys:
+            pp_ref, key = self.pp_keys[id(pp)]
+
+            if pp_ref is pp:
+                return key
+
+        # Compute alt/az of the FOV centre
+        lat, lon = np.radians(pp.lat), np.radians(pp.lon)
+        azim, alt = raDec2AltAz(np.radians(pp.RA_d), np.radians(pp.dec_d), pp.JD, lat, lon)
+
+        key_values = (pp.station_code, round(pp.lat, 6), round(pp.lon, 6), round(pp.elev, 1), \
+            round(np.degrees(azim), 2), round(np.degrees(alt), 2), round(pp.fov_h, 2), round(pp.fov_v, 2))
+
+        key = hashlib.sha1(repr(key_values).encode("utf-8")).hexdigest()
+
+        # Keep the reference to the platepar, so the ID of the object cannot be reused
+        self.pp_keys[id(pp)] = (pp, key)
+
+        return key
+
+
+    def pairKey(self, rp, tp):
+        """ Return the key of the pair of platepars, independent of the order of stations. """
+
+        return tuple(sorted([self.plateparKey(rp), self.plateparKey(tp)]))
+
+
+    def lookup(self, rp, tp):
+        """ Look up the compatibility of the given station pair.
+
+        Arguments:
+            rp: [Platepar] Reference platepar.
+            tp: [Platepar] Test platepar.
+
+        Return:
+            [bool or None] True if compatible, False if not, None if the pair was not checked yet.
+        """
+
+        pair_key = self.pairKey(rp, tp)
+
+        if pair_key in self.compatible:
+            return True
+
+        if pair_key in self.incompatible:
+            return False
+
+        return None
+
+
+    def add(self, rp, tp, compatible):
+        """ Store the compatibility of the given station pair. """
+
+        pair_key = self.pairKey(rp, tp)
+
+        if compatible:
+            self.compatible.add(pair_key)
+            self.incompatible.discard(pair_key)
+        else:
+            self.incompatible.add(pair_key)
+            self.compatible.discard(pair_key)
+
+
+    def resetPlateparKeys(self):
+        """ Drop the cached platepar keys, so the platepar objects of previous time bins can be freed. """
+
+        self.pp_keys = {}
+
+
+    def load(self):
+        """ Add the station pairs stored in the file to the graph. Pairs already in the graph keep their 
+            compatibility. A missing or unreadable file, or a file saved with different constraints, is 
+            skipped.
+        """
+
+        if not os.path.isfile(self.file_path):
+            return
+
+        try:
+            with open(self.file_path) as f:
+                graph_dict = json.load(f)
+
+            constraints = graph_dict["constraints"]
+            compatible = set(tuple(pair_key) for pair_key in graph_dict["compatible"])
+            incompatible = set(tuple(pair_key) for pair_key in graph_dict["incompatible"])
+
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            print("Could not read the station pair graph:", self.file_path)
+            return
+
+        if constraints != self.constraints:
+            print("Station pair constraints have changed, not using the saved station pair graph")
+            return
+
+        self.compatible |= compatible - self.incompatible
+        self.incompatible |= incompatible - self.compatible
+
+
+    def save(self):
+        """ Save the graph to the file, together with the constraints it was computed with. Pairs already 
+            stored in the file with the same constraints (e.g. by other processes) are kept. The graph is 
+            optional, so it is skipped if it cannot be written.
+        """
+
+        # Nothing to save if no checks were done
+        if (self.file_path is None) or (self.constraints is None):
+            return
+
+        # Merge the pairs added by other processes since the graph was loaded
+        self.load()
+
+        graph_dict = {
+            "constraints": self.constraints,
+            "compatible": sorted(self.compatible),
+            "incompatible": sorted(self.incompatible)
+            }
+
+        # Write to a temporary file first so a concurrent reader never sees a partial file
+        tmp_file = self.file_path + ".{:d}.tmp".format(os.getpid())
+
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(graph_dict, f)
+
+            os.replace(tmp_file, self.file_path)
+
+        except (IOError, OSError) as e:
+            print("Could not write the station pair graph {:s}: {:s}".format(self.file_path, str(e)))
+
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+
+
+class FilterCascade(object):
+    def __init__(self):
+        """ Ordered cascade of filters which candidate observation pairs have to pass. Filters are run in the
+            order they were added (the cheapest ones should be added first) and the number of rejections 
+            is counted per stage, so it can be seen which constraints are actually used.
+        """
+
+        # List of (name, function) entries. Stages with no function are checked outside the cascade and only
+        #   their rejections are counted
+        self.stages = []
+
+        # Number of rejections per stage
+        self.rejections = {}
+
+        # Number of evaluated and accepted pairs
+        self.evaluated = 0
+        self.accepted = 0
+
+
+    def addStage(self, name, func=None):
+        """ Add a stage to the end of the cascade.
+
+        Arguments:
+            name: [str] Name of the stage.
+
+        Keyword arguments:
+            func: [function] Function which takes the checked objects and returns True if they pass. None by
+                default, in which case the stage is checked by the caller, see reject.
+        """
+
+        self.stages.append([name, func])
+        self.rejections[name] = 0
+
+
+    def check(self, *args):
+        """ Run all stages which have a function, in order, until one of them rejects the given objects.
+
+        Return:
+            [str] Name of the stage which rejected the objects, or None if all stages passed.
+        """
+
+        self.evaluated += 1
+
+        for name, func in self.stages:
+
+            if func is None:
+                continue
+
+            if not func(*args):
+                self.rejections[name] += 1
+                return name
+
+        return None
+
+
+    def reject(self, name):
+        """ Count a rejection by a stage checked outside the cascade. """
+
+        self.rejections[name] += 1
+
+
+    def accept(self):
+        """ Count an accepted pair. """
+
+        self.accepted += 1
+
+
+    def summary(self):
+        """ Return a printable summary of rejections per stage. """
+
+        lines = ["Evaluated pairs: {:d}".format(self.evaluated)]
+        for name, _ in self.stages:
+            lines.append("  rejected by {:s}: {:d}".format(name, self.rejections[name]))
+        lines.append("Accepted pairs: {:d}".format(self.accepted))
+
+        return "\n".join(lines)
+
+
+
+class DeferredDataHandle(object):
+    def __init__(self):
+        """ Data handle used when solving trajectories in worker processes. Instead of writing to the 
+            database, it records the calls which are then replayed on the real data handle in the main 
+            process.
+        """
+
+        # List of (method name, args, kwargs)
+        self.calls = []
+
+
+    def addTrajectory(self, *args, **kwargs):
+        self.calls.append(["addTrajectory", args, kwargs])
+
+
+    def replay(self, dh):
+        """ Apply all recorded calls to the given data handle, in the order they were made. """
+
+        for method_name, args, kwargs in self.calls:
+            getattr(dh, method_name)(*args, **kwargs)
+
+
+
+def initSolverProcess():
+    """ Initialize a worker process in which trajectories are solved. The module-level MC executor 
+        inherited from the parent process is dropped, as its pool belongs to the parent.
+    """
+
+    import wmpl.Trajectory.Trajectory as TrajectoryModule
+
+    TrajectoryModule._mc_executor = None
+
+    # Remove temporary MC files when the worker exits
+    multiprocessing.util.Finalize(None, TrajectoryModule._closeMCExecutor, exitpriority=10)
+
+
+
+def _solveCandidateWorker(params):
+    """ Solve one candidate trajectory in a worker process, see TrajectoryCorrelator.solveCandidates.
+
+    Arguments:
+        params: [list] Trajectory constraints, v_init_part, data_in_j2000 flag, initialized Trajectory 
+            object and the number of MC runs.
+
+    Return:
+        (successful_traj_fit, traj, deferred_dh):
+            - successful_traj_fit: [bool] True if the trajectory was successfully solved.
+            - traj: [Trajectory] Solved trajectory, None if it failed.
+            - deferred_dh: [DeferredDataHandle] Data handle calls made during solving.
+    """
+
+    traj_constraints, v_init_part, data_in_j2000, traj, mc_runs = params
+
+    # Don't start nested pools for the MC runs
+    traj_constraints = copy.copy(traj_constraints)
+    traj_constraints.mc_cores = 1
+    traj.mc_cores = 1
+
+    deferred_dh = DeferredDataHandle()
+    tc = TrajectoryCorrelator(deferred_dh, traj_constraints, v_init_part, data_in_j2000=data_in_j2000)
+
+    successful_traj_fit, traj = tc.solveTrajectory(traj, mc_runs)
+
+    return successful_traj_fit, traj, deferred_dh
+
+
+
 class TrajectoryCorrelator(object):
     def __init__(self, data_handle, traj_constraints, v_init_part, data_in_j2000=True):
         """ Correlates meteor trajectories using meteor data given to it through a data handle. A data handle
@@ -159,6 +519,24 @@ class TrajectoryCorrelator(object):
         # Indicate that the data is in J2000
         self.data_in_j2000 = data_in_j2000
 
+        # Cache of station pair compatibility. It is kept by the data handle if it has one, so it is reused 
+        #   between time bins and runs
+        self.station_pair_graph = getattr(self.dh, "station_pair_graph", None)
+        if self.station_pair_graph is None:
+            self.station_pair_graph = StationPairGraph()
+
+        self.station_pair_graph.setConstraints(self.traj_constraints)
+        self.station_pair_graph.resetPlateparKeys()
+
+        # Filters applied to candidate observation pairs, from the cheapest to the most expensive one
+        self.pair_filters = FilterCascade()
+        self.pair_filters.addStage("time overlap", self.pairTimeOverlapCheck)
+        self.pair_filters.addStage("duration", self.pairDurationCheck)
+        self.pair_filters.addStage("angular velocity", self.pairAngularVelocityCheck)
+        self.pair_filters.addStage("heights")
+        self.pair_filters.addStage("velocity difference")
+        self.pair_filters.addStage("velocity range")
+
 
 
     def trajectoryRangeCheck(self, traj_reduced, platepar):
@@ -344,6 +722,46 @@ class TrajectoryCorrelator(object):
         return False
 
 
+    def stationPairCheck(self, rp, tp):
+        """ Check that the two stations are within the distance limits and have overlapping fields of view.
+            The result is cached per pair of platepar versions, see StationPairGraph.
+
+        Arguments:
+            rp: [Platepar] Reference platepar.
+            tp: [Platepar] Test platepar.
+
+        Return:
+            [bool] True if the stations can be paired, False otherwise.
+        """
+
+        compatible = self.station_pair_graph.lookup(rp, tp)
+
+        if compatible is not None:
+
+            if not compatible:
+                print("Rejecting station combination {:s} and {:s} (cached)...".format(rp.station_code, \
+                    tp.station_code))
+
+            return compatible
+
+
+        # Check if the stations are within range
+        compatible = self.stationRangeCheck(rp, tp)
+
+        # Check the FOV overlap
+        if compatible:
+            compatible = self.checkFOVOverlap(rp, tp)
+
+            if not compatible:
+                print("Station FOV does not overlap: {:s} and {:s}".format(rp.station_code, tp.station_code))
+
+
+        self.station_pair_graph.add(rp, tp, compatible)
+
+        return compatible
+
+
+
     def initObservationsObject(self, met, pp, ref_dt=None):
         """ Init the observations object which will be fed into the trajectory solver. """
 
@@ -355,10 +773,10 @@ class TrajectoryCorrelator(object):
             ref_dt = met.reference_dt
             time_offset = 0
 
-        ra_data = np.array([np.radians(entry.ra) for entry in met.data])
-        dec_data = np.array([np.radians(entry.dec) for entry in met.data])
-        time_data = np.array([entry.time_rel + time_offset for entry in met.data])
-        mag_data = np.array([entry.mag for entry in met.data])
+        ra_data = np.radians(met.data.ra)
+        dec_data = np.radians(met.data.dec)
+        time_data = met.data.time_rel + time_offset
+        mag_data = np.array(met.data.mag)
 
         # If the data is in J2000, precess it to the epoch of date
         if self.data_in_j2000:
@@ -404,8 +822,89 @@ class TrajectoryCorrelator(object):
 
 
 
+    def pairTimeOverlapCheck(self, obs1, obs2):
+        """ Check that the observations overlap in time, or that the gap between them is at most a few frames.
+            Observations of the same meteor from different stations are simultaneous, so only the 
+            uncertainty of the station clocks and of the end points is tolerated.
+        """
+
+        # Gap between the two observations (negative if they overlap)
+        time_gap = max(obs2.time_data[0] - obs1.time_data[-1], obs1.time_data[0] - obs2.time_data[-1])
+
+        # Take the longest median frame time of both observations as the frame time
+        frame_time = max(np.median(np.diff(obs.time_data)) for obs in [obs1, obs2])
+
+        if time_gap > self.traj_constraints.max_time_gap_frames*frame_time:
+            print("Observations do not overlap in time, gap: {:.2f} s".format(time_gap))
+            return False
+
+        return True
+
+
+    def pairDurationCheck(self, obs1, obs2):
+        """ Check that both observations have a positive duration, so the velocity can be computed. """
+
+        for obs in [obs1, obs2]:
+            if obs.time_data[-1] <= obs.time_data[0]:
+                print("Observation from {:s} has no duration!".format(str(obs.station_id)))
+                return False
+
+        return True
+
+
+    def pairAngularVelocityCheck(self, obs1, obs2):
+        """ Check that the angular velocity of every observation is possible for a meteor. The heights of 
+            the begin and end points have to be above the minimum begin and end heights, which gives the 
+            minimum ranges along the first and the last line of sight. Together with the angular length 
+            they give a lower limit of the velocity, which is compared to the largest velocity that can pass
+            the checks in quickTrajectorySolution (with a safety factor of 2, as the trajectory points are 
+            not exactly on the lines of sight).
+        """
+
+        # Largest velocity of one station which can still pass the velocity difference and range checks
+        v_max = 2*self.traj_constraints.v_avg_max/(1 - self.traj_constraints.max_vel_percent_diff/200)
+
+        for obs in [obs1, obs2]:
+
+            # Minimum range to the meteor at the beginning and the end (km), along a line of sight with the
+            #   given elevation from a spherical Earth
+            r_earth = EARTH.EQUATORIAL_RADIUS/1000 + obs.ele/1000
+            ranges_min = []
+            for indx, ht_min in [[0, self.traj_constraints.min_begin_ht], [-1, self.traj_constraints.min_end_ht]]:
+
+                ht_diff = ht_min - obs.ele/1000
+                if ht_diff <= 0:
+                    ranges_min.append(0.0)
+                    continue
+
+                sin_elev = np.sin(obs.elev_data[indx])
+                ranges_min.append(-r_earth*sin_elev + np.sqrt((r_earth*sin_elev)**2 + ht_diff**2 \
+                    + 2*r_earth*ht_diff))
+
+            range_min = min(ranges_min)
+
+            # Angle between the first and the last line of sight
+            ang_len = angleBetweenVectors(obs.meas_eci[0], obs.meas_eci[-1])
+
+            # Lower limit of the velocity (km/s)
+            v_min = 2*range_min*np.sin(ang_len/2)/(obs.time_data[-1] - obs.time_data[0])
+
+            if v_min > v_max:
+                print("Angular velocity too high at {:s}: v > {:.1f} km/s".format(str(obs.station_id), v_min))
+                return False
+
+        return True
+
+
+
     def quickTrajectorySolution(self, obs1, obs2):
-        """ Perform an intersecting planes solution and check if it satisfies specified sanity checks. """
+        """ Perform an intersecting planes solution and check if it satisfies specified sanity checks. 
+            Cheap checks which don't need the plane intersection are run first, see pair_filters.
+        """
+
+        # Run the checks which don't need the plane intersection
+        if self.pair_filters.check(obs1, obs2) is not None:
+            return None
 
         # Do the plane intersection solution
         plane_intersection = PlaneIntersection(obs1, obs2)
@@ -435,6 +934,7 @@ class TrajectoryCorrelator(object):
         # Check the end height is lower than begin height
         if (ht1_end > ht1_beg) or (ht2_end > ht2_beg):
             print("Begin height lower than the end height!")
+            self.pair_filters.reject("heights")
             return None
 
         # Check if begin height are within the specified range
@@ -451,6 +951,7 @@ class TrajectoryCorrelator(object):
             print("H1_beg: {:.2f}, H1_end: {:.2f}".format(ht1_beg, ht1_end))
             print("H2_beg: {:.2f}, H2_end: {:.2f}".format(ht2_beg, ht2_end))
 
+            self.pair_filters.reject("heights")
             return None
 
         ### ###
@@ -468,6 +969,7 @@ class TrajectoryCorrelator(object):
         if percent_diff > self.traj_constraints.max_vel_percent_diff:
 
             print("Velocity difference too high: {:.2f} vs {:.2f} km/s".format(vel1/1000, vel2/1000))
+            self.pair_filters.reject("velocity difference")
             return None
 
 
@@ -477,16 +979,162 @@ class TrajectoryCorrelator(object):
             
             print("Average veocity outside velocity bounds: {:.1f} < {:.1f} < {:.1f}".format(self.traj_constraints.v_avg_min, \
                 v_avg, self.traj_constraints.v_avg_max))
+            self.pair_filters.reject("velocity range")
             return None
 
 
 
         ### ###
 
+        self.pair_filters.accept()
+
         return plane_intersection
 
 
 
+    def mergeCandidates(self, candidate_trajectories):
+        """ Merge candidate trajectories which share the same observations, are close in time and have 
+            similar radiants. Mean times and mean radiants of all candidates are computed at once, pairs of 
+            candidates sharing an observation are found through an observation index, and merge groups are
+            formed as connected components of the pairs (union-find).
+
+        Arguments:
+            candidate_trajectories: [list] A list of candidates, where every candidate is a list of 
+                (obs, met_obs, plane_intersection) entries.
+
+        Return:
+            [list] A list of merged candidates, ordered by the first candidate in every group.
+        """
+
+        cand_num = len(candidate_trajectories)
+
+        if cand_num < 2:
+            return candidate_trajectories
+
+
+        ### Compute mean times and radiants of all candidates ###
+
+        # Mean times relative to the first candidate (s)
+        dt_ref = candidate_trajectories[0][0][1].mean_dt
+        mean_times = np.array([(cand[0][1].mean_dt - dt_ref).total_seconds() \
+            for cand in candidate_trajectories])
+
+        # Plane intersection radiants of all entries and indices of their candidates
+        cand_indices = np.concatenate([np.full(len(cand), i) for i, cand in enumerate(candidate_trajectories)])
+        radiants = np.array([entry[2].radiant_eq for cand in candidate_trajectories for entry in cand])
+        entry_counts = np.bincount(cand_indices, minlength=cand_num)
+
+        # Circular mean of RAs and arithmetic mean of declinations (as in meanAngle)
+        ra_means = np.arctan2(np.bincount(cand_indices, weights=np.sin(radiants[:, 0]), minlength=cand_num), \
+            np.bincount(cand_indices, weights=np.cos(radiants[:, 0]), minlength=cand_num))
+        dec_means = np.bincount(cand_indices, weights=radiants[:, 1], minlength=cand_num)/entry_counts
+
+        ### ###
+
+
+        ### Find pairs of candidates which share an observation ###
+
+        obs_candidates = {}
+        for i, cand in enumerate(candidate_trajectories):
+            for entry in cand:
+                obs_candidates.setdefault(id(entry[1]), []).append(i)
+
+        pairs = set()
+        for cand_list in obs_candidates.values():
+            cand_list = sorted(set(cand_list))
+            for k, i in enumerate(cand_list):
+                for j in cand_list[(k + 1):]:
+                    pairs.add((i, j))
+
+        if not pairs:
+            return candidate_trajectories
+
+        pairs = np.array(sorted(pairs))
+        pair_i, pair_j = pairs[:, 0], pairs[:, 1]
+
+        # Keep only pairs within the time window and with close radiants
+        time_mask = np.abs(mean_times[pair_j] - mean_times[pair_i]) <= self.traj_constraints.max_toffset
+        radiant_angle = np.degrees(angleBetweenSphericalCoords(dec_means[pair_i], ra_means[pair_i], \
+            dec_means[pair_j], ra_means[pair_j]))
+        radiant_mask = ~(radiant_angle > self.traj_constraints.max_merge_radiant_angle)
+
+        pairs = pairs[time_mask & radiant_mask]
+
+        ### ###
+
+
+        ### Group candidates using union-find ###
+
+        parent = np.arange(cand_num)
+
+        def _findRoot(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j in pairs:
+            root_i, root_j = _findRoot(i), _findRoot(j)
+
+            # The earlier candidate is always the root
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        groups = {}
+        for i in range(cand_num):
+            groups.setdefault(_findRoot(i), []).append(i)
+
+        ### ###
+
+
+        # Merge candidates in every group into the earliest one
+        merged_candidate_trajectories = []
+        for root in sorted(groups):
+
+            traj_cand_ref = candidate_trajectories[root]
+            obs_list_ref = [entry[1] for entry in traj_cand_ref]
+            ref_stations = [obs.station_code for obs in obs_list_ref]
+
+            merged_candidate = list(traj_cand_ref)
+            found_first_pair = False
+
+            for i in groups[root][1:]:
+
+                # Add observations that weren't present in the reference candidate
+                for entry in candidate_trajectories[i]:
+
+                    # Make sure the added observation is not from a station that's already added
+                    if entry[1].station_code in ref_stations:
+                        continue
+
+                    if any(entry[1] is merged_entry[1] for merged_entry in merged_candidate):
+                        continue
+
+                    # Print the reference and the merged radiants
+                    if not found_first_pair:
+                        print("")
+                        print("------")
+                        print("Reference time:", traj_cand_ref[0][1].mean_dt)
+                        print("Reference stations: {:s}".format(", ".join(sorted(ref_stations))))
+                        print("Reference radiant: RA = {:.2f}, Dec = {:.2f}".format(np.degrees(ra_means[root]), \
+                            np.degrees(dec_means[root])))
+                        print("")
+                        found_first_pair = True
+
+                    print("Merging:", entry[1].mean_dt, entry[1].station_code)
+                    merged_candidate.append(entry)
+
+                    print("Merged radiant:    RA = {:.2f}, Dec = {:.2f}".format(np.degrees(ra_means[i]), \
+                        np.degrees(dec_means[i])))
+
+
+            merged_candidate_trajectories.append(merged_candidate)
+
+
+        return merged_candidate_trajectories
+
+
+
     def initTrajectory(self, jdt_ref, mc_runs):
         """ Initialize the Trajectory solver.
         
@@ -784,12 +1432,104 @@ class TrajectoryCorrelator(object):
 
 
 
-    def run(self, event_time_range=None):
+    def saveCandidateSolution(self, successful_traj_fit, traj, matched_observations):
+        """ Save the solved candidate trajectory and mark its observations as paired.
+
+        Arguments:
+            successful_traj_fit: [bool] True if the trajectory was successfully solved.
+            traj: [Trajectory] Solved trajectory.
+            matched_observations: [list] A list of (obs_temp, met_obs, _) entries of the candidate.
+        """
+
+        if successful_traj_fit:
+            self.dh.saveTrajectoryResults(traj, self.traj_constraints.save_plots)
+            self.dh.addTrajectory(traj)
+
+            # Mark observations as paired in a trajectory if fit successful
+            for _, met_obs_temp, _ in matched_observations:
+                self.dh.markObservationAsPaired(met_obs_temp)
+
+
+
+    def solveCandidates(self, candidate_list):
+        """ Solve candidate trajectories in parallel, in traj_constraints.solver_cores processes. Workers 
+            don't touch the data handle, all results and database updates are applied in the main process
+            in the order of candidates.
+
+        Arguments:
+            candidate_list: [list] A list of (matched_observations, traj, mc_runs) entries, where traj is
+                an initialized Trajectory object.
+        """
+
+        if not candidate_list:
+            return
+
+        print()
+        print("Solving {:d} trajectories in {:d} processes...".format(len(candidate_list), \
+            self.traj_constraints.solver_cores))
+
+        input_list = [[self.traj_constraints, self.v_init_part, self.data_in_j2000, traj, mc_runs] \
+            for _, traj, mc_runs in candidate_list]
+
+        pool = multiprocessing.Pool(processes=self.traj_constraints.solver_cores, \
+            initializer=initSolverProcess)
+
+        try:
+
+            # imap returns the results in the order of inputs
+            for (matched_observations, _, _), (successful_traj_fit, traj, deferred_dh) \
+                in zip(candidate_list, pool.imap(_solveCandidateWorker, input_list, chunksize=1)):
+
+                # Apply the database updates done while solving (e.g. adding failed trajectories)
+                deferred_dh.replay(self.dh)
+
+                self.saveCandidateSolution(successful_traj_fit, traj, matched_observations)
+
+        finally:
+            pool.close()
+            pool.join()
+
+
+
+    def inOwnerTimeRange(self, dt, owner_time_range):
+        """ Check if the given time is inside the range of times owned by this correlator, see run.
+
+        Arguments:
+            dt: [datetime] Time to check.
+            owner_time_range: [list] (beg, end) datetimes or None. The beginning is inclusive and the end
+                is exclusive, and either one can be None for an open range.
+
+        Return:
+            [bool]
+        """
+
+        if owner_time_range is None:
+            return True
+
+        owner_beg, owner_end = owner_time_range
+
+        if (owner_beg is not None) and (dt < owner_beg):
+            return False
+
+        if (owner_end is not None) and (dt >= owner_end):
+            return False
+
+        return True
+
+
+
+    def run(self, event_time_range=None, owner_time_range=None):
         """ Run meteor corellation using available data. 
 
         Keyword arguments:
             event_time_range: [list] A list of two datetime objects. These are times between which
                 events should be used. None by default, which uses all available events.
+            owner_time_range: [list] A list of two datetime objects (either can be None for an open range).
+                If given, only trajectories which begin within this range are computed or updated, while 
+                observations outside of it can still be paired with them. Observations matching existing 
+                trajectories outside of the range are not used for new trajectories. This is used when 
+                neighbouring time ranges with overlapping data are correlated in parallel, so every trajectory
+                is computed only once. None by default, in which case all trajectories are computed.
         """
 
         # Get unpaired observations, filter out observations with too little points and sort them by time
@@ -811,8 +1551,7 @@ class TrajectoryCorrelator(object):
             met_obs.reference_dt = met_obs.reference_dt + datetime.timedelta(seconds=t_zero)
 
             # Normalize all observation times so that the first time is t = 0 s
-            for i in range(len(met_obs.data)):
-                met_obs.data[i].time_rel -= t_zero
+            met_obs.data.time_rel -= t_zero
 
 
         
@@ -874,6 +1613,12 @@ class TrajectoryCorrelator(object):
             # Find all unpaired observations that match already existing trajectories
             for traj_reduced in computed_traj_list:
 
+                # Only trajectories in the owned range of times are updated. Trajectories outside it are 
+                #   updated when the neighbouring range is correlated, but the observations matching them are
+                #   still withheld here, so they are not paired into a duplicate trajectory
+                traj_owned = self.inOwnerTimeRange(jd2Date(traj_reduced.jdt_ref, dt_obj=True), \
+                    owner_time_range)
+
                 # Get all unprocessed observations which are close in time to the reference trajectory
                 traj_time_pairs = self.dh.getTrajTimePairs(traj_reduced, unpaired_observations, \
                     self.traj_constraints.max_toffset)
@@ -960,6 +1705,18 @@ class TrajectoryCorrelator(object):
                     continue
 
 
+                # If the trajectory is owned by the neighbouring range, only remove the matching observations
+                #   from the processing list
+                if candidate_observations and (not traj_owned):
+
+                    print("The trajectory is updated in the neighbouring time range, skipping observations...")
+
+                    for met_obs_temp, _ in candidate_observations:
+                        unpaired_observations.remove(met_obs_temp)
+
+                    continue
+
+
                 # If there are any good new observations, add them to the trajectory and re-run the solution
                 if candidate_observations:
 
@@ -1040,14 +1797,8 @@ class TrajectoryCorrelator(object):
                     # Get candidate station platepar
                     candidate_platepar = self.dh.getPlatepar(met_pair_candidate)
 
-                    # Check if the stations are within range
-                    if not self.stationRangeCheck(reference_platepar, candidate_platepar):
-                        continue
-
-                    # Check the FOV overlap
-                    if not self.checkFOVOverlap(reference_platepar, candidate_platepar):
-                        print("Station FOV does not overlap: {:s} and {:s}".format(met_obs.station_code, \
-                            met_pair_candidate.station_code))
+                    # Check if the stations are within range and the FOVs overlap
+                    if not self.stationPairCheck(reference_platepar, candidate_platepar):
                         continue
 
                     ### ###
@@ -1109,128 +1860,13 @@ class TrajectoryCorrelator(object):
             print("---------------------------")
             print("MERGING BROKEN OBSERVATIONS")
             print("---------------------------")
-            merged_candidate_trajectories = []
-            merged_indices = []
-            for i, traj_cand_ref in enumerate(candidate_trajectories):
-
-                # Skip candidate trajectories that have already been merged
-                if i in merged_indices:
-                    continue
-
-                
-                # Stop the search if the end has been reached
-                if (i + 1) == len(candidate_trajectories):
-                    merged_candidate_trajectories.append(traj_cand_ref)
-                    break
-
-
-                # Get the mean time of the reference observation
-                ref_mean_dt = traj_cand_ref[0][1].mean_dt
-
-                obs_list_ref = [entry[1] for entry in traj_cand_ref]
-                merged_candidate = []
-
-                # Compute the mean radiant of the reference solution
-                plane_radiants_ref = [entry[2].radiant_eq for entry in traj_cand_ref]
-                ra_mean_ref = meanAngle([ra for ra, _ in plane_radiants_ref])
-                dec_mean_ref = np.mean([dec for _, dec in plane_radiants_ref])
-
-
-                # Check for pairs
-                found_first_pair = False
-                for j, traj_cand_test in enumerate(candidate_trajectories[(i + 1):]):
-
-                    # Skip same observations
-                    if traj_cand_ref[0] == traj_cand_test[0]:
-                        continue
+            candidate_trajectories = self.mergeCandidates(candidate_trajectories)
 
-
-                    # Get the mean time of the test observation
-                    test_mean_dt = traj_cand_test[0][1].mean_dt
-
-                    # Make sure the observations that are being compared are within the time window
-                    time_diff = (test_mean_dt - ref_mean_dt).total_seconds()
-                    if abs(time_diff) > self.traj_constraints.max_toffset:
-                        continue
-
-
-                    # Break the search if the time went beyond the search. This can be done as observations 
-                    #   are ordered in time
-                    if time_diff > self.traj_constraints.max_toffset:
-                        break
-
-
-
-                    # Create a list of observations
-                    obs_list_test = [entry[1] for entry in traj_cand_test]
-
-                    # Check if there any any common observations between candidate trajectories and merge them
-                    #   if that is the case
-                    found_match = False
-                    for obs1 in obs_list_ref:
-                        if obs1 in obs_list_test:
-                            found_match = True
-                            break
-
-
-                    # Compute the mean radiant of the reference solution
-                    plane_radiants_test = [entry[2].radiant_eq for entry in traj_cand_test]
-                    ra_mean_test = meanAngle([ra for ra, _ in plane_radiants_test])
-                    dec_mean_test = np.mean([dec for _, dec in plane_radiants_test])
-
-                    # Skip the mergning attempt if the estimated radiants are too far off
-                    if np.degrees(angleBetweenSphericalCoords(dec_mean_ref, ra_mean_ref, dec_mean_test, \
-                        ra_mean_test)) > self.traj_constraints.max_merge_radiant_angle:
-
-                        continue
-
-
-                    # Add the candidate trajectory to the common list if a match has been found
-                    if found_match:
-
-                        ref_stations = [obs.station_code for obs in obs_list_ref]
-
-                        # Add observations that weren't present in the reference candidate
-                        for entry in traj_cand_test:
-
-                            # Make sure the added observation is not from a station that's already added
-                            if entry[1].station_code in ref_stations:
-                                continue
-
-                            if entry[1] not in obs_list_ref:
-
-                                # Print the reference and the merged radiants
-                                if not found_first_pair:
-                                    print("")
-                                    print("------")
-                                    print("Reference time:", ref_mean_dt)
-                                    print("Reference stations: {:s}".format(", ".join(sorted(ref_stations))))
-                                    print("Reference radiant: RA = {:.2f}, Dec = {:.2f}".format(np.degrees(ra_mean_ref), np.degrees(dec_mean_ref)))
-                                    print("")
-                                    found_first_pair = True
-
-                                print("Merging:", entry[1].mean_dt, entry[1].station_code)
-                                traj_cand_ref.append(entry)
-
-                                print("Merged radiant:    RA = {:.2f}, Dec = {:.2f}".format(np.degrees(ra_mean_test), np.degrees(dec_mean_test)))
-
-                                
-
-
-                        # Mark that the current index has been processed
-                        merged_indices.append(i + j + 1)
-
-
-                # Add the reference candidate observations to the list
-                merged_candidate += traj_cand_ref
-
-
-                # Add the merged observation to the final list
-                merged_candidate_trajectories.append(merged_candidate)
-
-
-
-            candidate_trajectories = merged_candidate_trajectories
+            # Only keep candidates which begin in the owned range of times, others will be computed when
+            #   the neighbouring range is correlated
+            candidate_trajectories = [matched_observations for matched_observations in candidate_trajectories \
+                if self.inOwnerTimeRange(min([met_obs.reference_dt for _, met_obs, _ in matched_observations]), \
+                    owner_time_range)]
 
             ### ###
 
@@ -1243,6 +1879,9 @@ class TrajectoryCorrelator(object):
             print("-----------------------")
             print()
 
+            # Candidates which will be solved in parallel
+            parallel_candidates = []
+
             # Go through all candidate trajectories and compute the complete trajectory solution
             for matched_observations in candidate_trajectories:
 
@@ -1332,13 +1971,20 @@ class TrajectoryCorrelator(object):
 
                 ### ADJUST THE NUMBER OF MC RUNS FOR OPTIMAL USE OF CPU CORES ###
 
+                # Candidates solved in parallel workers run their MC solutions on a single core, so the 
+                #   number of MC runs is not adjusted to the number of MC cores
+                if self.traj_constraints.solver_cores > 1:
+                    mc_cores = 1
+                else:
+                    mc_cores = self.traj_constraints.mc_cores
+
                 # Make sure that the number of MC runs is larger or equal to the number of processor cores
-                if mc_runs < self.traj_constraints.mc_cores:
-                    mc_runs = int(self.traj_constraints.mc_cores)
+                if mc_runs < mc_cores:
+                    mc_runs = int(mc_cores)
 
                 # If the number of MC runs is not a multiple of CPU cores, increase it until it is
                 #   This will increase the number of MC runs while keeping the processing time the same
-                mc_runs = int(np.ceil(mc_runs/self.traj_constraints.mc_cores)*self.traj_constraints.mc_cores)
+                mc_runs = int(np.ceil(mc_runs/mc_cores)*mc_cores)
 
                 ### ###
 
@@ -1366,24 +2012,31 @@ class TrajectoryCorrelator(object):
                     continue
 
 
+                # Solve the candidate later in a worker process if running in parallel
+                if self.traj_constraints.solver_cores > 1:
+                    parallel_candidates.append([matched_observations, traj, mc_runs])
+                    continue
+
+
                 # Solve the trajectory
                 successful_traj_fit, traj = self.solveTrajectory(traj, mc_runs)
 
                 # Save the trajectory if successful
-                if successful_traj_fit:
-                    self.dh.saveTrajectoryResults(traj, self.traj_constraints.save_plots)
-                    self.dh.addTrajectory(traj)
+                self.saveCandidateSolution(successful_traj_fit, traj, matched_observations)
 
-                    # Mark observations as paired in a trajectory if fit successful
-                    for _, met_obs_temp, _ in matched_observations:
-                        self.dh.markObservationAsPaired(met_obs_temp)
 
-                
+            # Solve the candidates in parallel
+            self.solveCandidates(parallel_candidates)
+
 
 
             # Finish the correlation run (update the database with new values)
             self.dh.finish()
 
+            print()
+            print("Candidate pair filters:")
+            print(self.pair_filters.summary())
+
             print()
             print("-----------------")
             print("SOLVING RUN DONE!")
@@ -10,17 +10,21 @@ import re
 import argparse
 import json
 import copy
+import multiprocessing
 import datetime
 import shutil
+import sqlite3
 import time
 
 import numpy as np
 
 from wmpl.Formats.CAMS import loadFTPDetectInfo
-from wmpl.Trajectory.CorrelateEngine import TrajectoryCorrelator, TrajectoryConstraints
+from wmpl.Trajectory.CorrelateEngine import TrajectoryCorrelator, TrajectoryConstraints, StationPairGraph, \
+    initSolverProcess
 from wmpl.Utils.Math import generateDatetimeBins
+from wmpl.Utils.OSTools import mkdirP
 from wmpl.Utils.Pickling import loadPickle, savePickle
-from wmpl.Utils.TrajConversions import jd2Date
+from wmpl.Utils.TrajConversions import datetime2JD, jd2Date
 
 
 
@@ -32,6 +36,25 @@ OUTPUT_TRAJ_DIR = "trajectories"
 # Name of json file with the list of processed directories
 JSON_DB_NAME = "processed_trajectories.json"
 
+# Name of the SQLite database file, used instead of the JSON file if enabled
+SQLITE_DB_NAME = "processed_trajectories.sqlite"
+
+# Time to wait for a lock on the SQLite database (s)
+SQLITE_TIMEOUT = 120
+
+# Maximum duration of a night folder, used to find folders which may contain observations in a time bin
+#   (days)
+NIGHT_FOLDER_MAX_DAYS = 1.0
+
+# Name of the directory with cached parsed observations of night folders
+OBS_CACHE_DIR = "observations_cache"
+
+# Version of the observations cache format, increment when the cached data changes
+OBS_CACHE_VERSION = 1
+
+# Name of the file with the cached compatibility of station pairs
+STATION_PAIR_GRAPH_NAME = "station_pair_graph.json"
+
 # Auto run frequency (hours)
 AUTO_RUN_FREQUENCY = 6
 
@@ -138,6 +161,10 @@ class DatabaseJSON(object):
         #   TrajectoryReduced objects)
         self.failed_trajectories = {}
 
+        # Modification times and sizes of loaded trajectory pickle files (keys are file paths, values are
+        #   [mtime, size, jdt_ref]), used to load only new or changed pickles on startup
+        self.traj_file_stats = {}
+
         # Load the database from a JSON file
         self.load()
 
@@ -161,6 +188,10 @@ class DatabaseJSON(object):
                     # Set the trajectory dictionary
                     setattr(self, traj_dict_str, trajectories_obj_dict)
 
+                # Databases created by older versions don't have the file stats
+                if not hasattr(self, "traj_file_stats"):
+                    self.traj_file_stats = {}
+
 
     def save(self):
         """ Save the database of processed meteors to disk. """
@@ -176,6 +207,13 @@ class DatabaseJSON(object):
             f.write(json.dumps(self2, default=lambda o: o.__dict__, indent=4, sort_keys=True))
 
 
+    def addStation(self, station_name):
+        """ Add the station to the list of processed directories. """
+
+        if station_name not in self.processed_dirs:
+            self.processed_dirs[station_name] = []
+
+
     def addProcessedDir(self, station_name, rel_proc_path):
         """ Add the processed directory to the list. """
 
@@ -272,6 +310,82 @@ class DatabaseJSON(object):
 
 
 
+    def getTrajectories(self, jd_beg, jd_end):
+        """ Return a list of computed trajectories between the Julian dates. """
+
+        return [self.trajectories[key] for key in self.trajectories \
+            if (self.trajectories[key].jdt_ref >= jd_beg) \
+                and (self.trajectories[key].jdt_ref <= jd_end)]
+
+
+    def getTrajFilePaths(self):
+        """ Return a dictionary of trajectory pickle file paths and reference Julian dates of computed 
+            trajectories.
+        """
+
+        return {traj_reduced.traj_file_path: traj_reduced.jdt_ref \
+            for traj_reduced in self.trajectories.values()}
+
+
+    def getTrajFileStats(self):
+        """ Return a dictionary of stored trajectory file stats, see setTrajFileStats. """
+
+        return dict(self.traj_file_stats)
+
+
+    def setTrajFileStats(self, traj_file_path, jdt_ref):
+        """ Store the modification time and size of the trajectory pickle file.
+
+        Arguments:
+            traj_file_path: [str] Full path the trajectory pickle file.
+            jdt_ref: [float] Reference Julian date of the trajectory.
+        """
+
+        file_stat = os.stat(traj_file_path)
+
+        self.traj_file_stats[traj_file_path] = [file_stat.st_mtime, file_stat.st_size, jdt_ref]
+
+
+    def checkTrajFileChanged(self, traj_file_path):
+        """ Check if the trajectory pickle file is new or has changed since it was added to the database.
+
+        Arguments:
+            traj_file_path: [str] Full path the trajectory pickle file.
+
+        Return:
+            [bool] True if the file is not in the database or its modification time or size have changed.
+        """
+
+        if traj_file_path not in self.traj_file_stats:
+            return True
+
+        mtime, size, _ = self.traj_file_stats[traj_file_path]
+
+        file_stat = os.stat(traj_file_path)
+
+        return (file_stat.st_mtime != mtime) or (file_stat.st_size != size)
+
+
+
+    def removeTrajFileStats(self, traj_file_path):
+        """ Remove the stored stats of the trajectory pickle file. """
+
+        if traj_file_path in self.traj_file_stats:
+            del self.traj_file_stats[traj_file_path]
+
+
+    def removeTrajectoryEntry(self, jdt_ref, traj_file_path):
+        """ Remove the database entry of the computed trajectory with the given reference Julian date, but
+            only if it was loaded from the given file. The file on the disk is kept.
+        """
+
+        if (jdt_ref in self.trajectories) and (self.trajectories[jdt_ref].traj_file_path == traj_file_path):
+            del self.trajectories[jdt_ref]
+
+        self.removeTrajFileStats(traj_file_path)
+
+
+
     def removeTrajectory(self, traj_reduced):
         """ Remove the trajectory from the data base and disk. """
 
@@ -279,6 +393,301 @@ class DatabaseJSON(object):
         if traj_reduced.jdt_ref in self.trajectories:
             del self.trajectories[traj_reduced.jdt_ref]
 
+        self.removeTrajFileStats(traj_reduced.traj_file_path)
+
+        # Remove the trajectory folder on the disk
+        if os.path.isfile(traj_reduced.traj_file_path):
+
+            traj_dir = os.path.dirname(traj_reduced.traj_file_path)
+            shutil.rmtree(traj_dir)
+
+
+
+
+
+
+class DatabaseSQLite(object):
+    def __init__(self, db_file_path):
+        """ Database of processed directories, paired observations and computed trajectories stored in an
+            SQLite file. It has the same interface as DatabaseJSON, but every change is written as a separate
+            transaction and lookups are done using table indices, so the whole database is never loaded into
+            memory or rewritten.
+
+        Arguments:
+            db_file_path: [str] Path to the SQLite database file.
+        """
+
+        self.db_file_path = db_file_path
+
+        self.conn = None
+
+        # Open the database and create tables
+        self.load()
+
+
+    def load(self):
+        """ Open the database and create the tables if they don't exist. """
+
+        # Wait for locks held by other processes (e.g. when time bins are correlated in parallel)
+        self.conn = sqlite3.connect(self.db_file_path, timeout=SQLITE_TIMEOUT)
+
+        with self.conn:
+
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS processed_dirs (
+                station_code TEXT NOT NULL, 
+                rel_proc_path TEXT NOT NULL, 
+                PRIMARY KEY (station_code, rel_proc_path))""")
+
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS paired_obs (
+                station_code TEXT NOT NULL, 
+                obs_id TEXT NOT NULL, 
+                PRIMARY KEY (station_code, obs_id))""")
+
+            # Trajectories are stored as JSON representations of TrajectoryReduced objects
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS trajectories (
+                jdt_ref REAL NOT NULL, 
+                failed INTEGER NOT NULL, 
+                traj_file_path TEXT, 
+                traj_json TEXT NOT NULL, 
+                PRIMARY KEY (failed, jdt_ref))""")
+
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS traj_file_stats (
+                traj_file_path TEXT PRIMARY KEY, 
+                mtime REAL NOT NULL, 
+                size INTEGER NOT NULL, 
+                jdt_ref REAL NOT NULL)""")
+
+            # Time index of trajectories
+            self.conn.execute("CREATE INDEX IF NOT EXISTS trajectories_time ON trajectories (jdt_ref)")
+
+
+    def save(self):
+        """ Commit all changes to disk. Changes are already committed after every update, so this is only 
+            kept for compatibility with DatabaseJSON. 
+        """
+
+        self.conn.commit()
+
+
+    def close(self):
+        """ Close the database. """
+
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+    def importJSON(self, db_json):
+        """ Import all entries from a JSON database.
+
+        Arguments:
+            db_json: [DatabaseJSON] Database which will be imported.
+        """
+
+        with self.conn:
+
+            for station_name in db_json.processed_dirs:
+                self.conn.executemany("INSERT OR IGNORE INTO processed_dirs VALUES (?, ?)", \
+                    [(station_name, rel_proc_path) for rel_proc_path in db_json.processed_dirs[station_name]])
+
+            for station_code in db_json.paired_obs:
+                self.conn.executemany("INSERT OR IGNORE INTO paired_obs VALUES (?, ?)", \
+                    [(station_code, obs_id) for obs_id in db_json.paired_obs[station_code]])
+
+            for failed, traj_dict in [[0, db_json.trajectories], [1, db_json.failed_trajectories]]:
+                self.conn.executemany("INSERT OR IGNORE INTO trajectories VALUES (?, ?, ?, ?)", \
+                    [self._trajectoryRow(traj_reduced, failed) for traj_reduced in traj_dict.values()])
+
+            self.conn.executemany("INSERT OR REPLACE INTO traj_file_stats VALUES (?, ?, ?, ?)", \
+                [[traj_file_path] + list(stats) for traj_file_path, stats \
+                    in db_json.traj_file_stats.items()])
+
+
+    def _trajectoryRow(self, traj_reduced, failed):
+        """ Convert the reduced trajectory to a row of the trajectories table. """
+
+        return (traj_reduced.jdt_ref, int(failed), getattr(traj_reduced, "traj_file_path", None), \
+            json.dumps(traj_reduced.__dict__))
+
+
+    def _loadTrajectories(self, query, params):
+        """ Run the query on the trajectories table and return a list of TrajectoryReduced objects. """
+
+        return [TrajectoryReduced(None, json_dict=json.loads(traj_json)) for (traj_json,) \
+            in self.conn.execute(query, params)]
+
+
+    def addStation(self, station_name):
+        """ Add the station to the list of processed directories. Stations are not stored separately, so 
+            nothing has to be done.
+        """
+
+        pass
+
+
+    def addProcessedDir(self, station_name, rel_proc_path):
+        """ Add the processed directory to the list. """
+
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO processed_dirs VALUES (?, ?)", \
+                (station_name, rel_proc_path))
+
+
+    def addPairedObservation(self, met_obs):
+        """ Mark the given meteor observation as paired in a trajectory. """
+
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO paired_obs VALUES (?, ?)", \
+                (met_obs.station_code, met_obs.id))
+
+
+    def checkObsIfPaired(self, met_obs):
+        """ Check if the given observation has been paired to a trajectory or not. """
+
+        cur = self.conn.execute("SELECT 1 FROM paired_obs WHERE station_code = ? AND obs_id = ?", \
+            (met_obs.station_code, met_obs.id))
+
+        return cur.fetchone() is not None
+
+
+    def checkTrajIfFailed(self, traj):
+        """ Check if the given trajectory has been computed with the same observations and has failed to be
+            computed before.
+
+        """
+
+        failed_list = self._loadTrajectories("SELECT traj_json FROM trajectories WHERE failed = 1 " \
+            "AND jdt_ref = ?", (traj.jdt_ref,))
+
+        if not failed_list:
+            return False
+
+        failed_traj = failed_list[0]
+
+        # Check if the same observations participate in the failed trajectory as in the trajectory that
+        #   is being tested
+        for obs in traj.observations:
+            if not ((obs.station_id in failed_traj.participating_stations) \
+                or (obs.station_id in failed_traj.ignored_stations)):
+
+                return False
+
+        return True
+
+
+    def addTrajectory(self, traj_file_path, traj_obj=None, failed=False):
+        """ Add a computed trajectory to the list. 
+    
+        Arguments:
+            traj_file_path: [str] Full path the trajectory object.
+
+        Keyword arguments:
+            traj_obj: [bool] Instead of loading a traj object from disk, use the given object.
+            failed: [bool] Add as a failed trajectory. False by default.
+        """
+
+        # Load the trajectory from disk
+        if traj_obj is None:
+            traj_reduced = TrajectoryReduced(traj_file_path)
+
+        else:
+            traj_reduced = traj_obj
+
+        # Add the trajectory only if there's no trajectory with the same reference JD
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO trajectories VALUES (?, ?, ?, ?)", \
+                self._trajectoryRow(traj_reduced, failed))
+
+
+    def getTrajectories(self, jd_beg, jd_end):
+        """ Return a list of computed trajectories between the Julian dates. """
+
+        return self._loadTrajectories("SELECT traj_json FROM trajectories WHERE failed = 0 " \
+            "AND jdt_ref >= ? AND jdt_ref <= ? ORDER BY jdt_ref", (jd_beg, jd_end))
+
+
+    def getTrajFilePaths(self):
+        """ Return a dictionary of trajectory pickle file paths and reference Julian dates of computed 
+            trajectories.
+        """
+
+        return {traj_file_path: jdt_ref for traj_file_path, jdt_ref \
+            in self.conn.execute("SELECT traj_file_path, jdt_ref FROM trajectories WHERE failed = 0")}
+
+
+    def getTrajFileStats(self):
+        """ Return a dictionary of stored trajectory file stats, see setTrajFileStats. """
+
+        return {traj_file_path: [mtime, size, jdt_ref] for traj_file_path, mtime, size, jdt_ref \
+            in self.conn.execute("SELECT * FROM traj_file_stats")}
+
+
+    def setTrajFileStats(self, traj_file_path, jdt_ref):
+        """ Store the modification time and size of the trajectory pickle file.
+
+        Arguments:
+            traj_file_path: [str] Full path the trajectory pickle file.
+            jdt_ref: [float] Reference Julian date of the trajectory.
+        """
+
+        file_stat = os.stat(traj_file_path)
+
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO traj_file_stats VALUES (?, ?, ?, ?)", \
+                (traj_file_path, file_stat.st_mtime, file_stat.st_size, jdt_ref))
+
+
+    def checkTrajFileChanged(self, traj_file_path):
+        """ Check if the trajectory pickle file is new or has changed since it was added to the database.
+
+        Arguments:
+            traj_file_path: [str] Full path the trajectory pickle file.
+
+        Return:
+            [bool] True if the file is not in the database or its modification time or size have changed.
+        """
+
+        row = self.conn.execute("SELECT mtime, size FROM traj_file_stats WHERE traj_file_path = ?", \
+            (traj_file_path,)).fetchone()
+
+        if row is None:
+            return True
+
+        mtime, size = row
+
+        file_stat = os.stat(traj_file_path)
+
+        return (file_stat.st_mtime != mtime) or (file_stat.st_size != size)
+
+
+    def removeTrajFileStats(self, traj_file_path):
+        """ Remove the stored stats of the trajectory pickle file. """
+
+        with self.conn:
+            self.conn.execute("DELETE FROM traj_file_stats WHERE traj_file_path = ?", (traj_file_path,))
+
+
+    def removeTrajectoryEntry(self, jdt_ref, traj_file_path):
+        """ Remove the database entry of the computed trajectory with the given reference Julian date, but
+            only if it was loaded from the given file. The file on the disk is kept.
+        """
+
+        with self.conn:
+            self.conn.execute("DELETE FROM trajectories WHERE failed = 0 AND jdt_ref = ? " \
+                "AND traj_file_path = ?", (jdt_ref, traj_file_path))
+            self.conn.execute("DELETE FROM traj_file_stats WHERE traj_file_path = ?", (traj_file_path,))
+
+
+    def removeTrajectory(self, traj_reduced):
+        """ Remove the trajectory from the data base and disk. """
+
+        # Remove the trajectory data base entry
+        with self.conn:
+            self.conn.execute("DELETE FROM trajectories WHERE failed = 0 AND jdt_ref = ?", \
+                (traj_reduced.jdt_ref,))
+            self.conn.execute("DELETE FROM traj_file_stats WHERE traj_file_path = ?", \
+                (traj_reduced.traj_file_path,))
+
         # Remove the trajectory folder on the disk
         if os.path.isfile(traj_reduced.traj_file_path):
 
@@ -318,16 +727,37 @@ class MeteorPointRMS(object):
 
 
 
+# Fields of meteor picks stored in MeteorObsRMS.data
+METEOR_POINT_DTYPE = np.dtype([("frame", np.float64), ("time_rel", np.float64), ("x", np.float64), \
+    ("y", np.float64), ("ra", np.float64), ("dec", np.float64), ("azim", np.float64), ("alt", np.float64), \
+    ("mag", np.float64)])
+
+
 class MeteorObsRMS(object):
     def __init__(self, station_code, reference_dt, platepar, data, rel_proc_path):
         """ Container for meteor observations with the interface compatible with the trajectory correlator
             interface. 
+
+        Arguments:
+            station_code: [str] Station code.
+            reference_dt: [datetime] Reference time of the observation.
+            platepar: [PlateparDummy] Platepar of the observation.
+            data: [ndarray or list] A record array of meteor picks with METEOR_POINT_DTYPE fields, or a 
+                list of MeteorPointRMS objects which will be converted to it. Picks can be accessed both 
+                per point (e.g. data[0].x) and per field (e.g. data.x).
+            rel_proc_path: [str] Path to the directory with data, relative to the root data directory.
         """
 
         self.station_code = station_code
 
         self.reference_dt = reference_dt
         self.platepar = platepar
+
+        # Store picks as columns instead of individual objects to save memory
+        if not isinstance(data, np.recarray):
+            data = np.rec.fromrecords([(entry.frame, entry.time_rel, entry.x, entry.y, entry.ra, entry.dec, \
+                entry.azim, entry.alt, entry.mag) for entry in data], dtype=METEOR_POINT_DTYPE)
+
         self.data = data
 
         # Path to the directory with data
@@ -338,8 +768,7 @@ class MeteorObsRMS(object):
         self.processed = False 
 
         # Mean datetime of the observation
-        self.mean_dt = self.reference_dt + datetime.timedelta(seconds=np.mean([entry.time_rel \
-            for entry in self.data]))
+        self.mean_dt = self.reference_dt + datetime.timedelta(seconds=np.mean(self.data.time_rel))
 
         
         ### Estimate if the meteor begins and ends inside the FOV ###
@@ -396,7 +825,7 @@ class MeteorObsRMS(object):
 
         # Generate a unique observation ID, the format is: STATIONID_YYYYMMDD-HHMMSS.us_CHECKSUM
         #  where CHECKSUM is the last four digits of the sum of all observation image X cordinates
-        checksum = int(np.sum([entry.x for entry in self.data])%10000)
+        checksum = int(np.sum(self.data.x)%10000)
         self.id = "{:s}_{:s}_{:04d}".format(self.station_code, self.mean_dt.strftime("%Y%m%d-%H%M%S.%f"), \
             checksum)
 
@@ -410,29 +839,134 @@ class PlateparDummy:
 
 
 
+class ObservationTimeIndex(object):
+    def __init__(self, observations):
+        """ Index of meteor observations sorted by their mean time, used to quickly find all observations
+            within a time window.
+
+        Arguments:
+            observations: [list] A list of MeteorObsRMS objects.
+        """
+
+        self.observations = observations
+
+        # Number of observations in the list when the index was built, used to detect changes of the list
+        self.list_len = len(observations)
+
+        # Use the first observation as the reference time, so the time offsets are small and precise
+        if observations:
+            self.ref_dt = observations[0].mean_dt
+        else:
+            self.ref_dt = datetime.datetime(2000, 1, 1)
+
+        # Sort the mean times of observations (the sort is stable, so the list order is kept for ties)
+        mean_times = np.array([(met_obs.mean_dt - self.ref_dt).total_seconds() for met_obs in observations])
+        self.sort_indices = np.argsort(mean_times, kind='mergesort')
+        self.sorted_times = mean_times[self.sort_indices]
+
+
+    def isValidFor(self, observations):
+        """ Check if the index was built for the given list and the list has not changed in size since. """
+
+        return (observations is self.observations) and (len(observations) == self.list_len)
+
+
+    def query(self, ref_dt, max_toffset):
+        """ Return observations with the mean time within max_toffset seconds from the given time. The 
+            observations are returned in the same order as in the indexed list.
+
+        Arguments:
+            ref_dt: [datetime] Reference time.
+            max_toffset: [float] Maximum time offset in seconds.
+
+        Return:
+            [list] A list of MeteorObsRMS objects.
+        """
+
+        t_ref = (ref_dt - self.ref_dt).total_seconds()
+
+        # Find the window using a small margin, the exact check on datetimes is done below
+        margin = 1e-3
+        i_beg = np.searchsorted(self.sorted_times, t_ref - max_toffset - margin, side='left')
+        i_end = np.searchsorted(self.sorted_times, t_ref + max_toffset + margin, side='right')
+
+        found_obs = []
+        for i in np.sort(self.sort_indices[i_beg:i_end]):
+
+            met_obs = self.observations[i]
+
+            if abs((met_obs.mean_dt - ref_dt).total_seconds()) <= max_toffset:
+                found_obs.append(met_obs)
+
+        return found_obs
+
+
+
 class RMSDataHandle(object):
-    def __init__(self, dir_path):
+    def __init__(self, dir_path, use_sqlite=False, processing_list=None, load_trajectories=True):
         """ Handles data interfacing between the trajectory correlator and RMS data files on disk. 
     
         Arguments:
             dir_path: [str] Path to the directory with data files. 
+
+        Keyword arguments:
+            use_sqlite: [bool] Use the SQLite database instead of the JSON file. If the SQLite database
+                doesn't exist yet, the existing JSON database will be imported. False by default.
+            processing_list: [list] A list of folders to process (see findUnprocessedFolders). None by 
+                default, in which case the station folders will be scanned.
+            load_trajectories: [bool] Load new or changed trajectory pickles into the database. True by
+                default. Set to False if the database was already updated by another data handle (e.g. in
+                workers of parallel time bins).
         """
 
         self.dir_path = dir_path
 
         print("Using directory:", self.dir_path)
 
-        # Load the list of stations
-        station_list = self.loadStations()
-
         # Load database of processed folders
-        self.db = DatabaseJSON(os.path.join(self.dir_path, JSON_DB_NAME))
+        if use_sqlite:
+            self.db = self.loadSQLiteDatabase()
+        else:
+            self.db = DatabaseJSON(os.path.join(self.dir_path, JSON_DB_NAME))
 
         # Find unprocessed meteor files
-        self.processing_list = self.findUnprocessedFolders(station_list)
+        if processing_list is None:
+
+            # Load the list of stations
+            station_list = self.loadStations()
+
+            processing_list = self.findUnprocessedFolders(station_list)
+
+        self.processing_list = processing_list
 
         # Load already computed trajectories
-        self.loadComputedTrajectories(os.path.join(self.dir_path, OUTPUT_TRAJ_DIR))
+        if load_trajectories:
+            self.loadComputedTrajectories(os.path.join(self.dir_path, OUTPUT_TRAJ_DIR))
+
+        # Time index of unpaired observations, built on the first time pairing
+        self.time_index = None
+
+        # Compatibility of station pairs, shared by all time bins and runs
+        #   (loaded when the correlator sets the constraints)
+        self.station_pair_graph = StationPairGraph(os.path.join(self.dir_path, STATION_PAIR_GRAPH_NAME))
+
+
+    def loadSQLiteDatabase(self):
+        """ Open the SQLite database. If it doesn't exist, import the JSON database into it. """
+
+        db_file_path = os.path.join(self.dir_path, SQLITE_DB_NAME)
+        json_db_file_path = os.path.join(self.dir_path, JSON_DB_NAME)
+
+        db_exists = os.path.isfile(db_file_path)
+
+        db = DatabaseSQLite(db_file_path)
+
+        if (not db_exists) and os.path.isfile(json_db_file_path):
+            print("Importing the JSON database into:", db_file_path)
+            db.importJSON(DatabaseJSON(json_db_file_path))
+
+        return db
+
 
 
     def loadStations(self):
@@ -468,8 +1002,7 @@ class RMSDataHandle(object):
             station_path = os.path.join(self.dir_path, station_name)
 
             # Add the station name to the database if it doesn't exist
-            if station_name not in self.db.processed_dirs:
-                self.db.processed_dirs[station_name] = []
+            self.db.addStation(station_name)
 
             # Go through all directories in stations
             for night_name in os.listdir(station_path):
@@ -523,6 +1056,144 @@ class RMSDataHandle(object):
 
 
 
+    def parseNightFolder(self, station_code, proc_path, ftpdetectinfo_name, platepar_recalibrated_name):
+        """ Parse the FTPdetectinfo file and recalibrated platepars of a night folder.
+
+        Arguments:
+            station_code: [str] Station code.
+            proc_path: [str] Full path to the night folder.
+            ftpdetectinfo_name: [str] Name of the FTPdetectinfo file.
+            platepar_recalibrated_name: [str] Name of the recalibrated platepars file.
+
+        Return:
+            [list] A list of (jdt_ref, pp_dict, meas) entries for every meteor with a recalibrated platepar,
+                where meas is a (9, N) array of frames, relative times, X, Y, RA, Dec, azimuth, altitude 
+                (deg) and magnitudes.
+        """
+
+        # Load platepars
+        with open(os.path.join(proc_path, platepar_recalibrated_name)) as f:
+            platepars_recalibrated_dict = json.load(f)
+
+        # If all files exist, init the meteor container object
+        cams_met_obs_list = self.initMeteorObs(station_code, os.path.join(proc_path, \
+            ftpdetectinfo_name), platepars_recalibrated_dict)
+
+        obs_entries = []
+        for cams_met_obs in cams_met_obs_list:
+
+            # Get the platepar
+            if cams_met_obs.ff_name in platepars_recalibrated_dict:
+                pp_dict = platepars_recalibrated_dict[cams_met_obs.ff_name]
+            else:
+                continue
+
+            meas = np.array([cams_met_obs.frames, cams_met_obs.time_data, cams_met_obs.x_data, \
+                cams_met_obs.y_data, np.degrees(cams_met_obs.ra_data), np.degrees(cams_met_obs.dec_data), \
+                np.degrees(cams_met_obs.azim_data), np.degrees(cams_met_obs.elev_data), \
+                cams_met_obs.mag_data], dtype=np.float64)
+
+            obs_entries.append([cams_met_obs.jdt_ref, pp_dict, meas])
+
+
+        return obs_entries
+
+
+
+    def observationsCacheKey(self, proc_path, file_names):
+        """ Compute the key of the observations cache of a night folder from the names, modification times
+            and sizes of the source files.
+        """
+
+        key_list = [str(OBS_CACHE_VERSION)]
+        for file_name in file_names:
+            file_stat = os.stat(os.path.join(proc_path, file_name))
+            key_list.append("{:s}:{:.6f}:{:d}".format(file_name, file_stat.st_mtime, file_stat.st_size))
+
+        return "|".join(key_list)
+
+
+
+    def observationsCachePath(self, rel_proc_path):
+        """ Return the path to the observations cache file of a night folder. """
+
+        return os.path.join(self.dir_path, OBS_CACHE_DIR, rel_proc_path + ".npz")
+
+
+
+    def loadObservationsCache(self, rel_proc_path, cache_key):
+        """ Load parsed observations of a night folder from the cache.
+
+        Arguments:
+            rel_proc_path: [str] Path to the night folder relative to the data directory.
+            cache_key: [str] Key of the source files, see observationsCacheKey.
+
+        Return:
+            [list] A list of entries (see parseNightFolder), or None if the cache doesn't exist or it is
+                outdated.
+        """
+
+        cache_path = self.observationsCachePath(rel_proc_path)
+
+        if not os.path.isfile(cache_path):
+            return None
+
+        try:
+            with np.load(cache_path) as cache:
+
+                if str(cache["cache_key"]) != cache_key:
+                    return None
+
+                jdt_refs = cache["jdt_refs"]
+                pp_jsons = cache["pp_jsons"]
+                meas_all = cache["meas"]
+                split_indices = cache["split_indices"]
+
+        except (OSError, ValueError, KeyError):
+            print("Could not read the observations cache:", cache_path)
+            return None
+
+        meas_list = np.split(meas_all, split_indices, axis=1) if len(jdt_refs) else []
+
+        return [[jdt_ref, json.loads(str(pp_json)), meas] for jdt_ref, pp_json, meas \
+            in zip(jdt_refs.tolist(), pp_jsons, meas_list)]
+
+
+
+    def saveObservationsCache(self, rel_proc_path, cache_key, obs_entries):
+        """ Save parsed observations of a night folder to the cache, see loadObservationsCache. """
+
+        cache_path = self.observationsCachePath(rel_proc_path)
+        mkdirP(os.path.dirname(cache_path))
+
+        # Concatenate the measurements of all meteors
+        if len(obs_entries):
+            meas_all = np.hstack([meas for _, _, meas in obs_entries])
+            split_indices = np.cumsum([meas.shape[1] for _, _, meas in obs_entries])[:-1]
+        else:
+            meas_all = np.zeros((9, 0))
+            split_indices = np.zeros(0, dtype=np.int64)
+
+        # Write to a temporary file first, so an interrupted write doesn't leave a broken cache. The name is
+        # unique to the process, as parallel bin workers may parse the same night folder at the same time
+        temp_path = cache_path + ".{:d}.tmp.npz".format(os.getpid())
+
+        try:
+            np.savez(temp_path, cache_key=np.array(cache_key), \
+                jdt_refs=np.array([jdt_ref for jdt_ref, _, _ in obs_entries], dtype=np.float64), \
+                pp_jsons=np.array([json.dumps(pp_dict) for _, pp_dict, _ in obs_entries], dtype=str), \
+                meas=meas_all, split_indices=split_indices)
+            os.replace(temp_path, cache_path)
+
+        # The cache is optional, skip it if it could not be written
+        except (IOError, OSError) as e:
+            print("Could not write the observations cache {:s}: {:s}".format(cache_path, str(e)))
+
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+
+
+
     def loadUnpairedObservations(self, processing_list, dt_range=None):
         """ Load unpaired meteor observations, i.e. observations that are not a part of any trajectory. """
 
@@ -569,41 +1240,29 @@ class RMSDataHandle(object):
             self.db.save()
 
 
-            # Load platepars
-            with open(os.path.join(proc_path, platepar_recalibrated_name)) as f:
-                platepars_recalibrated_dict = json.load(f)
+            # Load the parsed observations from the cache if the source files haven't changed, otherwise
+            #   parse the files and update the cache
+            cache_key = self.observationsCacheKey(proc_path, [ftpdetectinfo_name, \
+                platepar_recalibrated_name])
+            obs_entries = self.loadObservationsCache(rel_proc_path, cache_key)
 
-            # If all files exist, init the meteor container object
-            cams_met_obs_list = self.initMeteorObs(station_code, os.path.join(proc_path, \
-                ftpdetectinfo_name), platepars_recalibrated_dict)
+            if obs_entries is None:
+                obs_entries = self.parseNightFolder(station_code, proc_path, ftpdetectinfo_name, \
+                    platepar_recalibrated_name)
+                self.saveObservationsCache(rel_proc_path, cache_key, obs_entries)
 
-            # Format the observation object to the one required by the trajectory correlator
-            for cams_met_obs in cams_met_obs_list:
 
-                # Get the platepar
-                if cams_met_obs.ff_name in platepars_recalibrated_dict:
-                    pp_dict = platepars_recalibrated_dict[cams_met_obs.ff_name]
-                else:
-                    continue
+            # Format the observation object to the one required by the trajectory correlator
+            for jdt_ref, pp_dict, meas in obs_entries:
 
                 pp = PlateparDummy(**pp_dict)
 
                 # Init meteor data
-                meteor_data = []
-                for entry in zip(cams_met_obs.frames, cams_met_obs.time_data, cams_met_obs.x_data,\
-                    cams_met_obs.y_data, cams_met_obs.azim_data, cams_met_obs.elev_data, \
-                    cams_met_obs.ra_data, cams_met_obs.dec_data, cams_met_obs.mag_data):
-
-                    frame, time_rel, x, y, azim, alt, ra, dec, mag = entry
-
-                    met_point = MeteorPointRMS(frame, time_rel, x, y, np.degrees(ra), np.degrees(dec), \
-                        np.degrees(azim), np.degrees(alt), mag)
-
-                    meteor_data.append(met_point)
+                meteor_data = np.rec.fromarrays(meas, dtype=METEOR_POINT_DTYPE)
 
 
                 # Init the new meteor observation object
-                met_obs = MeteorObsRMS(station_code, jd2Date(cams_met_obs.jdt_ref, dt_obj=True), pp, \
+                met_obs = MeteorObsRMS(station_code, jd2Date(jdt_ref, dt_obj=True), pp, \
                     meteor_data, rel_proc_path)
 
                 # Add only unpaired observations
@@ -625,24 +1284,66 @@ class RMSDataHandle(object):
             traj_dir_path: [str] Full path to a directory with trajectory pickles.
         """
 
-        # Find and load all trajectory objects
+        # Paths of trajectories which are already in the database and stats of loaded files
+        db_traj_paths = self.db.getTrajFilePaths()
+        traj_file_stats = self.db.getTrajFileStats()
+
+        traj_file_paths = set()
+        loaded_count = 0
+
+        # Find all trajectory objects
         for entry in sorted(os.walk(traj_dir_path), key=lambda x: x[0]):
 
             dir_path, _, file_names = entry
 
-            # Find and load all trajectory pickle files
+            # Find all trajectory pickle files
             for file_name in file_names:
                 if file_name.endswith("_trajectory.pickle"):
-                    self.db.addTrajectory(os.path.join(dir_path, file_name))
+
+                    traj_file_path = os.path.join(dir_path, file_name)
+                    traj_file_paths.add(traj_file_path)
+
+                    # Trust the database for trajectories which were added before the file stats were kept
+                    if (traj_file_path in db_traj_paths) \
+                        and (traj_file_path not in traj_file_stats):
+
+                        self.db.setTrajFileStats(traj_file_path, db_traj_paths[traj_file_path])
+
+                        continue
+
+                    # Skip loading the pickle if it hasn't changed
+                    if not self.db.checkTrajFileChanged(traj_file_path):
+                        continue
+
+
+                    # Remove the old entry of a changed file
+                    if traj_file_path in traj_file_stats:
+                        _, _, jdt_ref = traj_file_stats[traj_file_path]
+                        self.db.removeTrajectoryEntry(jdt_ref, traj_file_path)
+
+
+                    # Load the trajectory pickle
+                    traj_reduced = TrajectoryReduced(traj_file_path)
+                    self.db.addTrajectory(None, traj_obj=traj_reduced)
+                    self.db.setTrajFileStats(traj_file_path, traj_reduced.jdt_ref)
+
+                    loaded_count += 1
+
+
+        # Remove the stats of files which don't exist anymore
+        for traj_file_path in traj_file_stats:
+            if traj_file_path not in traj_file_paths:
+                self.db.removeTrajFileStats(traj_file_path)
+
+
+        print("Loaded {:d} new or changed trajectories".format(loaded_count))
 
 
     def getComputedTrajectories(self, jd_beg, jd_end):
         """ Returns a list of computed trajectories between the Julian dates.
         """
 
-        return [self.db.trajectories[key] for key in self.db.trajectories \
-            if (self.db.trajectories[key].jdt_ref >= jd_beg) \
-                and (self.db.trajectories[key].jdt_ref <= jd_end)]
+        return self.db.getTrajectories(jd_beg, jd_end)
                 
 
 
@@ -659,6 +1360,17 @@ class RMSDataHandle(object):
         return self.unpaired_observations
 
 
+    def getTimeIndex(self, unpaired_observations):
+        """ Return the time index of the given list of observations. The index is only rebuilt when a 
+            different list is given or the list has changed.
+        """
+
+        if (self.time_index is None) or (not self.time_index.isValidFor(unpaired_observations)):
+            self.time_index = ObservationTimeIndex(unpaired_observations)
+
+        return self.time_index
+
+
     def findTimePairs(self, met_obs, unpaired_observations, max_toffset):
         """ Finds pairs in time between the given meteor observations and all other observations from 
             different stations. 
@@ -676,16 +1388,14 @@ class RMSDataHandle(object):
 
         found_pairs = []
 
-        # Go through all meteors from other stations
-        for met_obs2 in unpaired_observations:
+        # Go through all meteors from other stations which are within the given time window
+        for met_obs2 in self.getTimeIndex(unpaired_observations).query(met_obs.mean_dt, max_toffset):
 
             # Take only observations from different stations
             if met_obs.station_code == met_obs2.station_code:
                 continue
 
-            # Take observations which are within the given time window
-            if abs((met_obs.mean_dt - met_obs2.mean_dt).total_seconds()) <= max_toffset:
-                found_pairs.append(met_obs2)
+            found_pairs.append(met_obs2)
 
 
         return found_pairs
@@ -699,8 +1409,8 @@ class RMSDataHandle(object):
         # Compute the middle time of the trajectory as reference time
         traj_mid_dt = jd2Date((traj_reduced.rbeg_jd + traj_reduced.rend_jd)/2, dt_obj=True)
 
-        # Go through all unpaired observations
-        for met_obs in unpaired_observations:
+        # Go through all unpaired observations which are within the given time window from the trajectory
+        for met_obs in self.getTimeIndex(unpaired_observations).query(traj_mid_dt, max_toffset):
 
             # Skip all stations that are already participating in the trajectory solution
             if (met_obs.station_code in traj_reduced.participating_stations) or \
@@ -708,10 +1418,7 @@ class RMSDataHandle(object):
 
                 continue
 
-
-            # Take observations which are within the given time window from the trajectory
-            if abs((met_obs.mean_dt - traj_mid_dt).total_seconds()) <= max_toffset:
-                found_traj_obs_pairs.append(met_obs)
+            found_traj_obs_pairs.append(met_obs)
 
 
         return found_traj_obs_pairs
@@ -748,6 +1455,10 @@ class RMSDataHandle(object):
         # Save the picked trajectory structure
         savePickle(traj, output_dir, traj.file_name + '_trajectory.pickle')
 
+        # Keep track of the saved file, so it's not loaded again on the next startup
+        self.db.setTrajFileStats(os.path.join(output_dir, traj.file_name + '_trajectory.pickle'), \
+            traj.jdt_ref)
+
         # Save the plots
         if save_plots:
             traj.save_results = True
@@ -845,12 +1556,253 @@ class RMSDataHandle(object):
         # Save the processed directories to the DB file
         self.db.save()
 
+        # Save the station pair compatibility
+        self.station_pair_graph.save()
+
         # Save the list of processed meteor observations
 
         
 
 
 
+def _correlateBinWorker(params):
+    """ Correlate observations in one time bin in a worker process, see correlateBinsParallel.
+
+    Arguments:
+        params: [list] Data directory path, bin beginning and end, owned time range, trajectory constraints,
+            velocity part, event time range, overlap (s) and the list of folders of the bin.
+
+    Return:
+        [int] Number of loaded unpaired observations.
+    """
+
+    dir_path, bin_beg, bin_end, owner_time_range, trajectory_constraints, velpart, event_time_range, \
+        overlap, processing_list = params
+
+    # Don't start nested pools in the worker process
+    trajectory_constraints = copy.copy(trajectory_constraints)
+    trajectory_constraints.mc_cores = 1
+    trajectory_constraints.solver_cores = 1
+
+    # Each worker has its own data handle, the database is shared through the SQLite file. The folders and
+    #   computed trajectories were already scanned by the main process
+    dh = RMSDataHandle(dir_path, use_sqlite=True, processing_list=processing_list, load_trajectories=False)
+
+    dh.unpaired_observations = dh.loadUnpairedObservations(dh.processing_list, \
+        dt_range=binLoadRange(bin_beg, bin_end, overlap))
+
+    if dh.unpaired_observations:
+        tc = TrajectoryCorrelator(dh, trajectory_constraints, velpart, data_in_j2000=True)
+        tc.run(event_time_range=event_time_range, owner_time_range=owner_time_range)
+
+    dh.finish()
+    dh.db.close()
+
+    return len(dh.unpaired_observations)
+
+
+
+def binLoadRange(bin_beg, bin_end, overlap):
+    """ Return the range of night folder times which may contain observations inside the time bin or within
+        the overlap after it.
+
+    Arguments:
+        bin_beg: [datetime] Beginning of the time bin.
+        bin_end: [datetime] End of the time bin.
+        overlap: [float] Overlap at the bin edges (s).
+
+    Return:
+        (load_beg, load_end): [tuple of datetimes]
+    """
+
+    load_beg = bin_beg - datetime.timedelta(days=NIGHT_FOLDER_MAX_DAYS)
+    load_end = bin_end + datetime.timedelta(seconds=overlap)
+
+    return load_beg, load_end
+
+
+
+def findOverlapDuplicates(traj_list):
+    """ Find trajectories which use the same observation. An observation is shared if the same station 
+        participates in two trajectories whose observed time ranges overlap, as one station observes one 
+        meteor at a time.
+
+    Arguments:
+        traj_list: [list] A list of TrajectoryReduced objects.
+
+    Return:
+        [list] A list of (kept, duplicate) pairs of TrajectoryReduced objects. The trajectory with more
+            participating stations is kept, or the earlier one if the number is the same.
+    """
+
+    duplicates = []
+    removed = set()
+
+    traj_list = sorted(traj_list, key=lambda traj: traj.jdt_ref)
+
+    for i, traj1 in enumerate(traj_list):
+
+        if traj1.jdt_ref in removed:
+            continue
+
+        beg1, end1 = sorted([traj1.rbeg_jd, traj1.rend_jd])
+
+        for traj2 in traj_list[i + 1:]:
+
+            if traj2.jdt_ref in removed:
+                continue
+
+            beg2, end2 = sorted([traj2.rbeg_jd, traj2.rend_jd])
+
+            # Check that the time ranges overlap
+            if (beg2 > end1) or (beg1 > end2):
+                continue
+
+            # Check that a station is shared
+            if not set(traj1.participating_stations).intersection(traj2.participating_stations):
+                continue
+
+            if len(traj2.participating_stations) > len(traj1.participating_stations):
+                kept, duplicate = traj2, traj1
+            else:
+                kept, duplicate = traj1, traj2
+
+            duplicates.append([kept, duplicate])
+            removed.add(duplicate.jdt_ref)
+
+            if duplicate is traj1:
+                break
+
+
+    return duplicates
+
+
+
+def reconcileBinOverlaps(dir_path, dt_bins, overlap):
+    """ Remove duplicate trajectories at the edges of time bins correlated in parallel. Every bin decides on 
+        its own which trajectories it owns, so in rare cases (e.g. when both bins form different candidates
+        from the same observations) the same observation ends up in trajectories of both bins. Only one of
+        them is kept, see findOverlapDuplicates. The observations of a removed trajectory stay marked as 
+        paired.
+
+    Arguments:
+        dir_path: [str] Path to the root data directory.
+        dt_bins: [list] A list of (bin_beg, bin_end) datetime pairs.
+        overlap: [float] Overlap at the bin edges (s).
+
+    Return:
+        [list] A list of (kept, duplicate) pairs of TrajectoryReduced objects, see findOverlapDuplicates.
+    """
+
+    db = DatabaseSQLite(os.path.join(dir_path, SQLITE_DB_NAME))
+
+    duplicates = []
+
+    try:
+
+        # Check the edges between the bins, the trajectories from both bins begin within the overlap
+        for _, bin_end in dt_bins[:-1]:
+
+            edge_jd = datetime2JD(bin_end)
+            window = 2*overlap/86400.0
+
+            for kept, duplicate in findOverlapDuplicates(db.getTrajectories(edge_jd - window, \
+                edge_jd + window)):
+
+                print("Removing duplicate trajectory {:s} ({:s}), kept {:s} ({:s})".format( \
+                    str(jd2Date(duplicate.jdt_ref, dt_obj=True)), ", ".join(duplicate.participating_stations),
+                    str(jd2Date(kept.jdt_ref, dt_obj=True)), ", ".join(kept.participating_stations)))
+
+                db.removeTrajectory(duplicate)
+
+                duplicates.append([kept, duplicate])
+
+    finally:
+        db.close()
+
+
+    return duplicates
+
+
+
+def correlateBinsParallel(dir_path, dt_bins, trajectory_constraints, velpart, bin_cores, processing_list, \
+    event_time_range=None, overlap=None):
+    """ Correlate time bins in parallel. Every worker loads only the observations of its bin (and the 
+        observations within the overlap at its edges) and owns the trajectories which begin inside its bin, 
+        so trajectories in the overlap are computed only once. Observations in the overlap which match an 
+        existing trajectory are only added to it by the bin which owns the trajectory, and the other bin 
+        doesn't use them for new trajectories. Workers write to the shared SQLite database in separate 
+        transactions. After all bins are done, duplicate trajectories at the bin edges are removed (see
+        reconcileBinOverlaps).
+
+    Arguments:
+        dir_path: [str] Path to the root data directory.
+        dt_bins: [list] A list of (bin_beg, bin_end) datetime pairs.
+        trajectory_constraints: [TrajectoryConstraints]
+        velpart: [float] Part of the meteor used for the initial velocity estimation.
+        bin_cores: [int] Number of bins processed in parallel.
+        processing_list: [list] A list of folders to process, see RMSDataHandle.findUnprocessedFolders. 
+            Every worker is given only the folders of its bin.
+
+    Keyword arguments:
+        event_time_range: [list] A list of two datetime objects, see TrajectoryCorrelator.run. None by 
+            default.
+        overlap: [float] Overlap at the bin edges (s). None by default, in which case the maximum time 
+            offset between stations will be used.
+
+    Return:
+        [list] A list of (kept, duplicate) pairs of removed duplicate trajectories, see 
+            reconcileBinOverlaps.
+    """
+
+    if overlap is None:
+        overlap = trajectory_constraints.max_toffset
+
+    input_list = []
+    for i, (bin_beg, bin_end) in enumerate(dt_bins):
+
+        # The first and the last bin own all trajectories before and after them
+        owner_beg = None if (i == 0) else bin_beg
+        owner_end = None if (i == len(dt_bins) - 1) else bin_end
+
+        # Pass only the folders which may contain observations of the bin
+        load_beg, load_end = binLoadRange(bin_beg, bin_end, overlap)
+        bin_processing_list = [entry for entry in processing_list \
+            if (entry[3] is None) or (load_beg <= entry[3] <= load_end)]
+
+        input_list.append([dir_path, bin_beg, bin_end, [owner_beg, owner_end], trajectory_constraints, \
+            velpart, event_time_range, overlap, bin_processing_list])
+
+
+    pool = multiprocessing.Pool(processes=bin_cores, initializer=initSolverProcess)
+
+    try:
+
+        # Report finished bins in order
+        for (bin_beg, bin_end), obs_count in zip(dt_bins, pool.imap(_correlateBinWorker, input_list, \
+            chunksize=1)):
+
+            print()
+            print("FINISHED TIME BIN: {:s}, {:s} ({:d} observations)".format(str(bin_beg), str(bin_end), \
+                obs_count))
+
+    finally:
+        pool.close()
+        pool.join()
+
+
+    # Reconcile the trajectories in the overlaps between bins
+    duplicates = reconcileBinOverlaps(dir_path, dt_bins, overlap)
+
+    print()
+    print("Removed {:d} duplicate trajectories at the bin edges".format(len(duplicates)))
+
+    return duplicates
+
+
+
+
+
 if __name__ == "__main__":
 
     # Set matplotlib for headless running
@@ -912,6 +1864,16 @@ contain data folders. Data folders should have FTPdetectinfo files together with
     arg_parser.add_argument('-l', '--saveplots', \
         help='Save plots to disk.', action="store_true")
 
+    arg_parser.add_argument('-c', '--solvercores', metavar='SOLVER_CORES', type=int, default=1, \
+        help="Number of processes in which candidate trajectories are solved in parallel. 1 by default, in which case the candidates are solved one after another and the Monte Carlo runs are parallelized instead.")
+
+    arg_parser.add_argument('-q', '--sqlite', \
+        help="Store the database of processed data in an SQLite file instead of the JSON file. The existing JSON database will be imported on the first run.", \
+        action="store_true")
+
+    arg_parser.add_argument('-b', '--bincores', metavar='BIN_CORES', type=int, default=1, \
+        help="Number of monthly time bins which are correlated in parallel. 1 by default. If larger than 1, the SQLite database will be used and the Monte Carlo runs of every trajectory will be done on a single core.")
+
     arg_parser.add_argument('-r', '--timerange', metavar='TIME_RANGE', \
         help="""Only compute the trajectories in the given range of time. The time range should be given in the format: "(YYYYMMDD-HHMMSS,YYYYMMDD-HHMMSS)".""", \
             type=str)
@@ -941,6 +1903,7 @@ contain data folders. Data folders should have FTPdetectinfo files together with
     trajectory_constraints.run_mc = not cml_args.disablemc
     trajectory_constraints.save_plots = cml_args.saveplots
     trajectory_constraints.geometric_uncert = not cml_args.uncerttime
+    trajectory_constraints.solver_cores = cml_args.solvercores
 
     if cml_args.minerr is not None:
         trajectory_constraints.min_arcsec_err = cml_args.minerr
@@ -956,8 +1919,8 @@ contain data folders. Data folders should have FTPdetectinfo files together with
         # Clock for measuring script time
         t1 = datetime.datetime.utcnow()
 
-        # Init the data handle
-        dh = RMSDataHandle(cml_args.dir_path)
+        # Init the data handle (bins correlated in parallel share the SQLite database)
+        dh = RMSDataHandle(cml_args.dir_path, use_sqlite=(cml_args.sqlite or (cml_args.bincores > 1)))
 
 
         # If there is nothing to process, stop
@@ -1041,22 +2004,33 @@ contain data folders. Data folders should have FTPdetectinfo files together with
         ### ###
 
 
+        # Correlate the bins in parallel
+        if cml_args.bincores > 1:
+
+            # Close the database, workers open their own connections
+            dh.db.close()
+
+            correlateBinsParallel(cml_args.dir_path, dt_bins, trajectory_constraints, cml_args.velpart, \
+                cml_args.bincores, dh.processing_list, event_time_range=event_time_range)
+
+
         # Go through all chunks in time
-        for bin_beg, bin_end in dt_bins:
+        else:
+            for bin_beg, bin_end in dt_bins:
 
-            print()
-            print("PROCESSING TIME BIN:")
-            print(bin_beg, bin_end)
-            print("-----------------------------")
-            print()
+                print()
+                print("PROCESSING TIME BIN:")
+                print(bin_beg, bin_end)
+                print("-----------------------------")
+                print()
 
-            # Load data of unprocessed observations
-            dh.unpaired_observations = dh.loadUnpairedObservations(dh.processing_list, \
-                dt_range=(bin_beg, bin_end))
+                # Load data of unprocessed observations
+                dh.unpaired_observations = dh.loadUnpairedObservations(dh.processing_list, \
+                    dt_range=(bin_beg, bin_end))
 
-            # Run the trajectory correlator
-            tc = TrajectoryCorrelator(dh, trajectory_constraints, cml_args.velpart, data_in_j2000=True)
-            tc.run(event_time_range=event_time_range)
+                # Run the trajectory correlator
+                tc = TrajectoryCorrelator(dh, trajectory_constraints, cml_args.velpart, data_in_j2000=True)
+                tc.run(event_time_range=event_time_range)
 
 
         
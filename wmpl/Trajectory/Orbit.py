@@ -7,12 +7,9 @@ import argparse
 
 import numpy as np
 
-from jplephem.spk import SPK
 
 
-from wmpl.Config import config
-
-from wmpl.Utils.Earth import calcEarthRectangularCoordJPL
+from wmpl.Utils.Earth import getJPLEphemeris
 from wmpl.Utils.ShowerAssociation import associateShower
 from wmpl.Utils.SolarLongitude import jd2SolLonJPL
 from wmpl.Utils.TrajConversions import J2000_JD, J2000_OBLIQUITY, AU, SUN_MU, SUN_MASS, G, SIDEREAL_YEAR, \
@@ -621,13 +618,11 @@ def calcOrbit(radiant_eci, v_init, v_avg, eci_ref, jd_ref, stations_fixed=False,
         L_g, B_g = raDec2Ecliptic(J2000_JD.days, ra_g, dec_g)
 
 
-        # Load the JPL ephemerids data
-        jpl_ephem_data = SPK.open(config.jpl_ephem_file)
-        
         # Get the position of the Earth (km) and its velocity (km/s) at the given Julian date (J2000 epoch)
         # The position is given in the ecliptic coordinates, origin of the coordinate system is in the centre
-        # of the Sun
-        earth_pos, earth_vel = calcEarthRectangularCoordJPL(jd_dyn, jpl_ephem_data, sun_centre_origin=True)
+        # of the Sun. The ephemeris file is opened once per process and the Earth state is cached, as the
+        # MC runs compute the orbit many times for the same reference time.
+        earth_pos, earth_vel = getJPLEphemeris().earthState(jd_dyn, sun_centre_origin=True)
 
         # print('Earth position:')
         # print(earth_pos)
@@ -827,6 +822,354 @@ def calcOrbit(radiant_eci, v_init, v_avg, eci_ref, jd_ref, stations_fixed=False,
 
 
 
+def calcOrbitBatch(radiant_eci, v_init, v_avg, eci_ref, jd_ref, stations_fixed=False, reference_init=True, \
+    rotation_correction=False):
+    """ Calculate the orbits of many meteors at once. This is the array version of calcOrbit, where all the
+        ephemeris, precession and zenith attraction steps are done on whole arrays. It is meant for bulk
+        computations (e.g. recomputing the orbits of archived trajectories, or shower simulations), where 
+        calling calcOrbit in a loop is too slow.
+
+    Arguments:
+        radiant_eci: [ndarray] (N, 3) array of radiant vectors in ECI coordinates.
+        v_init: [ndarray] Initial velocities (m/s).
+        v_avg: [ndarray] Average velocities (m/s).
+        eci_ref: [ndarray] (N, 3) array of reference ECI coordinates in the epoch of date (meters).
+        jd_ref: [ndarray] Reference Julian dates.
+
+    Keyword arguments:
+        stations_fixed: [bool] Apply the Earth rotation correction to the radiant. Applies to all meteors, 
+            see calcOrbit for details.
+        reference_init: [bool] The reference point is the initial point on the trajectory. Applies to all
+            meteors, see calcOrbit for details.
+        rotation_correction: [bool] Correct the initial velocity for Earth's rotation. Applies to all 
+            meteors, see calcOrbit for details.
+
+    Return:
+        orbits: [dict] Dictionary of arrays of length N, keyed by the names of the Orbit object attributes 
+            (e.g. 'a', 'e', 'i', 'peri', 'node', 'q', 'Tj', 'L_g', 'B_g', 'v_g', 'la_sun'). The time of the 
+            last perihelion passage is given as a Julian date under 'last_perihelion_jd'. Orbital elements 
+            of meteors slower than the escape velocity are set to NaN.
+
+    """
+
+    radiant_eci = np.atleast_2d(np.array(radiant_eci, dtype=np.float64))
+    eci_ref = np.atleast_2d(np.array(eci_ref, dtype=np.float64))
+
+    n_orbits = len(radiant_eci)
+
+    # Broadcast scalar inputs to all meteors
+    v_init = np.zeros(n_orbits) + v_init
+    v_avg = np.zeros(n_orbits) + v_avg
+    jd_ref = np.zeros(n_orbits) + jd_ref
+
+    orbits = {}
+
+
+    ### Correct the velocity vector for the Earth's rotation if the stations are fixed ###
+    ##########################################################################################################
+
+    eci_x, eci_y, eci_z = eci_ref.T
+    eci_ref_mag = vectMag(eci_ref)
+
+    # Calculate the geocentric latitude of the reference trajectory point
+    lat_geocentric = np.arctan2(eci_z, np.sqrt(eci_x**2 + eci_y**2))
+
+    # Calculate the dynamical JD
+    jd_dyn = jd2DynamicalTimeJD(jd_ref)
+
+    # Calculate the geographical coordinates of the reference trajectory ECI position
+    lat_ref, lon_ref, ht_ref = cartesian2Geo(jd_ref, eci_x, eci_y, eci_z)
+
+    # Calculate the velocity of the Earth rotation at the position of the reference trajectory point (m/s)
+    v_e = 2*np.pi*eci_ref_mag*np.cos(lat_geocentric)/86164.09053
+
+    # Calculate the equatorial coordinates of east from the reference position on the trajectory
+    ra_east, _ = altAz2RADec(np.pi/2, 0, jd_ref, lat_ref, lon_ref)
+
+
+    # Compute velocity components of the state vector
+    if reference_init:
+        v_ref_vect = v_init[:, None]*radiant_eci
+
+    else:
+        v_ref_vect = v_avg[:, None]*radiant_eci
+
+
+    # Velocity vector of the Earth's rotation towards the east
+    v_e_vect = np.c_[v_e*np.cos(ra_east), v_e*np.sin(ra_east), np.zeros(n_orbits)]
+
+    # Apply the Earth rotation correction if the station coordinates are fixed
+    if stations_fixed:
+        v_ref_corr = v_ref_vect - v_e_vect
+        v_ref_nocorr = v_ref_vect
+
+    else:
+        v_ref_corr = v_ref_vect
+        v_ref_nocorr = v_ref_vect + v_e_vect
+
+
+    # Compute the radiant without Earth's rotation included (REPORTING PURPOSES ONLY)
+    if stations_fixed:
+        orbits['ra_norot'], orbits['dec_norot'] = _eciArr2RaDec(radiant_eci)
+        orbits['v_init_norot'] = np.copy(v_init)
+        orbits['v_avg_norot'] = np.copy(v_avg)
+
+    else:
+        orbits['ra_norot'], orbits['dec_norot'] = _eciArr2RaDec(v_ref_nocorr)
+        orbits['v_init_norot'] = vectMag(v_ref_nocorr)
+        orbits['v_avg_norot'] = orbits['v_init_norot'] - v_init + v_avg
+
+    orbits['azimuth_apparent_norot'], orbits['elevation_apparent_norot'] = raDec2AltAz(orbits['ra_norot'], \
+        orbits['dec_norot'], jd_ref, lat_ref, lon_ref)
+
+    ##########################################################################################################
+
+
+    ### Correct velocity for Earth's gravity ###
+    ##########################################################################################################
+
+    if rotation_correction:
+        if reference_init:
+            v_init_corr = vectMag(v_ref_corr)
+        else:
+            v_init_corr = vectMag(v_ref_corr) + v_init - v_avg
+
+    else:
+        v_init_corr = np.copy(v_init)
+
+
+    # Calculate apparent RA and Dec from radiant state vector
+    ra, dec = _eciArr2RaDec(radiant_eci)
+
+    # Calculate the apparent azimuth and altitude
+    azimuth_apparent, elevation_apparent = raDec2AltAz(ra, dec, jd_ref, lat_ref, lon_ref)
+
+
+    # Only compute the orbit if the velocity of the meteor is larger than the escape velocity
+    v_esc_sq = (2*6.67408*5.9722)*1e13/eci_ref_mag
+    valid = v_init_corr**2 > v_esc_sq
+
+    # Calculate the geocentric velocity
+    v_g = np.sqrt(np.where(valid, v_init_corr**2 - v_esc_sq, np.nan))
+
+    # Calculate the radiant corrected for Earth's rotation
+    ra_corr, dec_corr = _eciArr2RaDec(v_ref_corr)
+
+    # Calculate the Local Sidreal Time of the reference trajectory position
+    lst_ref = np.radians(jd2LST(jd_ref, np.degrees(lon_ref))[0])
+
+    # Calculate the apparent zenith angle
+    zc = np.arccos(np.sin(dec_corr)*np.sin(lat_geocentric) \
+        + np.cos(dec_corr)*np.cos(lat_geocentric)*np.cos(lst_ref - ra_corr))
+
+    # Calculate the zenith attraction correction
+    delta_zc = 2*np.arctan2((v_init_corr - v_g)*np.tan(zc/2), v_init_corr + v_g)
+
+    # Zenith distance of the geocentric radiant
+    zg = zc + np.abs(delta_zc)
+
+    ##########################################################################################################
+
+
+    ### Calculate the geocentric radiant ###
+    ##########################################################################################################
+
+    # Get the azimuth from the corrected RA and Dec
+    azimuth_corr, _ = raDec2AltAz(ra_corr, dec_corr, jd_ref, lat_geocentric, lon_ref)
+
+    # Calculate the geocentric radiant
+    ra_g, dec_g = altAz2RADec(azimuth_corr, np.pi/2 - zg, jd_ref, lat_geocentric, lon_ref)
+
+
+    # Precess ECI coordinates to J2000
+    re, delta_e, alpha_e = cartesianToSpherical(eci_x, eci_y, eci_z)
+    alpha_ej, delta_ej = equatorialCoordPrecession(jd_ref, J2000_JD.days, alpha_e, delta_e)
+    eci_ref_j2000 = np.array(sphericalToCartesian(re, delta_ej, alpha_ej)).T
+
+    # Precess the geocentric radiant to J2000
+    ra_g, dec_g = equatorialCoordPrecession(jd_ref, J2000_JD.days, ra_g, dec_g)
+
+    # Calculate the ecliptic latitude and longitude of the geocentric radiant (J2000 epoch)
+    L_g, B_g = raDec2Ecliptic(J2000_JD.days, ra_g, dec_g)
+
+
+    # Get the heliocentric positions (km) and velocities (km/s) of the Earth in one pass through the 
+    # ephemeris (ecliptic coordinates, J2000 epoch)
+    earth_pos, earth_vel = getJPLEphemeris().earthStateBatch(jd_dyn, sun_centre_origin=True)
+
+    # Convert the Earth's position to rectangular equatorial coordinates (FK5), add the position of the 
+    # meteor and convert back to heliocentric ecliptic coordinates
+    earth_pos_eq = rotateVector(earth_pos.T, np.array([1, 0, 0]), J2000_OBLIQUITY).T
+    meteor_pos = earth_pos_eq + eci_ref_j2000/1000
+    meteor_pos = rotateVector(meteor_pos.T, np.array([1, 0, 0]), -J2000_OBLIQUITY).T
+
+    ##########################################################################################################
+
+
+    # Calculate components of the heliocentric velocity of the meteor (km/s)
+    v_h = earth_vel + np.array(eclipticToRectangularVelocityVect(L_g, B_g, v_g/1000)).T
+    v_h_mag = vectMag(v_h)
+
+    # Calculate the corrected heliocentric ecliptic coordinates (Sato and Watanabe, 2014), see 
+    # correctedEclipticCoord
+    L_h = (np.arctan2(v_h[:, 1], v_h[:, 0]) + np.pi)%(2*np.pi)
+    B_h = -np.arcsin(v_h[:, 2]/v_h_mag)
+    met_v_h = eclipticToRectangularVelocityVect(L_h, B_h, v_h_mag)
+
+    # Calculate the solar longitude from the position of the Earth
+    la_sun = (np.arctan2(earth_pos[:, 1], earth_pos[:, 0]) + np.pi)%(2*np.pi)
+
+
+    # Calculations below done using Dave Clark's Master thesis equations
+
+    meteor_pos_mag = vectMag(meteor_pos)
+
+    # Specific orbital energy
+    epsilon = (v_h_mag**2)/2 - SUN_MU/meteor_pos_mag
+
+    # Semi-major axis in AU
+    a = -SUN_MU/(2*epsilon*AU)
+
+    # Calculate mean motion in rad/day
+    n = np.sqrt(G*SUN_MASS/((np.abs(a)*AU*1000.0)**3))*86400.0
+
+    # Calculate the orbital period in years (NaN for hyperbolic orbits, as in calcOrbit)
+    with np.errstate(invalid='ignore'):
+        T = 2*np.pi*np.sqrt(((a*AU)**3)/SUN_MU)/(86400*SIDEREAL_YEAR)
+
+
+    # Calculate the orbit angular momentum
+    h_vect = np.cross(meteor_pos, v_h)
+    h_vect_mag = vectMag(h_vect)
+
+    # Calculate inclination
+    incl = np.arccos(h_vect[:, 2]/h_vect_mag)
+
+    # Calculate eccentricity
+    e_vect = np.cross(v_h, h_vect)/SUN_MU - meteor_pos/meteor_pos_mag[:, None]
+    eccentricity = vectMag(e_vect)
+
+    # Calculate perihelion distance (source: Jenniskens et al., 2011, CAMS overview paper)
+    q = np.where(eccentricity == 1, \
+        (meteor_pos_mag + np.sum(e_vect*meteor_pos, axis=1))/(1 + eccentricity), \
+        a*(1.0 - eccentricity))
+
+    # Calculate the aphelion distance
+    Q = a*(1.0 + eccentricity)
+
+
+    # Vector from the Sun pointing to the ascending node (cross product of the Z axis and h)
+    n_vect = np.c_[-h_vect[:, 1], h_vect[:, 0], np.zeros(n_orbits)]
+    n_vect_mag = vectMag(n_vect)
+    has_node = n_vect_mag != 0
+
+    # Calculate node
+    node = np.where(has_node, np.arctan2(n_vect[:, 1], n_vect[:, 0]), 0)
+    node = node%(2*np.pi)
+
+    # Calculate argument of perihelion
+    with np.errstate(invalid='ignore', divide='ignore'):
+        peri = np.arccos(np.sum(n_vect*e_vect, axis=1)/(n_vect_mag*eccentricity))
+        peri = np.where(e_vect[:, 2] < 0, 2*np.pi - peri, peri)
+        peri = np.where(has_node, peri, np.arccos(e_vect[:, 0]/eccentricity))
+
+    peri = peri%(2*np.pi)
+
+    # Calculate the longitude of perihelion
+    pi = (node + peri)%(2*np.pi)
+
+
+    # Calculate true anomaly
+    true_anomaly = np.arccos(np.sum(e_vect*meteor_pos, axis=1)/(eccentricity*meteor_pos_mag))
+    true_anomaly = np.where(np.sum(meteor_pos*v_h, axis=1) < 0, 2*np.pi - true_anomaly, true_anomaly)
+    true_anomaly = true_anomaly%(2*np.pi)
+
+    with np.errstate(invalid='ignore'):
+
+        # Calculate eccentric anomaly
+        eccentric_anomaly = np.arctan2(np.sqrt(1 - eccentricity**2)*np.sin(true_anomaly), eccentricity \
+            + np.cos(true_anomaly))
+
+        # Calculate mean anomaly
+        mean_anomaly = eccentric_anomaly - eccentricity*np.sin(eccentric_anomaly)
+        mean_anomaly = mean_anomaly%(2*np.pi)
+
+        # Calculate the time in days since the last perihelion passage of the meteoroid
+        dt_perihelion = (mean_anomaly*a**(3.0/2))/0.01720209895
+
+        # Calculate Tisserand's parameter with respect to Jupiter
+        Tj = 2*np.sqrt((1 - eccentricity**2)*a/5.204267)*np.cos(incl) + 5.204267/a
+
+
+    # Assign calculated parameters
+    orbits['ra'] = ra
+    orbits['dec'] = dec
+    orbits['v_init'] = v_init
+    orbits['v_avg'] = v_avg
+    orbits['azimuth_apparent'] = azimuth_apparent
+    orbits['elevation_apparent'] = elevation_apparent
+    orbits['jd_ref'] = jd_ref
+    orbits['lon_ref'] = lon_ref
+    orbits['lat_ref'] = lat_ref
+    orbits['ht_ref'] = ht_ref
+    orbits['lat_geocentric'] = lat_geocentric
+    orbits['v_inf'] = v_init_corr
+
+    # Values which are only defined above the escape velocity
+    orbit_values = {
+        'lst_ref': lst_ref,
+        'jd_dyn': jd_dyn,
+        'v_g': v_g,
+        'ra_g': ra_g,
+        'dec_g': dec_g,
+        'L_g': L_g,
+        'B_g': B_g,
+        'v_h_x': met_v_h[0],
+        'v_h_y': met_v_h[1],
+        'v_h_z': met_v_h[2],
+        'L_h': L_h,
+        'B_h': B_h,
+        'zc': zc,
+        'zg': zg,
+        'v_h': v_h_mag*1000,
+        'la_sun': la_sun,
+        'a': a,
+        'e': eccentricity,
+        'i': incl,
+        'peri': peri,
+        'node': node,
+        'pi': pi,
+        'q': q,
+        'Q': Q,
+        'true_anomaly': true_anomaly,
+        'eccentric_anomaly': eccentric_anomaly,
+        'mean_anomaly': mean_anomaly,
+        'last_perihelion_jd': jd_dyn - dt_perihelion,
+        'n': n,
+        'T': T,
+        'Tj': Tj
+        }
+
+    for key in orbit_values:
+        orbits[key] = np.where(valid, orbit_values[key], np.nan)
+
+
+    return orbits
+
+
+
+def _eciArr2RaDec(eci):
+    """ Internal function. Convert an (N, 3) array of ECI vectors to right ascensions and declinations. """
+
+    eci = eci/vectMag(eci)[:, None]
+
+    dec = np.arcsin(eci[:, 2])
+    ra = np.arctan2(eci[:, 1], eci[:, 0])%(2*np.pi)
+
+    return ra, dec
+
+
+
 
 if __name__ == "__main__":
 
@@ -10,8 +10,13 @@ import time
 import copy
 import sys
 import os
+import atexit
 import datetime
 import pickle
+import shutil
+import tempfile
+import uuid
+import multiprocessing
 from operator import attrgetter
 
 import numpy as np
@@ -27,10 +32,10 @@ Basemap = importBasemap()
 
 
 from wmpl.Trajectory.Orbit import calcOrbit
-from wmpl.Utils.Math import vectNorm, vectMag, meanAngle, findClosestPoints, RMSD, angleBetweenSphericalCoords, \
-    lineFunc, normalizeAngleWrap
+from wmpl.Utils.Math import vectNorm, vectMag, meanAngle, findClosestPoints, findClosestPointsVect, RMSD, \
+    angleBetweenSphericalCoords, lineFunc, normalizeAngleWrap
 from wmpl.Utils.OSTools import mkdirP
-from wmpl.Utils.Pickling import savePickle
+from wmpl.Utils.Pickling import savePickle, loadPickle
 from wmpl.Utils.Plotting import savePlot
 from wmpl.Utils.PlotOrbits import plotOrbits
 from wmpl.Utils.PlotCelestial import CelestialPlot
@@ -687,6 +692,75 @@ def numStationsNotIgnored(observations):
 
 
 
+class StackedObservations(object):
+    def __init__(self, observations, weights=None):
+        """ Lines of sight from all stations stacked into contiguous arrays. This is done only once per 
+            solve, so the cost function used for the LoS minimization can be evaluated for all points at
+            once, instead of looping over stations and individual points.
+
+        Arguments:
+            observations: [list] A list of ObservedPoints objects.
+
+        Keyword arguments:
+            weights: [list] A list of statistical weights for every station. None by default.
+
+        """
+
+        self.observations = observations
+
+        # Make sure the weights can be used
+        weights = checkWeights(observations, weights)
+
+        # Time of the earliest point, used as the reference for the gravity drop
+        self.t0 = min([obs.time_data[0] for obs in observations])
+
+        time_data = []
+        stat_eci_los = []
+        meas_eci_los = []
+        point_weights = []
+
+        # Take only the points which are not ignored
+        for obs, w in zip(observations, weights):
+
+            used_points = obs.ignore_list == 0
+
+            time_data.append(np.array(obs.time_data, dtype=np.float64)[used_points])
+            stat_eci_los.append(obs.stat_eci_los[used_points])
+            meas_eci_los.append(obs.meas_eci_los[used_points])
+            point_weights.append(np.zeros(np.count_nonzero(used_points)) + w)
+
+
+        # Relative time of every point from the beginning of the meteor
+        self.time_rel = np.concatenate(time_data) - self.t0
+
+        # ECI coordinates of stations and lines of sight for every point (N x 3 arrays)
+        self.stat_eci_los = np.concatenate(stat_eci_los).reshape(-1, 3)
+        self.meas_eci_los = np.concatenate(meas_eci_los).reshape(-1, 3)
+
+        # Station weights assigned to every point
+        self.weights = np.concatenate(point_weights)
+        self.weights_sum = 1e-10 + np.sum(self.weights)
+
+
+        # The first point of every non-ignored station is used for moving the state vector
+        self.stat_eci_first = np.array([obs.stat_eci_los[0] for obs in observations \
+            if not obs.ignore_station]).reshape(-1, 3)
+        self.meas_eci_first = np.array([obs.meas_eci_los[0] for obs in observations \
+            if not obs.ignore_station]).reshape(-1, 3)
+
+
+    def moveStateVector(self, state_vect, radiant_eci):
+        """ Vectorized version of the moveStateVector function, see its documentation for details. """
+
+        # Calculate closest points of approach of the first points of all stations on the radiant line
+        _, rad_cpa, _ = findClosestPointsVect(self.stat_eci_first, self.meas_eci_first, state_vect, \
+            radiant_eci)
+
+        # Choose the state vector with the largest height
+        return rad_cpa[np.argmax(vectMag(rad_cpa))]
+
+
+
 def angleSumMeasurements2Line(observations, state_vect, radiant_eci, weights=None, gravity=False):
     """ Sum all angles between the radiant line and measurement lines of sight.
 
@@ -695,7 +769,9 @@ def angleSumMeasurements2Line(observations, state_vect, radiant_eci, weights=Non
         have been replaced with angles.
 
     Arguments:
-        observations: [list] A list of ObservedPoints objects which are containing meteor observations.
+        observations: [list or StackedObservations] A list of ObservedPoints objects which are containing 
+            meteor observations. An already initialized StackedObservations object can be given instead, 
+            in which case the weights are taken from it.
         state_vect: [3 element ndarray] Estimated position of the initial state vector in ECI coordinates.
         radiant_eci: [3 element ndarray] Unit 3D vector of the radiant in ECI coordinates.
 
@@ -708,106 +784,196 @@ def angleSumMeasurements2Line(observations, state_vect, radiant_eci, weights=Non
 
     """
 
-    # If the weights were not given, use 1 for every weight
-    if weights is None:
-        weights = np.ones(len(observations))
+    # Stack all observations into arrays
+    if isinstance(observations, StackedObservations):
+        stacked = observations
+    else:
+        stacked = StackedObservations(observations, weights=weights)
 
-        # Set weights for stations that are not used to 0
-        weights = np.array([w if (observations[i].ignore_station == False) else 0 \
-            for i, w in enumerate(weights)])
 
-    # Make sure there are weights larger than 0
-    if sum(weights) <= 0:
-        weights = np.ones(len(observations))
+    # Move the state vector to the beginning of the trajectory
+    state_vect = stacked.moveStateVector(state_vect, radiant_eci)
 
-        # Set weights for stations that are not used to 0
-        weights = np.array([w if (observations[i].ignore_station == False) else 0 \
-            for i, w in enumerate(weights)])
+    # Get the ECI coordinates of the projection of the measurement lines of sight on the radiant line
+    _, rad_cpa, _ = findClosestPointsVect(stacked.stat_eci_los, stacked.meas_eci_los, state_vect, \
+        radiant_eci)
 
 
+    # Take the gravity drop into account
+    #   Note: here we assume that the acceleration due to gravity is fixed at the given height,
+    #   which might cause an offset of a few meters for events longer than 5 seconds
+    if gravity:
 
-    # Move the state vector to the beginning of the trajectory
-    state_vect = moveStateVector(state_vect, radiant_eci, observations)
+        rad_cpa_mag = vectMag(rad_cpa)
 
-    # Find the earliest point in time
-    t0 = min([obs.time_data[0] for obs in observations])
+        # Calculate the gravitational acceleration at the given height
+        g = G*EARTH.MASS/(rad_cpa_mag**2)
 
-    angle_sum = 0.0
-    weights_sum = 1e-10
+        # Calculate the amount of gravity drop from a straight trajectory (handle the case when the time
+        #   can be negative)
+        drop = np.sign(stacked.time_rel)*(1.0/2)*g*stacked.time_rel**2
 
-    # Go through all observations from all stations
-    for i, obs in enumerate(observations):
-        
-        # Go through all measured positions
-        for t, meas_eci, stat_eci, ignore in zip(obs.time_data, obs.meas_eci_los, obs.stat_eci_los, \
-            obs.ignore_list):
+        # Apply gravity drop to ECI coordinates
+        rad_cpa = rad_cpa - (drop/rad_cpa_mag)[:, np.newaxis]*rad_cpa
 
-            # Skip the point if it is to be ignored
-            if ignore:
-                continue
 
-            # Get the ECI coordinates of the projection of the measurement line of sight on the radiant line
-            _, rad_cpa, _ = findClosestPoints(stat_eci, meas_eci, state_vect, radiant_eci)
+    # Calculate the unit vector pointing from the station to the point on the trajectory
+    station_ray = rad_cpa - stacked.stat_eci_los
+    station_ray /= vectMag(station_ray)[:, np.newaxis]
 
+    # Calculate the angle between the observed LoS as seen from the station and the radiant line
+    cosangle = np.sum(stacked.meas_eci_los*station_ray, axis=1)
 
-            # Take the gravity drop into account
-            #   Note: here we assume that the acceleration due to gravity is fixed at the given height,
-            #   which might cause an offset of a few meters for events longer than 5 seconds
-            if gravity:
+    # Make sure the cosine is within limits and calculate the angle
+    angle_sum = np.sum(stacked.weights*np.arccos(np.clip(cosangle, -1, 1)))
 
+    return angle_sum/stacked.weights_sum
 
-                # Calculate the time in seconds from the beginning of the meteor
-                t_rel = t - t0
 
-                # Calculate the gravitational acceleration at the given height
-                g = G*EARTH.MASS/(vectMag(rad_cpa)**2)
 
-                # Determing the sign of the initial time
-                time_sign = np.sign(t_rel)
+def angleSumMeasurements2LineGrad(observations, state_vect, radiant_eci, weights=None, gravity=False):
+    """ Analytic gradient of angleSumMeasurements2Line with respect to the state vector and the radiant
+        vector.
+
+        The cost function does not change when the state vector is moved along the radiant line, so the
+        gradient is evaluated at the moved state vector, the same as in the cost function. The radiant vector
+        does not have to be normalized, the gradient is valid for any scale of it.
+
+    Arguments:
+        observations: [list or StackedObservations] A list of ObservedPoints objects, or an already
+            initialized StackedObservations object.
+        state_vect: [3 element ndarray] Estimated position of the initial state vector in ECI coordinates.
+        radiant_eci: [3 element ndarray] 3D vector of the radiant in ECI coordinates.
+
+    Keyword arguments:
+        weights: [list] A list of statistical weights for every station. None by default.
+        gravity: [bool] If True, the gravity drop will be taken into account.
+
+    Return:
+        grad: [6 element ndarray] Partial derivatives of the cost function by the state vector (first three
+            elements, in rad/m) and by the radiant vector (last three elements).
+
+    """
+
+    # Stack all observations into arrays
+    if isinstance(observations, StackedObservations):
+        stacked = observations
+    else:
+        stacked = StackedObservations(observations, weights=weights)
+
+
+    radiant_eci = np.array(radiant_eci, dtype=np.float64)
+
+    # Move the state vector to the beginning of the trajectory, and keep track by how much it was moved 
+    #   along the radiant line, as the radiant line pivots around the given state vector
+    state_vect_moved = stacked.moveStateVector(state_vect, radiant_eci)
+    state_vect_shift = np.dot(state_vect_moved - state_vect, radiant_eci)/np.dot(radiant_eci, radiant_eci)
+    state_vect = state_vect_moved
+
+    P = stacked.stat_eci_los
+    u = stacked.meas_eci_los
+    v = radiant_eci
+
+    ### Compute the projections on the radiant line (see findClosestPoints), keeping the intermediate values
+    w = P - state_vect
+    a = np.sum(u*u, axis=1)
+    b = np.dot(u, v)
+    c = np.dot(v, v)
+    d = np.sum(u*w, axis=1)
+    e = np.dot(w, v)
+
+    denom = a*c - b**2
+    tc = (a*e - b*d)/denom
+
+    # Points on the radiant line closest to the lines of sight
+    rad_cpa = state_vect + np.outer(tc, v)
 
-                # Calculate the amount of gravity drop from a straight trajectory (handle the case when the time
-                #   can be negative)
-                drop = time_sign*(1.0/2)*g*t_rel**2
+    ###
+
+    # Derivatives of the line parameter by the state vector and by the radiant vector
+    dtc_dstate = (b[:, np.newaxis]*u - a[:, np.newaxis]*v)/denom[:, np.newaxis]
+    dtc_drad = (a[:, np.newaxis]*w - d[:, np.newaxis]*u \
+        - tc[:, np.newaxis]*(2*a[:, np.newaxis]*v - 2*b[:, np.newaxis]*u))/denom[:, np.newaxis]
+
+
+    # Apply the gravity drop, which scales the point by (1 - k/|r|^3), where k = sign(t)*GM*t^2/2
+    if gravity:
+
+        rad_cpa_mag = vectMag(rad_cpa)
+        k = np.sign(stacked.time_rel)*(1.0/2)*G*EARTH.MASS*stacked.time_rel**2
+
+        gravity_scale = 1.0 - k/rad_cpa_mag**3
+        rad_cpa_drop = rad_cpa*gravity_scale[:, np.newaxis]
+
+    else:
+        rad_cpa_drop = rad_cpa
 
-                # Apply gravity drop to ECI coordinates
-                rad_cpa -= drop*vectNorm(rad_cpa)
 
+    # Unit vectors pointing from the stations to the points on the trajectory
+    station_ray = rad_cpa_drop - P
+    ray_mag = vectMag(station_ray)
+    station_ray /= ray_mag[:, np.newaxis]
 
-                # print('-----')
-                # print('Station:', obs.station_id)
-                # print('t:', t_rel)
-                # print('g:', g)
+    cosangle = np.sum(u*station_ray, axis=1)
 
-                # print('Drop:', drop)
+    # Derivative of the angle by the position of the point on the trajectory
+    # d(arccos(u.ray))/dr = -(u - cos*ray)/(|r|*sin)
+    perp = u - cosangle[:, np.newaxis]*station_ray
+    sinangle = vectMag(perp)
 
+    # The derivative is not defined if the angle is 0 or the cosine was clipped
+    valid = (sinangle > 0) & (np.abs(cosangle) < 1)
+    sinangle[~valid] = 1.0
+    dangle_dr = -perp/(ray_mag*sinangle)[:, np.newaxis]
+    dangle_dr[~valid] = 0
 
-            # Calculate the unit vector pointing from the station to the point on the trajectory
-            station_ray = rad_cpa - stat_eci
-            station_ray = vectNorm(station_ray)
 
-            # Calculate the angle between the observed LoS as seen from the station and the radiant line
-            cosangle = np.dot(meas_eci, station_ray)
+    # Propagate through the gravity drop (the Jacobian of the drop is symmetric)
+    if gravity:
+        dangle_dr = gravity_scale[:, np.newaxis]*dangle_dr \
+            + (3*k/rad_cpa_mag**5*np.sum(rad_cpa*dangle_dr, axis=1))[:, np.newaxis]*rad_cpa
 
-            # Make sure the cosine is within limits and calculate the angle
-            angle_sum += weights[i]*np.arccos(np.clip(cosangle, -1, 1))
 
-            weights_sum += weights[i]
+    # Propagate through the projection on the radiant line, r = S + v*tc
+    dangle_dr_v = np.dot(dangle_dr, v)[:, np.newaxis]
+    grad_state = dangle_dr + dangle_dr_v*dtc_dstate
+    grad_rad = tc[:, np.newaxis]*dangle_dr + dangle_dr_v*dtc_drad
 
 
-    return angle_sum/weights_sum
+    # Apply weights
+    weights_pts = stacked.weights[:, np.newaxis]/stacked.weights_sum
+    grad_state = np.sum(weights_pts*grad_state, axis=0)
+    grad_rad = np.sum(weights_pts*grad_rad, axis=0)
+
+    # Take into account that the moved state vector depends on the radiant direction
+    grad_rad += state_vect_shift*grad_state
+
+    return np.r_[grad_state, grad_rad]
 
 
 
 
 def minimizeAngleCost(params, observations, weights=None, gravity=False):
-    """ A helper function for minimization of angle deviations. """
+    """ A helper function for minimization of angle deviations. The observations can be given as a
+        StackedObservations object, so they do not have to be stacked on every call.
+    """
 
     state_vect, radiant_eci = np.hsplit(params, 2)
-    
+
     return angleSumMeasurements2Line(observations, state_vect, radiant_eci, weights=weights, gravity=gravity)
 
 
 
+def minimizeAngleCostGrad(params, observations, weights=None, gravity=False):
+    """ A helper function which returns the analytic gradient of minimizeAngleCost. """
+
+    state_vect, radiant_eci = np.hsplit(params, 2)
+
+    return angleSumMeasurements2LineGrad(observations, state_vect, radiant_eci, weights=weights, \
+        gravity=gravity)
+
+
+
 
 def calcSpatialResidual(jd, state_vect, radiant_eci, stat, meas):
     """ Calculate horizontal and vertical residuals from the radiant line, for the given observed point.
@@ -897,6 +1063,85 @@ def calcSpatialResidual(jd, state_vect, radiant_eci, stat, meas):
 
 
 
+def calcSpatialResidualsVect(jd_data, state_vect, radiant_eci, stat_data, meas_data):
+    """ Vectorized version of calcSpatialResidual. Calculate horizontal and vertical residuals from the 
+        radiant line for many observed points at once.
+
+        The geographical position of the state vector is only computed once, at the first given time. The
+        local frames at other times only differ in the longitude, which is propagated using the sidereal
+        rotation rate of the Earth.
+
+    Arguments:
+        jd_data: [ndarray] Julian dates of observed points.
+        state_vect: [3 element ndarray] ECI position of the state vector
+        radiant_eci: [3 element ndarray] radiant direction vector in ECI
+        stat_data: [ndarray] (N, 3) array of positions of the station in ECI
+        meas_data: [ndarray] (N, 3) array of lines of sight from the station, in ECI
+
+    Return:
+        (hres, vres): [tuple of ndarrays] residuals in horitontal and vertical direction from the radiant 
+            line
+
+    """
+
+    jd_data = np.asarray(jd_data, dtype=np.float64)
+    stat_data = np.asarray(stat_data, dtype=np.float64)
+    meas_data = np.asarray(meas_data, dtype=np.float64)
+
+    if len(jd_data) == 0:
+        return np.array([]), np.array([])
+
+
+    # Normalize the lines of sight
+    meas_data = meas_data/vectMag(meas_data)[:, np.newaxis]
+
+    # Calculate closest points of approach (observed line of sight to radiant line) from the state vector
+    obs_cpa, rad_cpa, _ = findClosestPointsVect(stat_data, meas_data, state_vect, radiant_eci)
+
+    # Vectors pointing from the points on the trajectory to the points on the lines of sight
+    p = obs_cpa - rad_cpa
+
+
+    # Calculate geographical coordinates of the state vector at the reference time
+    jd_ref = jd_data[0]
+    lat, lon_ref, _ = cartesian2Geo(jd_ref, *state_vect)
+
+    # Propagate the longitude to the times of individual points (the Greenwich sidereal time increases at 
+    #   360.98564736629 deg/day)
+    lon = lon_ref - np.radians(360.98564736629*(jd_data - jd_ref))
+
+    # Calculate ENU (East, North, Up) vector at the position of the state vector, and direction of the radiant
+    nn = np.array(ecef2ENU(lat, lon, *radiant_eci))
+
+    # Convert the vector to polar coordinates
+    theta = np.arctan2(nn[1], nn[0])
+    phi = np.arccos(nn[2]/np.sqrt(np.sum(nn**2, axis=0)))
+
+    zeros = np.zeros_like(theta)
+
+    # Local reference frame unit vectors
+    hx = [            -np.cos(theta),              np.sin(theta),       zeros]
+    vz = [-np.cos(phi)*np.sin(theta), -np.cos(phi)*np.cos(theta), np.sin(phi)]
+    hy = [ np.sin(phi)*np.sin(theta),  np.sin(phi)*np.cos(theta), np.cos(phi)]
+
+    # Calculate local reference frame unit vectors in ECEF coordinates
+    ehorzx = np.column_stack(enu2ECEF(lat, lon, *hx))
+    ehorzy = np.column_stack(enu2ECEF(lat, lon, *hy))
+    evert  = np.column_stack(enu2ECEF(lat, lon, *vz))
+
+    ehx = np.sum(p*ehorzx, axis=1)
+    ehy = np.sum(p*ehorzy, axis=1)
+
+    # Calculate vertical residuals
+    vres = np.sign(ehx)*np.hypot(ehx, ehy)
+
+    # Calculate horizontal residuals
+    hres = np.sum(p*evert, axis=1)
+
+    return hres, vres
+
+
+
 def lineFuncLS(params, x, y, weights):
     """ Line defined by slope and intercept. Version for least squares.
     
@@ -919,6 +1164,66 @@ def lineFuncLS(params, x, y, weights):
 
 
 
+def fitLinesSoftL1(x, y, weights, masks, robust_iter=100):
+    """ Fit lines to many subsets of the same points at once, using the weighted linear regression. The fit 
+        is made robust by iteratively reweighting the points so the soft L1 loss is minimized, the same as 
+        with scipy.optimize.least_squares(lineFuncLS, ..., loss='soft_l1').
+
+    Arguments:
+        x: [ndarray] Independant variable (N points).
+        y: [ndarray] Estimated values (N points), or an (M, N) array with different values for every fit.
+        weights: [ndarray] Weights of points (N points).
+        masks: [ndarray] (M, N) boolean array, every row selects the points of one fit.
+
+    Keyword arguments:
+        robust_iter: [int] Maximum number of robust reweighting iterations. If 0, only the weighted least 
+            squares fit is done. 100 by default.
+
+    Return:
+        fits: [ndarray] (M, 2) array of (slope, intercept) pairs of all fits. The fits which could not be
+            done are set to NaN.
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    masks = np.atleast_2d(masks)
+
+    # Weights of points in individual fits
+    fit_weights = masks*np.asarray(weights, dtype=np.float64)
+
+    robust_factors = np.ones_like(fit_weights)
+
+    for i in range(robust_iter + 1):
+
+        w = fit_weights*robust_factors
+
+        # Weighted sums needed for the linear regression of every fit
+        sw = np.sum(w, axis=1)
+        sx = w.dot(x)
+        sy = np.sum(w*y, axis=1)
+        sxx = w.dot(x**2)
+        sxy = np.sum(w*x*y, axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (sw*sxy - sx*sy)/(sw*sxx - sx**2)
+            intercept = (sy - slope*sx)/sw
+
+        # The weight of soft L1 loss rho(z) = 2*(sqrt(1 + z) - 1) of the squared weighted residual z is 
+        #   rho'(z) = 1/sqrt(1 + z)
+        res_sq = fit_weights*(y - (slope[:, np.newaxis]*x + intercept[:, np.newaxis]))**2
+        robust_factors_new = 1.0/np.sqrt(1.0 + res_sq)
+
+        # Stop if the weights have converged
+        if np.allclose(robust_factors_new, robust_factors, rtol=1e-9, atol=0, equal_nan=True):
+            break
+
+        robust_factors = robust_factors_new
+
+
+    return np.c_[slope, intercept]
+
+
+
 def jacchiaLagFunc(t, a1, a2):
     """ Jacchia (1955) model for modeling lengths along the trail of meteors, modified to fit the lag (length 
         along the trail minus the linear part, estimated by fitting a line to the first part of observations, 
@@ -1001,168 +1306,224 @@ def checkWeights(observations, weights):
 
 
 
-def timingResiduals(params, observations, t_ref_station, weights=None, ret_stddev=False):
-    """ Calculate the sum of absolute differences between timings of given stations using the length from
-        respective stations.
-    
-    Arguments:
-        params: [ndarray] Timing differences from the reference station (NOTE: reference station should NOT be 
-            in this list).
-        observations: [list] A list of ObservedPoints objects.
-        t_ref_station: [int] Index of the reference station.
+class TimingResiduals(object):
+    def __init__(self, observations, t_ref_station, weights=None):
+        """ Precomputed cost function of timing differences between stations, see timingResiduals. 
 
-    Keyword arguments:
-        weights: [list] A list of statistical weights for every station.
-        ret_stddev: [bool] Returns the standard deviation instead of the cost function.
-    
-    Return:
-        [float] Average absolute difference between the timings from all stations using the length for
-            matching.
+            The points which are compared between pairs of stations are chosen by length, so they don't 
+            depend on the timing offsets. The lengths are interpolated only once (with np.interp on 
+            length-sorted data), and as the interpolation is linear, the timing offsets only shift the 
+            residuals. This makes the evaluation of the cost function and its analytic gradient cheap.
 
-    """
+            NOTE: As in timingResiduals, stations with no time overlap with other stations are set to be
+                ignored if there are more than two stations.
 
-    # Make sure weight values are OK
-    weights = checkWeights(observations, weights)
+        Arguments:
+            observations: [list] A list of ObservedPoints objects.
+            t_ref_station: [int] Index of the reference station.
 
-    stat_count = 0
+        Keyword arguments:
+            weights: [list] A list of statistical weights for every station.
 
-    state_vect_distances = []
+        """
 
-    # Go through observations from all stations
-    for i, obs in enumerate(observations):
+        # Make sure weight values are OK
+        weights = checkWeights(observations, weights)
 
-        # Time difference is 0 for the reference stations
-        if i == t_ref_station:
-            t_diff = 0
+        self.n_obs = len(observations)
+        self.t_ref_station = t_ref_station
 
-        else:
-            # Take the estimated time difference for all other stations
-            t_diff = params[stat_count]
-            stat_count += 1
+        # Indices of timing differences in the parameter list for every station (-1 for the reference)
+        self.param_indices = -np.ones(self.n_obs, dtype=np.int64)
+        self.param_indices[[i for i in range(self.n_obs) if i != t_ref_station]] = np.arange(self.n_obs - 1)
 
+        base_residuals = []
+        stat_i = []
+        stat_j = []
+        pair_weights = []
 
-        # Calculate the shifted time
-        time_shifted = obs.time_data + t_diff
+        self.weights_sum = 1e-10
 
-        # Add length to length list
-        state_vect_distances.append([time_shifted,  obs.state_vect_dist])
+        # Keep track of stations with confirmed overlaps
+        confirmed_overlaps = []
 
+        # Go through all pairs of observations (i.e. stations)
+        for i in range(self.n_obs):
 
+            # Skip ignored stations
+            if observations[i].ignore_station:
+                continue
 
-    cost_sum = 0
-    cost_point_count = 0
-    weights_sum = 1e-10
+            for j in range(i + 1, self.n_obs):
 
-    # Keep track of stations with confirmed overlaps
-    confirmed_overlaps = []
+                # Skip ignored stations
+                if observations[j].ignore_station:
+                    continue
 
-    # Go through all pairs of observations (i.e. stations)
-    for i in range(len(observations)):
+                # Extract times and lengths from both stations, excluding ignored points
+                time1 = observations[i].time_data[observations[i].ignore_list == 0]
+                len1 = observations[i].state_vect_dist[observations[i].ignore_list == 0]
+                time2 = observations[j].time_data[observations[j].ignore_list == 0]
+                len2 = observations[j].state_vect_dist[observations[j].ignore_list == 0]
 
-        # Skip ignored stations
-        if observations[i].ignore_station:
-            continue
+                # Find common points in length between both stations
+                common_pts = np.where((len2 >= np.min(len1)) & (len2 <= np.max(len1)))
 
-        for j in range(len(observations)):
-            
-            # Skip ignored stations
-            if observations[j].ignore_station:
-                continue
+                # Continue without fitting the timing is there is no, or almost no overlap
+                if len(common_pts[0]) < 4:
+                    continue
 
+                # Keep track of stations with confirmed overlaps
+                confirmed_overlaps.append(observations[i].station_id)
+                confirmed_overlaps.append(observations[j].station_id)
 
-            # Skip pairing the same observations again
-            if j <= i:
-                continue
+                # Take only the common points
+                time2 = time2[common_pts]
+                len2 = len2[common_pts]
 
-            # Extract times and lengths from both stations
-            time1, len1 = state_vect_distances[i]
-            time2, len2 = state_vect_distances[j]
 
-            # Exclude ignored points
-            time1 = time1[observations[i].ignore_list == 0]
-            len1 = len1[observations[i].ignore_list == 0]
-            time2 = time2[observations[j].ignore_list == 0]
-            len2 = len2[observations[j].ignore_list == 0]
+                # If there are any excluded points in the reference observations, do not take their
+                # pairs from the other site into consideration
+                if observations[i].excluded_indx_range:
 
-            # Find common points in length between both stations
-            common_pts = np.where((len2 >= np.min(len1)) & (len2 <= np.max(len1)))
+                    # Extract excluded indices
+                    excluded_indx_min, excluded_indx_max = observations[i].excluded_indx_range
 
+                    # Get the range of lengths inside the exclusion zone
+                    len1_excluded_min = len1[excluded_indx_min]
+                    len1_excluded_max = len1[excluded_indx_max]
 
-            # Continue without fitting the timing is there is no, or almost no overlap
-            if len(common_pts[0]) < 4:
-                continue
+                    # Select only those lengths in the other station which are outside the exclusion zone
+                    outside_excluded = ~((len2 >= len1_excluded_min) & (len2 <= len1_excluded_max))
+                    time2 = time2[outside_excluded]
+                    len2 = len2[outside_excluded]
 
 
-            # Keep track of stations with confirmed overlaps
-            confirmed_overlaps.append(observations[i].station_id)
-            confirmed_overlaps.append(observations[j].station_id)
-            
+                # Interpolate the time of the first (i.e. reference) station at the lengths of the second
+                len_sort = np.argsort(len1, kind='mergesort')
+                time1_interpol = np.interp(len2, len1[len_sort], time1[len_sort])
 
-            # Take only the common points
-            time2 = time2[common_pts]
-            len2 = len2[common_pts]
+                # Residuals without the timing offsets
+                base_residuals.append(time1_interpol - time2)
+                stat_i.append(np.zeros(len(time2), dtype=np.int64) + i)
+                stat_j.append(np.zeros(len(time2), dtype=np.int64) + j)
+                pair_weights.append(np.zeros(len(time2)) + weights[i]*weights[j])
 
+                # Add the weight sum
+                self.weights_sum += weights[i]*weights[j]
 
-            # If there are any excluded points in the reference observations, do not take their
-            # pairs from the other site into consideration
-            if observations[i].excluded_indx_range:
 
-                # Extract excluded indices
-                excluded_indx_min, excluded_indx_max = observations[i].excluded_indx_range
+        # Exclude stations with no time overlap with other stations
+        if (self.n_obs > 2):
+            confirmed_overlaps = list(set(confirmed_overlaps))
+            for obs in observations:
+                if obs.station_id not in confirmed_overlaps:
+                    obs.ignore_station = True
+                    obs.ignore_list = np.ones(len(obs.time_data), dtype=np.uint8)
 
-                # Get the range of lengths inside the exclusion zone
-                len1_excluded_min = len1[excluded_indx_min]
-                len1_excluded_max = len1[excluded_indx_max]
 
-                # Select only those lengths in the other station which are outside the exclusion zone
-                temp_arr = np.c_[time2, len2]
-                temp_arr = temp_arr[~((temp_arr[:, 1] >= len1_excluded_min) \
-                    & (temp_arr[:, 1] <= len1_excluded_max))]
+        # Stack the points of all pairs
+        if base_residuals:
+            self.base_residuals = np.concatenate(base_residuals)
+            self.stat_i = np.concatenate(stat_i)
+            self.stat_j = np.concatenate(stat_j)
+            self.pair_weights = np.concatenate(pair_weights)
 
-                time2, len2 = temp_arr.T
+        else:
+            self.base_residuals = np.array([])
+            self.stat_i = np.array([], dtype=np.int64)
+            self.stat_j = np.array([], dtype=np.int64)
+            self.pair_weights = np.array([])
 
+        self.cost_point_count = len(self.base_residuals)
 
-            # Interpolate the first (i.e. reference length)
-            len1_interpol = scipy.interpolate.interp1d(len1, time1)
 
-            # Calculate the residuals using smooth approximation of L1 (absolute value) cost
-            z = (len1_interpol(len2) - time2)**2
 
-            # Calculate the cost function sum
-            cost_sum += weights[i]*weights[j]*np.sum(2*(np.sqrt(1 + z) - 1))
+    def residuals(self, params):
+        """ Compute timing residuals of all compared points for the given timing differences. """
 
-            # Add the weight sum
-            weights_sum += weights[i]*weights[j]
+        # Timing differences of all stations (0 for the reference station)
+        t_diffs = np.zeros(self.n_obs)
+        t_diffs[self.param_indices >= 0] = np.asarray(params, dtype=np.float64)[
+            self.param_indices[self.param_indices >= 0]]
 
-            # Add the total number of points to the cost counter
-            cost_point_count += len(z)
+        return self.base_residuals + t_diffs[self.stat_i] - t_diffs[self.stat_j]
 
 
-    # Exclude stations with no time overlap with other stations
-    if (len(observations) > 2):
-        confirmed_overlaps = list(set(confirmed_overlaps))
-        for obs in observations:
-            if obs.station_id not in confirmed_overlaps:
-                obs.ignore_station = True
-                obs.ignore_list = np.ones(len(obs.time_data), dtype=np.uint8)
 
+    def __call__(self, params, ret_stddev=False):
+        """ Evaluate the cost function. See timingResiduals for details. """
 
-    # If no points were compared, return infinite
-    if cost_point_count == 0:
-        return np.inf
+        # If no points were compared, return infinite
+        if self.cost_point_count == 0:
+            return np.inf
 
-    # Calculate the standard deviation of the fit
-    dist_stddev = np.sqrt(cost_sum/weights_sum/cost_point_count)
+        # Calculate the residuals using smooth approximation of L1 (absolute value) cost
+        z = self.residuals(params)**2
 
-    if ret_stddev:
+        # Calculate the cost function sum
+        cost_sum = np.sum(self.pair_weights*2*(np.sqrt(1 + z) - 1))
 
-        # Returned for reporting the goodness of fit
-        return dist_stddev
+        if ret_stddev:
 
-    else:
+            # Returned for reporting the goodness of fit
+            return np.sqrt(cost_sum/self.weights_sum/self.cost_point_count)
+
+        else:
+
+            # Returned for minimization
+            return cost_sum/self.weights_sum/self.cost_point_count
+
+
+
+    def grad(self, params):
+        """ Evaluate the analytic gradient of the cost function with respect to the timing differences. """
+
+        grad = np.zeros(self.n_obs - 1)
+
+        if self.cost_point_count == 0:
+            return grad
+
+        res = self.residuals(params)
+
+        # Derivative of the cost of every point with respect to its residual
+        dcost = self.pair_weights*2*res/np.sqrt(1 + res**2)/self.weights_sum/self.cost_point_count
+
+        # The residual increases with the timing difference of the first station and decreases with the 
+        #   timing difference of the second station
+        stat_grad = np.bincount(self.stat_i, weights=dcost, minlength=self.n_obs) \
+            - np.bincount(self.stat_j, weights=dcost, minlength=self.n_obs)
+
+        grad[self.param_indices[self.param_indices >= 0]] = stat_grad[self.param_indices >= 0]
+
+        return grad
+
+
+
+def timingResiduals(params, observations, t_ref_station, weights=None, ret_stddev=False):
+    """ Calculate the sum of absolute differences between timings of given stations using the length from
+        respective stations.
+
+        When the cost is evaluated many times for the same observations (e.g. during minimization), 
+        construct a TimingResiduals object once and call it instead.
+    
+    Arguments:
+        params: [ndarray] Timing differences from the reference station (NOTE: reference station should NOT be 
+            in this list).
+        observations: [list] A list of ObservedPoints objects.
+        t_ref_station: [int] Index of the reference station.
 
-        # Returned for minimization
-        return cost_sum/weights_sum/cost_point_count
+    Keyword arguments:
+        weights: [list] A list of statistical weights for every station.
+        ret_stddev: [bool] Returns the standard deviation instead of the cost function.
+    
+    Return:
+        [float] Average absolute difference between the timings from all stations using the length for
+            matching.
+
+    """
+
+    return TimingResiduals(observations, t_ref_station, weights=weights)(params, ret_stddev=ret_stddev)
 
 
 
@@ -1348,11 +1709,83 @@ MCUncertanties = MCUncertainties
 
 
 
+class MCOrbitRecord(object):
+
+    # Orbit parameters used for the estimation of MC uncertainties and covariances
+    __slots__ = ['ra', 'dec', 'v_avg', 'v_inf', 'azimuth_apparent', 'elevation_apparent', 'ra_norot', \
+        'dec_norot', 'v_avg_norot', 'v_init_norot', 'azimuth_apparent_norot', 'elevation_apparent_norot', \
+        'lon_ref', 'lat_ref', 'lat_geocentric', 'ht_ref', 'ra_g', 'dec_g', 'v_g', 'meteor_pos', 'zc', 'zg', \
+        'L_g', 'B_g', 'v_h', 'L_h', 'B_h', 'v_h_x', 'v_h_y', 'v_h_z', 'la_sun', 'a', 'e', 'i', 'peri', \
+        'node', 'pi', 'q', 'Q', 'true_anomaly', 'eccentric_anomaly', 'mean_anomaly', 'last_perihelion', 'n', \
+        'T', 'Tj']
+
+    def __init__(self, orbit=None):
+        """ Compact copy of the orbit parameters of one Monte Carlo run. 
+
+        Keyword arguments:
+            orbit: [Orbit object] Orbit from which the parameters will be taken. None by default, in which 
+                case all parameters are None.
+        """
+
+        for name in self.__slots__:
+            setattr(self, name, getattr(orbit, name, None))
+
+
+    def __getstate__(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+
+class MCResult(object):
+
+    # Trajectory parameters used for the estimation of MC uncertainties and covariances
+    __slots__ = ['run_id', 'seed', 'timing_res', 'los_mini_status', 'v_init', 'state_vect_mini', \
+        'radiant_eci_mini', 'rbeg_lon', 'rbeg_lat', 'rbeg_ele', 'rend_lon', 'rend_lat', 'rend_ele', 'orbit']
+
+    def __init__(self, traj, run_id=None, seed=None):
+        """ Compact result of one Monte Carlo run, which only contains the parameters needed to compute the
+            uncertainties and covariance matrices. It has the same attribute names as the Trajectory object,
+            so it can be used with calcMCUncertainties and calcCovMatrices in its place.
+
+        Arguments:
+            traj: [Trajectory object] Solved MC trajectory.
+
+        Keyword arguments:
+            run_id: [int] Number of the MC run. None by default, which indicates the original (noise-free)
+                trajectory.
+            seed: [int] Seed of the noise used in the MC run. None by default.
+        """
+
+        self.run_id = run_id
+        self.seed = seed
+
+        for name in self.__slots__[2:-1]:
+            setattr(self, name, getattr(traj, name, None))
+
+        self.orbit = MCOrbitRecord(traj.orbit)
+
+
+    def __getstate__(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+
 def calcMCUncertainties(traj_list, traj_best):
     """ Takes a list of trajectory objects and returns the standard deviation of every parameter. 
 
     Arguments:
-        traj_list: [list] A list of Trajectory objects, each is the result of an individual Monte Carlo run.
+        traj_list: [list] A list of Trajectory (or MCResult) objects, each is the result of an individual 
+            Monte Carlo run.
         traj_best: [Trajectory object] Trajectory which is chosen to the be the best of all MC runs.
 
     Return:
@@ -1493,7 +1926,7 @@ def calcCovMatrices(mc_traj_list):
         and meters per second.
 
     Arguments:
-        mc_traj_list: [list] A list of Trajectory objects from Monte Carlo runs.
+        mc_traj_list: [list] A list of Trajectory (or MCResult) objects from Monte Carlo runs.
 
 
     Return:
@@ -1545,106 +1978,133 @@ def calcCovMatrices(mc_traj_list):
 
 
 
-def trajNoiseGenerator(traj, noise_sigma):
-    """ Given a base trajectory object and the observation uncertainly, this generator will generate
-        new trajectory objects with noise-added obsevations. 
+def addTrajectoryNoise(traj, noise_sigma, seed=None):
+    """ Given a base trajectory object and the observation uncertainly, make a copy of the trajectory with 
+        noise-added observations.
     
     Arguments:
         traj: [Trajectory] Trajectory instance.
         noise_sigma: [float] Standard deviations of noise to add to the data.
 
-    Yields:
-        [counter, traj_mc, traj.observations]:
-            - counter: [int] Number of trajectories generated since the generator init.
-            - traj_mc: [Trajectory] Trajectory object with added noise
-            - traj.observations: [list] A list of original noise-free ObservedPoints.
+    Keyword arguments:
+        seed: [int] Seed for the random noise. None by default, in which case the global numpy random
+            generator is used. For the same seed, the same noise will always be generated.
+
+    Return:
+        (traj_mc, orig_observations):
+            - traj_mc: [Trajectory] Trajectory object with added noise.
+            - orig_observations: [list] A copy of the original noise-free ObservedPoints.
     """
 
+    # Init the random generator
+    if seed is None:
+        random_gen = np.random
+    else:
+        random_gen = np.random.RandomState(seed)
 
-    counter = 0
+    # Make a copy of the original trajectory object
+    traj_mc = copy.deepcopy(traj)
 
-    # Do mc_runs Monte Carlo runs
-    while True:
+    # Keep the copy of the original observations
+    orig_observations = traj_mc.observations
 
-        # Make a copy of the original trajectory object
-        traj_mc = copy.deepcopy(traj)
+    # Set the measurement type to alt/az
+    traj_mc.meastype = 2
+    
+    # Reset the observation points
+    traj_mc.observations = []
 
-        # Set the measurement type to alt/az
-        traj_mc.meastype = 2
-        
-        # Reset the observation points
-        traj_mc.observations = []
+    # Reinitialize the observations with points sampled using a Gaussian kernel
+    for obs in orig_observations:
 
-        # Reinitialize the observations with points sampled using a Gaussian kernel
-        for obs in traj.observations:
+        # Unit vectors pointing from the station to the meteor observation points in ECI coordinates
+        rhat = obs.meas_eci_los/vectMag(obs.meas_eci_los)[:, np.newaxis]
 
+        ### Add noise to simulated coordinates (taken over from Gural solver source)
 
-            azim_noise_list = []
-            elev_noise_list = []
+        zhat = np.array([0.0, 0.0, 1.0])
+        uhat = np.cross(rhat, zhat)
+        uhat /= vectMag(uhat)[:, np.newaxis]
+        vhat = np.cross(uhat, rhat)
+        vhat /= vectMag(vhat)[:, np.newaxis]
 
-            # Go through all ECI unit vectors of measurement LoS, add the noise and calculate alt/az coords
-            for jd, rhat in zip(obs.JD_data, obs.meas_eci_los):
+        # # sqrt(2)/2*noise in each orthogonal dimension
+        # NOTE: This is a bad way to do it because the estimated fit residuals are already estimated
+        #   in the prependicular direction to the trajectory line
+        # sigma = noise_sigma*np.abs(obs.ang_res_std)/np.sqrt(2.0)
 
-                # Unit vector pointing from the station to the meteor observation point in ECI coordinates
-                rhat = vectNorm(rhat)
+        # # Make sure sigma is positive, if not set it to 1/sqrt(2) degrees
+        # if (sigma < 0) or np.isnan(sigma):
+        #     sigma = np.radians(1)/np.sqrt(2)
 
-                ### Add noise to simulated coordinates (taken over from Gural solver source)
+        # Compute noise level to add to observations
+        sigma = noise_sigma*np.abs(obs.ang_res_std)
 
-                zhat = np.array([0.0, 0.0, 1.0])
-                uhat = vectNorm(np.cross(rhat, zhat))
-                vhat = vectNorm(np.cross(uhat, rhat))
+        # Make sure sigma is positive, if not set it to 1 degree
+        if (sigma < 0) or np.isnan(sigma):
+            sigma = np.radians(1)
 
-                # # sqrt(2)/2*noise in each orthogonal dimension
-                # NOTE: This is a bad way to do it because the estimated fit residuals are already estimated
-                #   in the prependicular direction to the trajectory line
-                # sigma = noise_sigma*np.abs(obs.ang_res_std)/np.sqrt(2.0)
+        # Add noise to observations (the noise in both directions is drawn point by point)
+        noise = random_gen.normal(0, sigma, size=(len(rhat), 2))
+        meas_eci_noise = rhat + noise[:, 0:1]*uhat + noise[:, 1:2]*vhat
 
-                # # Make sure sigma is positive, if not set it to 1/sqrt(2) degrees
-                # if (sigma < 0) or np.isnan(sigma):
-                #     sigma = np.radians(1)/np.sqrt(2)
+        # Normalize to unit vectors
+        meas_eci_noise /= vectMag(meas_eci_noise)[:, np.newaxis]
 
-                # Compute noise level to add to observations
-                sigma = noise_sigma*np.abs(obs.ang_res_std)
+        ###
 
-                # Make sure sigma is positive, if not set it to 1 degree
-                if (sigma < 0) or np.isnan(sigma):
-                    sigma = np.radians(1)
+        # Calculate RA, Dec for the given points
+        ra = np.arctan2(meas_eci_noise[:, 1], meas_eci_noise[:, 0])%(2*np.pi)
+        dec = np.arcsin(meas_eci_noise[:, 2])
 
-                # Add noise to observations
-                meas_eci_noise = rhat + np.random.normal(0, sigma)*uhat + np.random.normal(0, sigma)*vhat
+        # Calculate azimuth and altitude of the direction vectors
+        azim_noise, elev_noise = raDec2AltAz_vect(ra, dec, obs.JD_data, obs.lat, obs.lon)
 
-                # Normalize to a unit vector
-                meas_eci_noise = vectNorm(meas_eci_noise)
+    
+        # Fill in the new trajectory object - the time is assumed to be absolute
+        traj_mc.infillTrajectory(azim_noise, elev_noise, obs.time_data, obs.lat, obs.lon, \
+            obs.ele, station_id=obs.station_id, excluded_time=obs.excluded_time, \
+            ignore_list=obs.ignore_list, magnitudes=obs.magnitudes, fov_beg=obs.fov_beg, \
+            fov_end=obs.fov_end, obs_id=obs.obs_id)
 
-                ###
+        
+    # Do not show plots or perform additional optimizations
+    traj_mc.verbose = False
+    traj_mc.estimate_timing_vel = True
+    traj_mc.filter_picks = False
+    traj_mc.show_plots = False
+    traj_mc.save_results = False
 
-                # Calculate RA, Dec for the given point
-                ra, dec = eci2RaDec(meas_eci_noise)
+    return traj_mc, orig_observations
 
-                # Calculate azimuth and altitude of this direction vector
-                azim, elev = raDec2AltAz(ra, dec, jd, obs.lat, obs.lon)
 
-                azim_noise_list.append(azim)
-                elev_noise_list.append(elev)
 
-        
-        
-            # Fill in the new trajectory object - the time is assumed to be absolute
-            traj_mc.infillTrajectory(azim_noise_list, elev_noise_list, obs.time_data, obs.lat, obs.lon, \
-                obs.ele, station_id=obs.station_id, excluded_time=obs.excluded_time, \
-                ignore_list=obs.ignore_list, magnitudes=obs.magnitudes, fov_beg=obs.fov_beg, \
-                fov_end=obs.fov_end, obs_id=obs.obs_id)
+def trajNoiseGenerator(traj, noise_sigma):
+    """ Given a base trajectory object and the observation uncertainly, this generator will generate
+        new trajectory objects with noise-added obsevations. 
+    
+    Arguments:
+        traj: [Trajectory] Trajectory instance.
+        noise_sigma: [float] Standard deviations of noise to add to the data.
 
-            
-        # Do not show plots or perform additional optimizations
-        traj_mc.verbose = False
-        traj_mc.estimate_timing_vel = True
-        traj_mc.filter_picks = False
-        traj_mc.show_plots = False
-        traj_mc.save_results = False
+    Yields:
+        [counter, traj_mc, orig_observations]:
+            - counter: [int] Number of trajectories generated since the generator init.
+            - traj_mc: [Trajectory] Trajectory object with added noise
+            - orig_observations: [list] A list of original noise-free ObservedPoints.
+    """
+
+
+    counter = 0
+
+    # Do mc_runs Monte Carlo runs
+    while True:
+
+        # Make a noisy copy of the original trajectory object
+        traj_mc, orig_observations = addTrajectoryNoise(traj, noise_sigma)
 
         # Return the modified trajectory object
-        yield [counter, traj_mc, traj.observations]
+        yield [counter, traj_mc, orig_observations]
 
         counter += 1
 
@@ -1654,7 +2114,7 @@ def checkMCTrajectories(mc_results, timing_res=np.inf, geometric_uncert=False):
     """ Filter out MC computed trajectories and only return successful ones. 
     
     Arguments:
-        mc_results: [list] A list of Trajectory objects computed with added noise.
+        mc_results: [list] A list of Trajectory (or MCResult) objects computed with added noise.
 
     Keyword arguments:
         timing_res: [float] Timing residual from the original LoS trajectory fit.
@@ -1713,8 +2173,327 @@ def _MCTrajSolve(params):
 
 
 
+# Noise-free trajectory cached in every MC worker process, together with the key of the MC run it belongs to
+_mc_worker_base = {"key": None, "traj": None}
+
+
+def _MCTrajSolveSeed(params):
+    """ Internal function. Does a Monte Carlo run of the base trajectory cached in the worker process. The
+        base trajectory is loaded from disk only the first time the worker gets a task for the given key, 
+        so every task only carries the noise seed.
+
+    Arguments:
+        params: [list]
+            - i: [int] Number of MC run to be printed out.
+            - base_key: [str] Unique key of the base trajectory.
+            - base_path: [str] Path to the pickle file with the base trajectory.
+            - seed: [int] Seed of the random noise.
+            - noise_sigma: [float] Standard deviations of noise to add to the data.
+
+    Return:
+        [MCResult object] Compact result of the MC solution.
+
+    """
+
+    i, base_key, base_path, seed, noise_sigma = params
+
+    # Load the base trajectory if this worker has not seen it yet
+    if _mc_worker_base["key"] != base_key:
+        _mc_worker_base["traj"] = loadPickle(*os.path.split(base_path))
+        _mc_worker_base["key"] = base_key
+
+    # Generate the noisy trajectory
+    traj_mc, orig_observations = addTrajectoryNoise(_mc_worker_base["traj"], noise_sigma, seed=seed)
+
+    traj_mc = _MCTrajSolve([i, traj_mc, orig_observations])
+
+    return MCResult(traj_mc, run_id=i, seed=seed)
+
+
+
+class MCExecutor(object):
+    def __init__(self, n_proc=None):
+        """ A long-lived pool of worker processes for Monte Carlo runs, which can be reused between 
+            trajectories. The noise-free base trajectory is shipped to the workers only once per trajectory
+            (through a temporary file), and the individual MC tasks only carry a noise seed.
+
+        Keyword arguments:
+            n_proc: [int] Number of worker processes. None by default, in which case all available CPU cores
+                will be used. If 1, the MC runs are done in the current process.
+
+        """
+
+        if n_proc is None:
+            n_proc = multiprocessing.cpu_count()
+
+        self.n_proc = n_proc
+
+        # The pool is started on the first use
+        self.pool = None
+
+        # Directory where base trajectories are stored for the workers
+        self.temp_dir = None
+
+        # Key and file path of the current base trajectory
+        self.base_key = None
+        self.base_path = None
+
+
+    def setBaseTrajectory(self, traj):
+        """ Store the noise-free trajectory on which the MC runs will be done. """
+
+        self.clearBaseTrajectory()
+
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix='wmpl_mc_')
+
+        self.base_key = uuid.uuid4().hex
+        file_name = self.base_key + '_trajectory.pickle'
+
+        savePickle(traj, self.temp_dir, file_name)
+        self.base_path = os.path.join(self.temp_dir, file_name)
+
+
+    def clearBaseTrajectory(self):
+        """ Remove the stored base trajectory. """
+
+        if (self.base_path is not None) and os.path.isfile(self.base_path):
+            os.remove(self.base_path)
+
+        self.base_key = None
+        self.base_path = None
+
+
+    def taskGenerator(self, noise_sigma, seed=None):
+        """ Generate inputs for _MCTrajSolveSeed for the current base trajectory. 
+    
+        Arguments:
+            noise_sigma: [float] Standard deviations of noise to add to the data.
+
+        Keyword arguments:
+            seed: [int] Seed from which the noise seeds of individual runs are drawn. None by default, in 
+                which case the seeds are random.
+
+        Yields:
+            [list] Parameters of one MC run, see _MCTrajSolveSeed.
+        """
+
+        seed_gen = np.random.RandomState(seed)
+
+        counter = 0
+
+        while True:
+
+            yield [counter, self.base_key, self.base_path, seed_gen.randint(0, 2**31 - 1), noise_sigma]
+
+            counter += 1
+
+
+    def map(self, func, input_list):
+        """ Run the given function on all inputs, in parallel if more than one process is used. """
+
+        if self.n_proc == 1:
+            return [func(params) for params in input_list]
+
+        # Start the pool on the first use
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(processes=self.n_proc)
+
+        return self.pool.map(func, input_list)
+
+
+    def close(self):
+        """ Stop the worker processes and remove temporary files. """
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+        self.clearBaseTrajectory()
+
+        if (self.temp_dir is not None) and os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+        self.temp_dir = None
+
+
+
+# Module-level MC executor which is reused between trajectories, see getMCExecutor
+_mc_executor = None
+
+
+def getMCExecutor(n_proc=None):
+    """ Return the module-level MC executor. It is created on the first call, and recreated only if a 
+        different number of processes is requested.
+
+    Keyword arguments:
+        n_proc: [int] Number of worker processes. None by default, in which case all available CPU cores
+            will be used.
+
+    Return:
+        [MCExecutor] Module-level MC executor.
+    """
+
+    global _mc_executor
+
+    if n_proc is None:
+        n_proc = multiprocessing.cpu_count()
+
+    if (_mc_executor is None) or (_mc_executor.n_proc != n_proc):
+
+        if _mc_executor is not None:
+            _mc_executor.close()
+
+        _mc_executor = MCExecutor(n_proc=n_proc)
+
+    return _mc_executor
+
+
+
+def _closeMCExecutor():
+    """ Close the module-level MC executor on exit. """
+
+    if _mc_executor is not None:
+        _mc_executor.close()
+
+
+atexit.register(_closeMCExecutor)
+
+
+
+def mcConvergenceStats(traj_list):
+    """ Compute the standard deviations of key parameters of MC trajectories, used to judge whether the 
+        Monte Carlo uncertainties have converged.
+
+    Arguments:
+        traj_list: [list] A list of Trajectory objects, each is the result of an individual Monte Carlo run.
+
+    Return:
+        [ndarray] Standard deviations of the initial velocity, the state vector, the radiant ECI vector, and, 
+            if the orbits were computed, of the geocentric radiant and velocity and of the orbital elements
+            (q, e, i, peri, node).
+    """
+
+    stds = [np.std([traj.v_init for traj in traj_list])]
+
+    # State vector and the radiant
+    stds += list(np.std([traj.state_vect_mini for traj in traj_list], axis=0))
+    stds += list(np.std([traj.radiant_eci_mini for traj in traj_list], axis=0))
+
+    # Geocentric radiant and orbital elements
+    if all([(traj.orbit is not None) and (traj.orbit.ra_g is not None) for traj in traj_list]):
+
+        stds.append(scipy.stats.circstd([traj.orbit.ra_g for traj in traj_list]))
+        stds.append(np.std([traj.orbit.dec_g for traj in traj_list]))
+        stds.append(np.std([traj.orbit.v_g for traj in traj_list]))
+
+        stds.append(np.std([traj.orbit.q for traj in traj_list]))
+        stds.append(np.std([traj.orbit.e for traj in traj_list]))
+        stds.append(np.std([traj.orbit.i for traj in traj_list]))
+        stds.append(scipy.stats.circstd([traj.orbit.peri for traj in traj_list]))
+        stds.append(scipy.stats.circstd([traj.orbit.node for traj in traj_list]))
+
+
+    return np.array(stds, dtype=np.float64)
+
+
+
+def adaptiveMonteCarloRuns(traj_generator, mc_executor, mc_runs, results_check_kwagrs, batch_size=20, \
+    tolerance=0.05):
+    """ Run MC solutions in batches until the standard deviations of the key parameters converge, or until
+        mc_runs successful runs are done.
+
+        After every batch the relative change of the standard deviations (see mcConvergenceStats) is 
+        computed. The runs are stopped when the largest relative change was below the tolerance after two
+        consecutive batches. The uncertainties are compared from the second batch on, so the earliest stop 
+        is after three batches, i.e. at least 3*batch_size successful runs are done (with the batch size 
+        after rounding, see below).
+
+    Arguments:
+        traj_generator: [generator] Generator of MC tasks, see MCExecutor.taskGenerator.
+        mc_executor: [MCExecutor] Executor on which the MC runs will be done.
+        mc_runs: [int] Maximum number of successful MC runs.
+        results_check_kwagrs: [dict] Keyword arguments for checkMCTrajectories.
+
+    Keyword arguments:
+        batch_size: [int] Number of successful MC runs in every batch. 20 by default. The batch is rounded
+            up to a multiple of the number of executor processes, so no cores are left idle, but not above
+            a third of mc_runs, so that the runs can still stop early on machines with many cores.
+        tolerance: [float] Relative change of standard deviations between batches below which the 
+            uncertainties are considered to be converged. 0.05 (5%) by default.
+
+    Return:
+        mc_results: [list] A list of successful MC trajectories.
+    """
+
+    # Make sure there are at least enough runs in a batch to compute the standard deviation
+    batch_size = max(int(batch_size), 2)
+
+    # Use all cores in every batch, as the results computed beyond the batch size would be discarded. Don't
+    #   round beyond a third of all runs, as the earliest stop is after three batches
+    n_proc = max(int(mc_executor.n_proc), 1)
+    batch_size = min(int(np.ceil(batch_size/n_proc)*n_proc), max(batch_size, int(mc_runs)//3))
+
+    mc_results = []
+    stds_prev = None
+    converged_batches = 0
+
+    while len(mc_results) < mc_runs:
+
+        # Run a new batch of MC solutions
+        batch_runs = min(batch_size, mc_runs - len(mc_results))
+        batch_results = parallelComputeGenerator(traj_generator, _MCTrajSolveSeed, checkMCTrajectories, \
+            batch_runs, n_proc=mc_executor.n_proc, results_check_kwagrs=results_check_kwagrs, \
+            pool=mc_executor)
+
+        # Stop if the batch failed completely
+        if len(batch_results) == 0:
+            break
+
+        mc_results += batch_results
+
+        if len(mc_results) < 2:
+            continue
+
+
+        # Compute the relative change of the standard deviations
+        stds = mcConvergenceStats(mc_results)
+
+        if (stds_prev is not None) and (len(stds) == len(stds_prev)):
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rel_change = np.abs(stds - stds_prev)/stds_prev
+
+            # Parameters with no spread are considered converged
+            rel_change[(stds == 0) & (stds_prev == 0)] = 0
+            rel_change[~np.isfinite(rel_change)] = np.inf
+
+            max_rel_change = np.max(rel_change)
+
+            print("Max relative change of MC uncertainties after {:d} runs: {:.2%}".format(len(mc_results), 
+                max_rel_change))
+
+            if max_rel_change < tolerance:
+                converged_batches += 1
+            else:
+                converged_batches = 0
+
+            # Stop if the uncertainties did not change after two batches
+            if converged_batches >= 2:
+                print("MC uncertainties converged after {:d} runs!".format(len(mc_results)))
+                break
+
+        stds_prev = stds
+
+
+    return mc_results
+
+
+
 def monteCarloTrajectory(traj, mc_runs=None, mc_pick_multiplier=1, noise_sigma=1, geometric_uncert=False, \
-    plot_results=True, mc_cores=None):
+    plot_results=True, mc_cores=None, mc_executor=None, mc_seed=None, mc_adaptive=False, \
+    mc_adaptive_batch=20, mc_adaptive_tol=0.05):
     """ Estimates uncertanty in the trajectory solution by doing Monte Carlo runs. The MC runs are done 
         in parallel on all available computer cores.
 
@@ -1736,6 +2515,19 @@ def monteCarloTrajectory(traj, mc_runs=None, mc_pick_multiplier=1, noise_sigma=1
         plot_results: [bool] Plot the trajectory and orbit spread. True by default.
         mc_cores: [int] Number of CPU cores to use for Monte Carlo parallel procesing. None by default,
             which means that all available cores will be used.
+        mc_executor: [MCExecutor] Executor on which the MC runs will be done. None by default, in which case
+            the module-level executor with mc_cores processes will be used (see getMCExecutor).
+        mc_seed: [int] Seed for the noise added in MC runs. The MC results are reproducible for the same 
+            seed. None by default, in which case a random seed is drawn. The used seed is stored in the 
+            mc_seed attribute of the returned trajectory.
+        mc_adaptive: [bool] If True, the MC runs will be done in batches and stopped once the uncertainties
+            converge (see adaptiveMonteCarloRuns). The number of runs computed from mc_runs or
+            mc_pick_multiplier is then used as the maximum. False by default.
+        mc_adaptive_batch: [int] Number of successful MC runs in one batch in the adaptive mode. 20 by 
+            default, rounded up to a multiple of mc_cores (at most to a third of the runs). The adaptive
+            mode does at least three batches.
+        mc_adaptive_tol: [float] Relative change of uncertainties between batches below which the adaptive 
+            MC runs are stopped. 0.05 by default.
     """
 
 
@@ -1755,17 +2547,40 @@ def monteCarloTrajectory(traj, mc_runs=None, mc_pick_multiplier=1, noise_sigma=1
         mc_runs = mc_runs*mc_pick_multiplier
 
 
-    print("Doing", mc_runs, "successful Monte Carlo runs...")
+    if mc_adaptive:
+        print("Doing at most", mc_runs, "successful Monte Carlo runs until the uncertainties converge...")
+    else:
+        print("Doing", mc_runs, "successful Monte Carlo runs...")
+
+
+    # Use the module-level executor if none was given
+    if mc_executor is None:
+        mc_executor = getMCExecutor(n_proc=mc_cores)
+
+    # Draw a random seed if it was not given, so the run can be reproduced
+    if mc_seed is None:
+        mc_seed = np.random.randint(0, 2**31 - 1)
+
+    # Ship the noise-free trajectory to the workers and init the generator of MC tasks
+    mc_executor.setBaseTrajectory(traj)
+    traj_generator = mc_executor.taskGenerator(noise_sigma, seed=mc_seed)
+
+    
+    def _runMC(results_check_kwagrs):
 
+        if mc_adaptive:
+            return adaptiveMonteCarloRuns(traj_generator, mc_executor, mc_runs, results_check_kwagrs, \
+                batch_size=mc_adaptive_batch, tolerance=mc_adaptive_tol)
 
-    # Init the trajectory noise generator
-    traj_generator = trajNoiseGenerator(traj, noise_sigma)
+        else:
+            return parallelComputeGenerator(traj_generator, _MCTrajSolveSeed, checkMCTrajectories, \
+                mc_runs, n_proc=mc_executor.n_proc, results_check_kwagrs=results_check_kwagrs, \
+                pool=mc_executor)
 
     
     # Run the MC solutions
     results_check_kwagrs = {"timing_res": traj.timing_res, "geometric_uncert": geometric_uncert}
-    mc_results = parallelComputeGenerator(traj_generator, _MCTrajSolve, checkMCTrajectories, mc_runs, \
-        results_check_kwagrs=results_check_kwagrs)
+    mc_results = _runMC(results_check_kwagrs)
 
 
     # If there are no MC runs which were successful, recompute using geometric uncertainties
@@ -1775,13 +2590,16 @@ def monteCarloTrajectory(traj, mc_runs=None, mc_pick_multiplier=1, noise_sigma=1
         # Run the MC solutions
         geometric_uncert = True
         results_check_kwagrs["geometric_uncert"] = geometric_uncert
-        mc_results = parallelComputeGenerator(traj_generator, _MCTrajSolve, checkMCTrajectories, mc_runs, \
-            results_check_kwagrs=results_check_kwagrs)
+        mc_results = _runMC(results_check_kwagrs)
+
+
+    # The base trajectory is not needed by the workers anymore
+    mc_executor.clearBaseTrajectory()
 
 
     # Add the original trajectory in the Monte Carlo results, if it is the one which has the best length match
     if traj.orbit.ra_g is not None:
-        mc_results.append(traj)
+        mc_results.append(MCResult(traj))
 
     
     ##########################################################################################################
@@ -1798,11 +2616,23 @@ def monteCarloTrajectory(traj, mc_runs=None, mc_pick_multiplier=1, noise_sigma=1
     best_traj_ind = timing_res_trajs.index(min(timing_res_trajs))
 
     # Choose the best trajectory
-    traj_best = mc_results[best_traj_ind]
+    best_result = mc_results[best_traj_ind]
+
+    # Only the summaries of MC runs are returned by the workers, so recompute the full solution of the best
+    #   run (the noise is fully determined by the seed)
+    if best_result.run_id is None:
+        traj_best = traj
+
+    else:
+        traj_mc, orig_observations = addTrajectoryNoise(traj, noise_sigma, seed=best_result.seed)
+        traj_best = _MCTrajSolve([best_result.run_id, traj_mc, orig_observations])
 
     # Assign geometric uncertainty flag, if it was changed
     traj_best.geometric_uncert = geometric_uncert
 
+    # Store the seed of MC runs
+    traj_best.mc_seed = mc_seed
+
     print('Computing uncertainties...')
 
     # Calculate the standard deviation of every trajectory parameter
@@ -2081,7 +2911,8 @@ class Trajectory(object):
         v_init_ht=None, estimate_timing_vel=True, monte_carlo=True, mc_runs=None, mc_pick_multiplier=1, \
         mc_noise_std=1.0, geometric_uncert=False, filter_picks=True, calc_orbit=True, show_plots=True, \
         save_results=True, gravity_correction=True, plot_all_spatial_residuals=False, plot_file_type='png', \
-        traj_id=None, reject_n_sigma_outliers=3, mc_cores=None):
+        traj_id=None, reject_n_sigma_outliers=3, mc_cores=None, los_analytic_gradient=False, mc_seed=None, \
+        mc_adaptive=False, mc_adaptive_batch=20, mc_adaptive_tol=0.05, v_init_fast_fit=False):
         """ Init the Ceplecha trajectory solver.
 
         Arguments:
@@ -2132,6 +2963,25 @@ class Trajectory(object):
                 This value is 3 (sigma) by default.
             mc_cores: [int] Number of CPU cores to use for Monte Carlo parallell processing. None by default,
                 which means that all cores will be used.
+            los_analytic_gradient: [bool] If True, the lines of sight minimization will be done with the 
+                gradient-based L-BFGS-B method using the analytic gradient of the cost function, which needs
+                several times fewer cost function evaluations than Nelder-Mead. If it fails, Nelder-Mead is
+                used. False by default.
+            mc_seed: [int] Seed for the noise added during Monte Carlo runs. If given, the MC results are 
+                reproducible. None by default, in which case a random seed is used and stored to the best
+                MC trajectory.
+            mc_adaptive: [bool] If True, the Monte Carlo runs are done in batches and stopped once the 
+                uncertainties converge, with mc_runs (or the number of points times mc_pick_multiplier) as
+                the maximum number of runs. False by default.
+            mc_adaptive_batch: [int] Number of successful MC runs per batch in the adaptive mode. 20 by 
+                default, rounded up to a multiple of the number of MC cores (at most to a third of the 
+                runs). The adaptive mode does at least three batches.
+            mc_adaptive_tol: [float] Relative change of MC uncertainties between batches below which the
+                adaptive MC is stopped. 0.05 (5%) by default.
+            v_init_fast_fit: [bool] If True, the lines on all portions of the trajectory used for the initial
+                velocity estimation will be fitted at once using the iteratively reweighted linear regression
+                (see fitLinesSoftL1), instead of calling the least squares solver for every portion. False
+                by default.
 
         """
 
@@ -2211,6 +3061,20 @@ class Trajectory(object):
         # Number of CPU cores to be used for MC
         self.mc_cores = mc_cores
 
+        # Use the analytic gradient for the LoS minimization
+        self.los_analytic_gradient = los_analytic_gradient
+
+        # Seed for the Monte Carlo noise
+        self.mc_seed = mc_seed
+
+        # Adaptive Monte Carlo settings
+        self.mc_adaptive = mc_adaptive
+        self.mc_adaptive_batch = mc_adaptive_batch
+        self.mc_adaptive_tol = mc_adaptive_tol
+
+        # Fit the initial velocity on all portions of the trajectory at once
+        self.v_init_fast_fit = v_init_fast_fit
+
         ######################################################################################################
 
 
@@ -2470,26 +3334,25 @@ class Trajectory(object):
 
         """
 
-        # Go though observations from all stations
-        for obs in observations:
-
-            # Init empty lists for residuals
-            obs.h_residuals = []
-            obs.v_residuals = []
+        if not observations:
+            return None
 
-            # Go through all individual position measurement from each site
-            for t, jd, stat, meas in zip(obs.time_data, obs.JD_data, obs.stat_eci_los, obs.meas_eci_los):
+        # Calculate horizontal and vertical residuals of points from all stations at once
+        h_residuals, v_residuals = calcSpatialResidualsVect(
+            np.concatenate([obs.JD_data for obs in observations]), state_vect, radiant_eci, 
+            np.concatenate([obs.stat_eci_los for obs in observations]), 
+            np.concatenate([obs.meas_eci_los for obs in observations]))
 
-                # Calculate horizontal and vertical residuals
-                hres, vres = calcSpatialResidual(jd, state_vect, radiant_eci, stat, meas)
+        # Split the residuals per station
+        split_indices = np.cumsum([len(obs.JD_data) for obs in observations])[:-1]
+        h_residuals = np.split(h_residuals, split_indices)
+        v_residuals = np.split(v_residuals, split_indices)
 
-                # Add residuals to the residual list
-                obs.h_residuals.append(hres)
-                obs.v_residuals.append(vres)
+        # Go though observations from all stations
+        for obs, h_res, v_res in zip(observations, h_residuals, v_residuals):
 
-            # Convert residual lists to numpy arrays
-            obs.h_residuals = np.array(obs.h_residuals)
-            obs.v_residuals = np.array(obs.v_residuals)
+            obs.h_residuals = h_res
+            obs.v_residuals = v_res
 
             # Calculate RMSD of both residuals
             obs.h_res_rms = RMSD(obs.h_residuals[obs.ignore_list == 0])
@@ -2874,9 +3737,11 @@ class Trajectory(object):
         # self.t_ref_station = obs_points.index(max(obs_points))
 
 
+        # Precompute the timing residuals cost function
+        timing_residuals = TimingResiduals(observations, self.t_ref_station, weights=weights)
+
         if self.verbose:
-            print('Initial function evaluation:', timingResiduals(p0, observations, self.t_ref_station, 
-                weights=weights))
+            print('Initial function evaluation:', timing_residuals(p0))
 
 
         # Set bounds for timing to +/- given maximum time offset
@@ -2891,9 +3756,8 @@ class Trajectory(object):
         for opt_method, maxiter in zip(methods, maxiter_list):
 
             # Run the minimization of residuals between all stations (set tolerance to 1 ns)
-            timing_mini = scipy.optimize.minimize(timingResiduals, p0, args=(observations, \
-                self.t_ref_station, weights), bounds=bounds, method=opt_method, options={'maxiter': maxiter}, \
-                tol=1e-9)
+            timing_mini = scipy.optimize.minimize(timing_residuals, p0, jac=timing_residuals.grad, \
+                bounds=bounds, method=opt_method, options={'maxiter': maxiter}, tol=1e-9)
 
             # Stop trying methods if this one was successful
             if timing_mini.success:
@@ -2975,6 +3839,7 @@ class Trajectory(object):
             stddev_list = []
 
             # Calculate the velocity on different initial portions of the trajectory
+            fit_windows = []
 
             # Find the best fit by starting from the first few beginning points
             for part_beg in range(4):
@@ -2994,6 +3859,45 @@ class Trajectory(object):
                     if part_end >= len(times):
                         part_end = len(times) - 1
 
+                    fit_windows.append([part_beg, part_end])
+
+
+            # Fit all portions of the trajectory at once using the robust linear regression
+            if self.v_init_fast_fit and fit_windows:
+
+                # Select points of every portion
+                point_indices = np.arange(len(times))
+                fit_windows_arr = np.array(fit_windows)
+                window_masks = (point_indices >= fit_windows_arr[:, :1]) \
+                    & (point_indices < fit_windows_arr[:, 1:])
+
+                # Fit lines to time vs. state_vect_dist
+                velocity_fits = fitLinesSoftL1(times, state_vect_dist, weight_list, window_masks)
+
+                # Calculate the lags and fit lines to them
+                lags = state_vect_dist - (velocity_fits[:, :1]*times + velocity_fits[:, 1:])
+                lag_fits = fitLinesSoftL1(times, lags, weight_list, np.ones_like(lags, dtype=bool))
+
+                for (part_beg, part_end), velocity_fit, lag_fit in zip(fit_windows, velocity_fits, lag_fits):
+
+                    # Skip degenerate fits
+                    if np.any(np.isnan(velocity_fit)):
+                        continue
+
+                    # Add the point to the considered list only if the lag has a negative trend, or a trend
+                    #   that is not *too* positive, about 100 m per second is the limit
+                    if lag_fit[0] <= 100:
+
+                        # Calculate the standard deviation of the line fit and add it to the list of solutions
+                        line_stddev = RMSD(state_vect_dist[part_beg:part_end] \
+                            - lineFunc(times[part_beg:part_end], *velocity_fit), \
+                            weights=weight_list[part_beg:part_end])
+                        stddev_list.append([line_stddev, velocity_fit])
+
+
+            else:
+
+                for part_beg, part_end in fit_windows:
 
                     # Select only the first part of all points
                     times_part = times[part_beg:part_end]
@@ -5195,10 +6099,12 @@ class Trajectory(object):
         ### LEAST SQUARES SOLUTION ###
         ######################################################################################################
 
+        # Stack the lines of sight from all stations into arrays only once for the whole minimization
+        stacked_observations = StackedObservations(self.observations, weights=weights)
+
         # Calculate the initial sum and angles deviating from the radiant line
-        angle_sum = angleSumMeasurements2Line(self.observations, self.state_vect, \
-             self.best_conv_inter.radiant_eci, weights=weights, \
-             gravity=(_rerun_timing and self.gravity_correction))
+        angle_sum = angleSumMeasurements2Line(stacked_observations, self.state_vect, \
+             self.best_conv_inter.radiant_eci, gravity=(_rerun_timing and self.gravity_correction))
 
         if self.verbose:
             print('Initial angle sum:', angle_sum)
@@ -5207,10 +6113,33 @@ class Trajectory(object):
         # Set the initial guess for the state vector and the radiant from the intersecting plane solution
         p0 = np.r_[self.state_vect, self.best_conv_inter.radiant_eci]
 
+        minimize_solution = None
+
+        # Perform the minimization of angle deviations using the analytic gradient
+        if self.los_analytic_gradient:
+
+            # Express the state vector in units of the average range from stations, so all parameters are
+            #   of a similar magnitude and have similar partial derivatives
+            param_scale = np.r_[np.zeros(3) + np.mean(vectMag(stacked_observations.stat_eci_los \
+                - self.state_vect)), np.ones(3)]
+
+            minimize_solution = scipy.optimize.minimize(\
+                lambda x: minimizeAngleCost(x*param_scale, stacked_observations, None, \
+                    (_rerun_timing and self.gravity_correction)), p0/param_scale, 
+                jac=lambda x: param_scale*minimizeAngleCostGrad(x*param_scale, stacked_observations, None, \
+                    (_rerun_timing and self.gravity_correction)), method="L-BFGS-B")
+
+            minimize_solution.x = minimize_solution.x*param_scale
+
+            if not minimize_solution.success:
+                print('Gradient LoS minimization failed, using Nelder-Mead...')
+
+
         # Perform the minimization of angle deviations. The gravity will only be compansated for after the
         #   initial estimate of timing differences
-        minimize_solution = scipy.optimize.minimize(minimizeAngleCost, p0, args=(self.observations, weights, 
-            (_rerun_timing and self.gravity_correction)), method="Nelder-Mead")
+        if (minimize_solution is None) or (not minimize_solution.success):
+            minimize_solution = scipy.optimize.minimize(minimizeAngleCost, p0, args=(stacked_observations, \
+                None, (_rerun_timing and self.gravity_correction)), method="Nelder-Mead")
 
         # NOTE
         # Other minimization methods were tried as well, but all produce higher fit residuals than Nelder-Mead.
@@ -5237,8 +6166,8 @@ class Trajectory(object):
 
             print('BOUNDS:', bounds)
             print('p0:', p0)
-            minimize_solution = scipy.optimize.minimize(minimizeAngleCost, p0, args=(self.observations, \
-                weights, (_rerun_timing and self.gravity_correction)), bounds=bounds, method='SLSQP')
+            minimize_solution = scipy.optimize.minimize(minimizeAngleCost, p0, args=(stacked_observations, \
+                None, (_rerun_timing and self.gravity_correction)), bounds=bounds, method='SLSQP')
 
 
         if self.verbose:
@@ -5610,7 +6539,8 @@ class Trajectory(object):
             traj_best, uncertainties = monteCarloTrajectory(self, mc_runs=self.mc_runs, \
                 mc_pick_multiplier=self.mc_pick_multiplier, noise_sigma=self.mc_noise_std, \
                 geometric_uncert=self.geometric_uncert, plot_results=self.save_results, \
-                mc_cores=self.mc_cores)
+                mc_cores=self.mc_cores, mc_seed=self.mc_seed, mc_adaptive=self.mc_adaptive, \
+                mc_adaptive_batch=self.mc_adaptive_batch, mc_adaptive_tol=self.mc_adaptive_tol)
 
 
             # Set the covariance matrix to the initial trajectory, so it will be reported in the report
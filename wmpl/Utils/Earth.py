@@ -3,12 +3,13 @@
 from __future__ import print_function, division, absolute_import
 
 import os
+import collections
+
 import numpy as np
-import math
 from jplephem.spk import SPK
 
 import wmpl.Utils.TrajConversions
-from wmpl.Utils.Math import rotateVector
+from wmpl.Config import config
 
 
 
@@ -18,8 +19,15 @@ class VSOP87:
 
         self.file_name = file_name
 
-        # List of fitted parameters
-        self.fit_list = []
+        # Parsed coefficients are cached next to the VSOP87 file in the numpy format, for faster loading
+        self.npy_file = os.path.splitext(file_name)[0] + '.npy'
+
+        # Array of fitted parameters, with [p, q, A, B, C] rows sorted by p and q
+        self.terms = None
+
+        # Fitted parameters grouped by coordinate and time power, as a list of (p, q, A, B, C) tuples where 
+        # A, B, C are arrays
+        self.groups = []
 
         self.loadVSOP87()
 
@@ -27,6 +35,54 @@ class VSOP87:
     def loadVSOP87(self):
         """ Loads VSOP87 file for the Earth. """
 
+        self.terms = None
+
+        # Load the cached coefficients, if they are not older than the VSOP87 file
+        if os.path.isfile(self.npy_file) and ((not os.path.isfile(self.file_name)) \
+            or (os.path.getmtime(self.npy_file) >= os.path.getmtime(self.file_name))):
+
+            # Parse the file if the cache cannot be read
+            try:
+                self.terms = np.load(self.npy_file)
+            except (IOError, OSError, ValueError):
+                self.terms = None
+
+        if self.terms is None:
+            self.terms = self.parseVSOP87()
+            self.saveCache()
+
+
+        # Group the coefficients by the coordinate and the power of time
+        pq = self.terms[:, :2].astype(np.int64)
+        for p, q in np.unique(pq, axis=0):
+
+            group = self.terms[(pq[:, 0] == p) & (pq[:, 1] == q)]
+
+            self.groups.append((p, q, group[:, 2], group[:, 3], group[:, 4]))
+
+
+    def saveCache(self):
+        """ Save the parsed coefficients to the cache file. A cache which cannot be written (e.g. a read-only 
+            install directory) is skipped.
+        """
+
+        # Write to a temporary file first so a concurrent reader never sees a partial file
+        tmp_file = self.npy_file + ".{:d}.tmp.npy".format(os.getpid())
+
+        try:
+            np.save(tmp_file, self.terms)
+            os.replace(tmp_file, self.npy_file)
+
+        except (IOError, OSError):
+
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+
+    def parseVSOP87(self):
+        """ Parse the VSOP87 file into an array of [p, q, A, B, C] rows, sorted by p and q. """
+
+        fit_list = []
 
         with open(self.file_name) as f:
 
@@ -49,43 +105,53 @@ class VSOP87:
                 # Read frequency
                 C = float(line[111:131])
 
-                self.fit_list.append([p, q, A, B, C])
+                fit_list.append([p, q, A, B, C])
+
+
+        fit_list = np.array(fit_list, dtype=np.float64)
+
+        # Sort by coordinate and power of time, keeping the order of terms in the file
+        fit_list = fit_list[np.lexsort((fit_list[:, 1], fit_list[:, 0]))]
+
+        return fit_list
 
 
 
 
-def calcEarthEclipticCoordVSOP(jd, vsop_data):
+def calcEarthEclipticCoordVSOP(jd, vsop_data, chunk_size=1000):
     """ Calculates the ecliptic coordinates of the Earth for the given Julian date.
 
         The calculations are done using the VSOP87 model, the returned coordinates are heliocentric in the
         epoch of date.
 
     Arguments:
-        jd: [float] Julian date
+        jd: [float or ndarray] Julian date
         vsop_data: [VSOP87 object] loaded VSOP87 data
 
+    Keyword arguments:
+        chunk_size: [int] Number of Julian dates evaluated at once, which limits the memory used for large 
+            arrays. 1000 by default.
+
     Return:
-        L, B, r_au: [tuple of floats]
+        L, B, r_au: [tuple of floats or ndarrays]
             L - ecliptic longitude in radians
             B - ecliptic latitude in radians
             r_au - distante from the Earth to the Sun in AU
     """
 
-    T = (jd - wmpl.Utils.TrajConversions.J2000_JD.days)/365250.0
+    T_all = (np.atleast_1d(np.array(jd, dtype=np.float64)).ravel() \
+        - wmpl.Utils.TrajConversions.J2000_JD.days)/365250.0
 
-    pos = np.zeros(3)
-    P = np.zeros(6)
+    pos = np.zeros((3, len(T_all)))
 
-    # Init term degrees
-    for n in range(6):
-        P[n] = T**n
+    # Calculate coordinates, summing all terms of a group at once
+    for i in range(0, len(T_all), chunk_size):
 
-    # Calculate coordinates
-    for fit in vsop_data.fit_list:
+        T = T_all[i:i + chunk_size]
 
-        p, q, A, B, C = fit
+        for p, q, A, B, C in vsop_data.groups:
 
-        pos[p] += P[q]*A*np.cos(B + C*T)
+            pos[p, i:i + chunk_size] += (T**q)*np.sum(A*np.cos(B + C*T[:, None]), axis=1)
 
 
     # Unpack calculated values
@@ -95,7 +161,10 @@ def calcEarthEclipticCoordVSOP(jd, vsop_data):
     L = L%(2*np.pi)
 
 
-    return L, B, r_au
+    if np.ndim(jd) == 0:
+        return L[0], B[0], r_au[0]
+
+    return L.reshape(np.shape(jd)), B.reshape(np.shape(jd)), r_au.reshape(np.shape(jd))
 
 
 
@@ -106,7 +175,8 @@ def calcEarthRectangularCoordJPL(jd, jpl_data, sun_centre_origin=False):
         centre of the coordinate system is the Solar system barycentre, unless otherwise specified.
 
     Arguments:
-        jd: [float] Julian date
+        jd: [float or ndarray] Julian date, or an array of Julian dates which are all evaluated in one pass
+            through the ephemeris segments.
         jpl_data: [?] SPK loaded with jplephem library
 
     Keyword arguments:
@@ -115,7 +185,8 @@ def calcEarthRectangularCoordJPL(jd, jpl_data, sun_centre_origin=False):
 
     Return:
         position, velocity: [tuple of ndarrays] position and velocity of Earth in kilometers and km/s, in 
-            ecliptic rectangular cordinates, in J2000.0 epoch.
+            ecliptic rectangular cordinates, in J2000.0 epoch. If an array of N Julian dates was given, 
+            the shape of both arrays is (3, N).
 
     """
 
@@ -149,17 +220,178 @@ def calcEarthRectangularCoordJPL(jd, jpl_data, sun_centre_origin=False):
         velocity = (velocity_bary + velocity_earth)/86400.0
 
 
+    # Rotation matrix from the Earth equator reference frame to the ecliptic reference frame
+    rot_M = _equatorialToEclipticMatrix()
+
     # Rotate the position to the ecliptic reference frame (from the Earth equator reference frame)
-    position = rotateVector(position, np.array([1, 0, 0]), -wmpl.Utils.TrajConversions.J2000_OBLIQUITY)
+    position = np.dot(rot_M, position)
 
     # Rotate the velocity vector to the ecliptic reference frame (from the Earth equator reference frame)
-    velocity = rotateVector(velocity, np.array([1, 0, 0]), -wmpl.Utils.TrajConversions.J2000_OBLIQUITY)
+    velocity = np.dot(rot_M, velocity)
 
     # Return the position and the velocity of the Earth with respect to the Sun
     return position, velocity
 
 
 
+def _equatorialToEclipticMatrix():
+    """ Internal function. Returns the rotation matrix which rotates J2000 equatorial rectangular 
+        coordinates to J2000 ecliptic rectangular coordinates (rotation around the X axis by the negative 
+        J2000 obliquity).
+    """
+
+    eps = -wmpl.Utils.TrajConversions.J2000_OBLIQUITY
+
+    return np.array([
+        [1.0,         0.0,          0.0],
+        [0.0, np.cos(eps), -np.sin(eps)],
+        [0.0, np.sin(eps),  np.cos(eps)]
+        ])
+
+
+
+
+class JPLEphemeris(object):
+    def __init__(self, file_name, cache_size=256):
+        """ Lazily opened handle to the JPL ephemeris file, with a cache of Earth states.
+
+        The SPK file is only opened on first use, and it is transparently reopened if the handle is used 
+        in a different process than the one which opened it (e.g. in a forked multiprocessing worker), as 
+        the memory mapped file cannot be shared between processes.
+
+        Arguments:
+            file_name: [str] Path to the JPL ephemeris file (e.g. DE430).
+
+        Keyword arguments:
+            cache_size: [int] Maximum number of Earth states kept in the LRU cache. 256 by default.
+
+        """
+
+        self.file_name = file_name
+        self.cache_size = cache_size
+
+        # Opened SPK object and the ID of the process which opened it
+        self.spk = None
+        self.pid = None
+
+        # LRU cache of Earth states, keyed by (Julian date, sun_centre_origin)
+        self.cache = collections.OrderedDict()
+
+
+    def open(self):
+        """ Return the opened SPK object, (re)opening the file if it was not opened in this process. """
+
+        if (self.spk is None) or (self.pid != os.getpid()):
+
+            # Don't close the SPK object inherited from the parent process, as its memory map is still
+            # used by the parent
+            self.spk = SPK.open(self.file_name)
+            self.pid = os.getpid()
+
+        return self.spk
+
+
+    def close(self):
+        """ Close the ephemeris file if it was opened by this process and clear the cache. """
+
+        if (self.spk is not None) and (self.pid == os.getpid()):
+            self.spk.close()
+
+        self.spk = None
+        self.pid = None
+        self.cache.clear()
+
+
+    def earthState(self, jd, sun_centre_origin=False):
+        """ Calculate the position and the velocity of the Earth at the given Julian date. Repeated calls 
+            with the same Julian date are served from the cache. See calcEarthRectangularCoordJPL for 
+            details.
+
+        Arguments:
+            jd: [float] Julian date (dynamical time).
+
+        Keyword arguments:
+            sun_centre_origin: [bool] If True, the origin of the coordinate system will be in the Sun centre.
+                If False (default), the origin will be in the Solar system barycentre.
+
+        Return:
+            position, velocity: [tuple of ndarrays] position (km) and velocity (km/s) of the Earth in 
+                ecliptic rectangular cordinates, J2000.0 epoch.
+        """
+
+        key = (float(jd), bool(sun_centre_origin))
+
+        if key in self.cache:
+
+            # Mark the entry as the most recently used one
+            self.cache.move_to_end(key)
+            position, velocity = self.cache[key]
+
+        else:
+
+            position, velocity = calcEarthRectangularCoordJPL(key[0], self.open(), \
+                sun_centre_origin=sun_centre_origin)
+
+            self.cache[key] = (position, velocity)
+
+            # Drop the least recently used entry
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+
+        # Return copies so the cached values cannot be modified by the caller
+        return np.copy(position), np.copy(velocity)
+
+
+    def earthStateBatch(self, jd_arr, sun_centre_origin=False):
+        """ Calculate the position and the velocity of the Earth for an array of Julian dates in one call.
+            The results are not cached.
+
+        Arguments:
+            jd_arr: [ndarray] Julian dates (dynamical time).
+
+        Keyword arguments:
+            sun_centre_origin: [bool] If True, the origin of the coordinate system will be in the Sun centre.
+                If False (default), the origin will be in the Solar system barycentre.
+
+        Return:
+            position, velocity: [tuple of ndarrays] (N, 3) arrays of Earth positions (km) and velocities 
+                (km/s) in ecliptic rectangular cordinates, J2000.0 epoch.
+        """
+
+        jd_arr = np.atleast_1d(np.array(jd_arr, dtype=np.float64))
+
+        position, velocity = calcEarthRectangularCoordJPL(jd_arr, self.open(), \
+            sun_centre_origin=sun_centre_origin)
+
+        return position.T, velocity.T
+
+
+
+# Process-wide ephemeris handles, keyed by the path of the ephemeris file
+_JPL_EPHEMERIS_HANDLES = {}
+
+
+def getJPLEphemeris(file_name=None):
+    """ Return the process-wide handle to the JPL ephemeris file. The file is opened lazily on first use.
+
+    Keyword arguments:
+        file_name: [str] Path to the JPL ephemeris file. If None (default), config.jpl_ephem_file is used.
+
+    Return:
+        [JPLEphemeris object]
+    """
+
+    if file_name is None:
+        file_name = config.jpl_ephem_file
+
+    if file_name not in _JPL_EPHEMERIS_HANDLES:
+        _JPL_EPHEMERIS_HANDLES[file_name] = JPLEphemeris(file_name)
+
+    return _JPL_EPHEMERIS_HANDLES[file_name]
+
+
+
 
 def calcNutationComponents(jd_dyn):
     """ Calculate Earth's nutation components from the given Julian date.
@@ -170,7 +402,8 @@ def calcNutationComponents(jd_dyn):
     for the 2nd edition was used to correct the equation for delta_psi.
     
     Arguments:
-        jd_dyn: [float] Dynamical Julian date. See wmpl.Utils.TrajConversions.jd2DynamicalTimeJD function.
+        jd_dyn: [float or ndarray] Dynamical Julian date. See wmpl.Utils.TrajConversions.jd2DynamicalTimeJD 
+            function.
 
     Return:
         (delta_psi, delta_eps): [tuple of floats] Differences from mean nutation due to the influence of
@@ -206,12 +439,12 @@ def calcNutationComponents(jd_dyn):
 
 
     # Nutation in longitude
-    delta_psi = -17.2*math.sin(math.radians(omega)) - 1.32*math.sin(np.radians(2*L)) \
-        - 0.23*math.sin(math.radians(2*Ll)) + 0.21*math.sin(math.radians(2*omega))
+    delta_psi = -17.2*np.sin(np.radians(omega)) - 1.32*np.sin(np.radians(2*L)) \
+        - 0.23*np.sin(np.radians(2*Ll)) + 0.21*np.sin(np.radians(2*omega))
 
     # Nutation in obliquity
-    delta_eps = 9.2*math.cos(math.radians(omega)) + 0.57*math.cos(math.radians(2*L)) \
-        + 0.1*math.cos(math.radians(2*Ll)) - 0.09*math.cos(math.radians(2*omega))
+    delta_eps = 9.2*np.cos(np.radians(omega)) + 0.57*np.cos(np.radians(2*L)) \
+        + 0.1*np.cos(np.radians(2*Ll)) - 0.09*np.cos(np.radians(2*omega))
 
 
     # Convert to radians
@@ -423,6 +656,8 @@ def calcApparentSiderealEarthRotation(julian_date):
         Clark, D. L. (2010). Searching for fireball pre-detections in sky surveys. The School of Graduate and 
         Postdoctoral Studies. University of Western Ontario, London, Ontario, Canada, MSc Thesis.
 
+        The Julian date can be given either as a float or as a numpy array.
+
     """
 
     t = (julian_date - wmpl.Utils.TrajConversions.J2000_JD.days)/36525.0
@@ -430,7 +665,7 @@ def calcApparentSiderealEarthRotation(julian_date):
     # Calculate the Mean sidereal rotation of the Earth in radians (Greenwich Sidereal Time)
     GST = 280.46061837 + 360.98564736629*(julian_date - wmpl.Utils.TrajConversions.J2000_JD.days) + 0.000387933*t**2 - (t**3)/38710000
     GST = (GST + 360)%360
-    GST = math.radians(GST)
+    GST = np.radians(GST)
 
     # print('GST:', np.degrees(GST), 'deg')
 
@@ -457,7 +692,7 @@ def calcApparentSiderealEarthRotation(julian_date):
     # print('Mean obliquity:', np.degrees(eps0), 'deg')
 
     # Calculate apparent sidereal Earth's rotation
-    app_sid_rot = (GST + delta_psi*math.cos(eps0 + delta_eps))%(2*math.pi)
+    app_sid_rot = (GST + delta_psi*np.cos(eps0 + delta_eps))%(2*np.pi)
 
     return app_sid_rot
 
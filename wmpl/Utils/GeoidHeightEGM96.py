@@ -61,14 +61,39 @@ GEOID_MODEL = interpolateEGM96Data(GEOID_HEIGHTS)
 
 
 
+def geoidHeight(lat, lon):
+    """ Compute the height of the EGM96 geoid above the WGS84 ellipsoid.
+
+    Arguments:
+        lat: [float or ndarray] Latitude +N (rad).
+        lon: [float or ndarray] Longitude +E (rad).
+
+    Return:
+        [float or ndarray] Geoid height (meters). An array is returned if any of the inputs is an array.
+
+    """
+
+    lat_mod, lon_mod = np.broadcast_arrays(np.pi/2 - np.asarray(lat, dtype=np.float64), 
+        np.asarray(lon, dtype=np.float64)%(2*np.pi))
+
+    # Evaluate the model in individual points
+    ht_diff = GEOID_MODEL(lat_mod.ravel(), lon_mod.ravel(), grid=False).reshape(lat_mod.shape)
+
+    if ht_diff.ndim == 0:
+        return float(ht_diff)
+
+    return ht_diff
+
+
+
 def mslToWGS84Height(lat, lon, msl_height):
     """ Given the height above sea level (using the EGM96 model), compute the height above the WGS84
         ellipsoid.
     
     Arguments:
-        lat: [float] Latitude +N (rad).
-        lon: [float] Longitude +E (rad).
-        msl_height: [float] Height above sea level (meters).
+        lat: [float or ndarray] Latitude +N (rad).
+        lon: [float or ndarray] Longitude +E (rad).
+        msl_height: [float or ndarray] Height above sea level (meters).
 
     Return:
         wgs84_height: [float] Height above the WGS84 ellipsoid.
@@ -77,9 +102,7 @@ def mslToWGS84Height(lat, lon, msl_height):
 
 
     # Get the difference between WGS84 and MSL height
-    lat_mod = np.pi/2 - lat
-    lon_mod = lon%(2*np.pi)
-    msl_ht_diff = GEOID_MODEL(lat_mod, lon_mod)[0][0]
+    msl_ht_diff = geoidHeight(lat, lon)
 
     # Compute the WGS84 height
     wgs84_height = msl_height + msl_ht_diff
@@ -93,9 +116,9 @@ def wgs84toMSLHeight(lat, lon, wgs84_height):
     """ Given the height above the WGS84 ellipsoid compute the height above sea level (using the EGM96 model).
     
     Arguments:
-        lat: [float] Latitude +N (rad).
-        lon: [float] Longitude +E (rad).
-        wgs84_height: [float] Height above the WGS84 ellipsoid.
+        lat: [float or ndarray] Latitude +N (rad).
+        lon: [float or ndarray] Longitude +E (rad).
+        wgs84_height: [float or ndarray] Height above the WGS84 ellipsoid.
 
     Return:
         msl_height: [float] Height above sea level (meters).
@@ -104,9 +127,7 @@ def wgs84toMSLHeight(lat, lon, wgs84_height):
 
 
     # Get the difference between WGS84 and MSL height
-    lat_mod = np.pi/2 - lat
-    lon_mod = lon%(2*np.pi)
-    msl_ht_diff = GEOID_MODEL(lat_mod, lon_mod)[0][0]
+    msl_ht_diff = geoidHeight(lat, lon)
 
     # Compute the sea level
     msl_height = wgs84_height - msl_ht_diff
@@ -416,6 +416,56 @@ def findClosestPoints(P, u, Q, v):
 
 
 
+def findClosestPointsVect(P, u, Q, v):
+    """ Vectorized version of findClosestPoints. Any of the inputs can either be a single 3 element vector
+        or an (N, 3) array of vectors, which are broadcast against each other.
+
+    Arguments:
+        P: [ndarray] position coordinates of the 1st observer(s)
+        u: [ndarray] 1st observer's direction vector(s)
+        Q: [ndarray] position coordinates of the 2nd observer(s)
+        v: [ndarray] 2nd observer's direction vector(s)
+
+    Return:
+        S: [ndarray] points on the 1st observer's LoS closest to the 2nd observer's LoS
+        T: [ndarray] points on the 2nd observer's LoS closest to the 1st observer's LoS
+        d: [ndarray] distances between S and T
+
+    """
+
+    P = np.asarray(P, dtype=np.float64)
+    u = np.asarray(u, dtype=np.float64)
+    Q = np.asarray(Q, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+
+    # Calculate the difference in position between the observers
+    w = P - Q
+
+    # Calculate cosines of angles between various vectors (row-wise dot products)
+    a = np.sum(u*u, axis=-1)
+    b = np.sum(u*v, axis=-1)
+    c = np.sum(v*v, axis=-1)
+    d = np.sum(u*w, axis=-1)
+    e = np.sum(v*w, axis=-1)
+
+    denom = a*c - b**2
+
+    sc = (b*e - c*d)/denom
+    tc = (a*e - b*d)/denom
+
+    # Points on the 1st observer's line of sight closest to the LoS of the 2nd observer
+    S = P + u*np.expand_dims(sc, -1)
+
+    # Points on the 2nd observer's line of sight closest to the LoS of the 1st observer
+    T = Q + v*np.expand_dims(tc, -1)
+
+    # Calculate the distance between S and T
+    d = np.linalg.norm(S - T, axis=-1)
+
+    return S, T, d
+
+
+
 def lineAndSphereIntersections(centre, radius, origin, direction):
     """ Finds intersections between a sphere of given radius and coordiantes of the centre and a line
         defined by an origin and a direction vector.
@@ -6,8 +6,61 @@ from contextlib import closing
 
 
 
+def _computeGeneratorOnPool(pool, generator, workerFunc, resultsCheckFunc, req_num, n_proc, 
+    results_check_kwagrs, max_runs):
+    """ Internal function. Run parallelComputeGenerator on the given pool, see its documentation. """
+
+    results = []
+
+    total_runs = 0
+
+    # Generate an initial input list
+    input_list = [next(generator) for i in range(req_num)]
+
+    # Run the initial list
+    results = pool.map(workerFunc, input_list)
+
+    total_runs += len(input_list)
+        
+    # Only take good results
+    results = resultsCheckFunc(results, **results_check_kwagrs)
+
+
+    # If there are None, do not continue, as there is obviously a problem
+    if len(results) == 0:
+        print("No successful results after the initial run!")
+        return results
+
+
+    # Run the processing until a required number of good values is returned
+    while len(results) < req_num:
+
+        # Generate an input for processing
+        input_list = [next(generator) for i in range(n_proc)]
+
+        # Map the inputs
+        results_temp = pool.map(workerFunc, input_list)
+
+        total_runs += len(input_list)
+
+        # Only take good results
+        results += resultsCheckFunc(results_temp, **results_check_kwagrs)
+
+        # Check if the number of runs exceeded the maximum
+        if total_runs >= max_runs:
+            print("Total runs exceeded! Stopping...")
+            break
+
+    # Make sure that there are no more results than needed
+    if len(results) > req_num:
+        results = results[:req_num]
+
+    return results
+
+
+
 def parallelComputeGenerator(generator, workerFunc, resultsCheckFunc, req_num, n_proc=None, 
-    results_check_kwagrs=None, max_runs=None):
+    results_check_kwagrs=None, max_runs=None, pool=None):
     """ Given a generator which generates inputs for the workerFunc function, generate and process results 
         until req_num number of results satisfies the resultsCheckFunc function.
 
@@ -25,6 +78,9 @@ def parallelComputeGenerator(generator, workerFunc, resultsCheckFunc, req_num, n
             will be used.
         results_check_kwargs: [dict] Keyword arguments for resultsCheckFunc. None by default.
         max_runs: [int] Maximum number of runs. None by default, which will limit the runs to 10x req_num.
+        pool: [object] An already running pool (or any object with a pool-like map method) which will be 
+            used instead of starting a new one. It will not be closed when the processing is done. None by 
+            default.
 
     Return:
         [list] A list of results.
@@ -44,55 +100,17 @@ def parallelComputeGenerator(generator, workerFunc, resultsCheckFunc, req_num, n
         max_runs = 10*req_num
 
 
-    # Init the pool
-    with multiprocessing.Pool(processes=n_proc) as pool:
-
-        results = []
-
-        total_runs = 0
-
-        # Generate an initial input list
-        input_list = [next(generator) for i in range(req_num)]
-
-        # Run the initial list
-        results = pool.map(workerFunc, input_list)
-
-        total_runs += len(input_list)
-            
-        # Only take good results
-        results = resultsCheckFunc(results, **results_check_kwagrs)
-
-
-        # If there are None, do not continue, as there is obviously a problem
-        if len(results) == 0:
-            print("No successful results after the initial run!")
-            return results
-
-
-        # Run the processing until a required number of good values is returned
-        while len(results) < req_num:
-
-            # Generate an input for processing
-            input_list = [next(generator) for i in range(n_proc)]
-
-            # Map the inputs
-            results_temp = pool.map(workerFunc, input_list)
+    # Use the given pool
+    if pool is not None:
+        return _computeGeneratorOnPool(pool, generator, workerFunc, resultsCheckFunc, req_num, n_proc, 
+            results_check_kwagrs, max_runs)
 
-            total_runs += len(input_list)
 
-            # Only take good results
-            results += resultsCheckFunc(results_temp, **results_check_kwagrs)
-
-            # Check if the number of runs exceeded the maximum
-            if total_runs >= max_runs:
-                print("Total runs exceeded! Stopping...")
-                break
-
-        # Make sure that there are no more results than needed
-        if len(results) > req_num:
-            results = results[:req_num]
+    # Init the pool
+    with multiprocessing.Pool(processes=n_proc) as pool:
 
-        return results
+        return _computeGeneratorOnPool(pool, generator, workerFunc, resultsCheckFunc, req_num, n_proc, 
+            results_check_kwagrs, max_runs)
 
 
 
@@ -6,7 +6,6 @@ from __future__ import print_function, division, absolute_import
 
 import os
 import sys
-import copy
 
 # Preserve Python 2 compatibility for the encoding option in the "open" function
 from io import open
@@ -140,13 +139,10 @@ def associateShower(la_sun, L_g, B_g, v_g, sol_window=1.0, max_radius=3.0, \
         [MeteorShower instance] MeteorShower instance for the closest match, or None for sporadics.
     """
 
-    # Create a working copy of the Jenniskens shower list
-    temp_shower_list = copy.deepcopy(jenniskens_shower_list)
-
-
-    # Find all showers in the solar longitude window
-    la_sun_diffs = np.abs((temp_shower_list[:, 0] - la_sun + np.pi)%(2*np.pi) - np.pi)
-    temp_shower_list = temp_shower_list[la_sun_diffs <= np.radians(sol_window)]
+    # Find all showers in the solar longitude window (indexing with a mask makes a copy of the table, so the
+    # original table is never modified)
+    la_sun_diffs = np.abs((jenniskens_shower_list[:, 0] - la_sun + np.pi)%(2*np.pi) - np.pi)
+    temp_shower_list = jenniskens_shower_list[la_sun_diffs <= np.radians(sol_window)]
 
 
     # Check if any associations were found
@@ -228,6 +224,225 @@ def associateShowerTraj(traj, sol_window=1.0, max_radius=3.0, \
 
 
 
+# Index of the Jenniskens table sorted by solar longitude, built on first use
+_shower_sol_index = None
+
+
+def _showerSolIndex():
+    """ Internal function. Return the Jenniskens table sorted by solar longitude, as a dictionary of column 
+        arrays. The table is repeated at -2 pi and +2 pi, so windows crossing 0/360 deg can be found with a 
+        single search. The sines and cosines of radiant latitudes are precomputed for the radiant distance.
+    """
+
+    global _shower_sol_index
+
+    if _shower_sol_index is None:
+
+        n_showers = len(jenniskens_shower_list)
+
+        sol = np.concatenate([jenniskens_shower_list[:, 0] + offset for offset in (-2*np.pi, 0, 2*np.pi)])
+        table_indices = np.tile(np.arange(n_showers), 3)
+
+        sort_order = np.argsort(sol, kind='mergesort')
+        table_indices = table_indices[sort_order]
+
+        _shower_sol_index = {
+            'index': table_indices,
+            'sol_search': sol[sort_order],
+            'sol': jenniskens_shower_list[table_indices, 0],
+            'L': jenniskens_shower_list[table_indices, 1],
+            'sin_B': np.sin(jenniskens_shower_list[table_indices, 2]),
+            'cos_B': np.cos(jenniskens_shower_list[table_indices, 2]),
+            'v_g': jenniskens_shower_list[table_indices, 3]
+            }
+
+    return _shower_sol_index
+
+
+
+def _associateShowerIndices(la_sun, L_g, B_g, v_g, sol_window, max_radius, max_veldif_percent):
+    """ Internal function. Find the best matching rows of the Jenniskens table for arrays of meteors. See 
+        associateShowerBatch for details.
+
+    Return:
+        (table_indices, closeness): [tuple of ndarrays] Index of the best matching row in the Jenniskens 
+            table (-1 for sporadics) and the closeness parameter of the match (NaN for sporadics).
+    """
+
+    n_meteors = len(la_sun)
+
+    best_indices = np.zeros(n_meteors, dtype=np.int64) - 1
+    best_closeness = np.zeros(n_meteors) + np.nan
+
+    if (n_meteors == 0) or (len(jenniskens_shower_list) == 0):
+        return best_indices, best_closeness
+
+
+    sol_index = _showerSolIndex()
+
+    # Find the range of sorted table rows in the solar longitude window of every meteor (the window is 
+    # slightly widened for the search, the exact window is checked below)
+    sol_window_rad = np.radians(sol_window)
+    la_sun_wrapped = la_sun%(2*np.pi)
+    range_beg = np.searchsorted(sol_index['sol_search'], la_sun_wrapped - sol_window_rad - 1e-9, side='left')
+    range_end = np.searchsorted(sol_index['sol_search'], la_sun_wrapped + sol_window_rad + 1e-9, \
+        side='right')
+
+
+    # Expand the ranges into (meteor, sorted table row) candidate pairs
+    counts = range_end - range_beg
+    pair_meteors = np.repeat(np.arange(n_meteors), counts)
+    pair_rows = np.repeat(range_beg - np.cumsum(counts) + counts, counts) + np.arange(len(pair_meteors))
+
+
+    # Compute the normalized distances in solar longitude and velocity, the same way as associateShower 
+    # does, and only keep the pairs within the limits
+    sol_dist = np.abs((sol_index['sol'][pair_rows] - la_sun[pair_meteors] + np.pi)%(2*np.pi) - np.pi)
+
+    shower_v_g = sol_index['v_g'][pair_rows]
+    vel_dist = np.abs(100*(shower_v_g - v_g[pair_meteors])/shower_v_g)
+
+    pair_mask = (sol_dist <= sol_window_rad) & (vel_dist <= max_veldif_percent)
+
+    pair_meteors = pair_meteors[pair_mask]
+    pair_rows = pair_rows[pair_mask]
+    sol_dist = sol_dist[pair_mask]
+    vel_dist = vel_dist[pair_mask]
+
+
+    # Compute the angular distance between the radiants of the remaining pairs (see 
+    # angleBetweenSphericalCoords), in Sun-centered ecliptic coordinates
+    L_sc = (L_g - la_sun)%(2*np.pi)
+    with np.errstate(invalid='ignore'):
+        rad_dist = np.arccos(sol_index['sin_B'][pair_rows]*np.sin(B_g[pair_meteors]) \
+            + sol_index['cos_B'][pair_rows]*np.cos(B_g[pair_meteors]) \
+            *np.cos(L_sc[pair_meteors] - sol_index['L'][pair_rows]))
+
+        pair_mask = rad_dist <= np.radians(max_radius)
+
+    if not np.any(pair_mask):
+        return best_indices, best_closeness
+
+    pair_meteors = pair_meteors[pair_mask]
+    pair_showers = sol_index['index'][pair_rows[pair_mask]]
+    closeness = sol_dist[pair_mask]/sol_window_rad + rad_dist[pair_mask]/np.radians(max_radius) \
+        + vel_dist[pair_mask]/max_veldif_percent
+
+
+    # Choose the closest shower for every meteor (ties are resolved by the table order, as in 
+    # associateShower)
+    sort_order = np.lexsort((pair_showers, closeness, pair_meteors))
+    _, first = np.unique(pair_meteors[sort_order], return_index=True)
+    best_pairs = sort_order[first]
+
+    best_indices[pair_meteors[best_pairs]] = pair_showers[best_pairs]
+    best_closeness[pair_meteors[best_pairs]] = closeness[best_pairs]
+
+    return best_indices, best_closeness
+
+
+
+def associateShowerBatch(la_sun, L_g, B_g, v_g, sol_window=1.0, max_radius=3.0, max_veldif_percent=10.0, \
+    chunk_size=100000):
+    """ Associate many meteors to showers listed in the Jenniskens et al. (2018) paper at once. The results
+        are the same as calling associateShower for every meteor. The shower table is indexed by the solar 
+        longitude, so only the showers in the solar longitude window of every meteor are compared to it.
+
+    Arguments:
+        la_sun: [ndarray] Solar longitudes (radians).
+        L_g: [ndarray] Geocentric ecliptic longitudes (radians).
+        B_g: [ndarray] Geocentric ecliptic latitudes (radians).
+        v_g: [ndarray] Geocentric velocities (m/s).
+
+    Keyword arguments:
+        sol_window: [float] Solar longitude window of association (deg).
+        max_radius: [float] Maximum angular separation from reference radiant (deg).
+        max_veldif_percent: [float] Maximum velocity difference in percent.
+        chunk_size: [int] Number of meteors processed at once, which limits the memory used for large 
+            inputs. 100000 by default.
+
+    Return:
+        (iau_numbers, closeness): [tuple of ndarrays] IAU numbers of the associated showers (-1 for 
+            sporadics) and the closeness parameters of the matches (NaN for sporadics). Smaller closeness
+            means a better match.
+    """
+
+    la_sun, L_g, B_g, v_g = [np.atleast_1d(np.array(arr, dtype=np.float64)) \
+        for arr in np.broadcast_arrays(la_sun, L_g, B_g, v_g)]
+
+    table_indices = np.zeros(len(la_sun), dtype=np.int64) - 1
+    closeness = np.zeros(len(la_sun)) + np.nan
+
+    for i in range(0, len(la_sun), chunk_size):
+
+        chunk = slice(i, i + chunk_size)
+
+        table_indices[chunk], closeness[chunk] = _associateShowerIndices(la_sun[chunk], L_g[chunk], \
+            B_g[chunk], v_g[chunk], sol_window, max_radius, max_veldif_percent)
+
+
+    # Look up the IAU numbers of the associated showers
+    iau_numbers = np.zeros(len(la_sun), dtype=np.int64) - 1
+    associated = table_indices >= 0
+    iau_numbers[associated] = np.round(jenniskens_shower_list[table_indices[associated], 4]).astype(np.int64)
+
+    return iau_numbers, closeness
+
+
+
+def associateShowerTrajBatch(traj_list, sol_window=1.0, max_radius=3.0, max_veldif_percent=10.0):
+    """ Associate a list of Trajectory objects to meteor showers at once. See associateShowerBatch for 
+        details.
+
+    Arguments:
+        traj_list: [list] A list of Trajectory objects.
+
+    Keyword arguments:
+        sol_window: [float] Solar longitude window of association (deg).
+        max_radius: [float] Maximum angular separation from reference radiant (deg).
+        max_veldif_percent: [float] Maximum velocity difference in percent.
+
+    Return:
+        [list] MeteorShower instance for the closest match of every trajectory, or None for sporadics.
+    """
+
+    shower_list = [None]*len(traj_list)
+
+    # Only trajectories with a computed orbit can be associated
+    valid_indices = [i for i, traj in enumerate(traj_list) if traj.orbit.ra_g is not None]
+
+    if not valid_indices:
+        return shower_list
+
+    orbits = [traj_list[i].orbit for i in valid_indices]
+
+    table_indices, _ = _associateShowerIndices(
+        np.array([orb.la_sun for orb in orbits], dtype=np.float64), 
+        np.array([orb.L_g for orb in orbits], dtype=np.float64), 
+        np.array([orb.B_g for orb in orbits], dtype=np.float64), 
+        np.array([orb.v_g for orb in orbits], dtype=np.float64), 
+        sol_window, max_radius, max_veldif_percent)
+
+
+    # Init a shower object for every associated trajectory (one object per table row)
+    shower_obj_dict = {}
+    for i, table_index in zip(valid_indices, table_indices):
+
+        if table_index < 0:
+            continue
+
+        if table_index not in shower_obj_dict:
+            l0, L_l0, B_g, v_g, IAU_no = jenniskens_shower_list[table_index]
+            shower_obj_dict[table_index] = MeteorShower(l0, (L_l0 + l0)%360, B_g, v_g, int(round(IAU_no)))
+
+        shower_list[i] = shower_obj_dict[table_index]
+
+
+    return shower_list
+
+
+
+
 if __name__ == "__main__":
 
     import argparse
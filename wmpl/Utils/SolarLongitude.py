@@ -2,15 +2,14 @@
 
 from __future__ import print_function, division, absolute_import
 
+import os
 import datetime
 
 import numpy as np
 import scipy.optimize
 
-from jplephem.spk import SPK
-
 from wmpl.Config import config
-from wmpl.Utils.Earth import calcEarthRectangularCoordJPL
+from wmpl.Utils.Earth import getJPLEphemeris
 from wmpl.Utils.TrajConversions import date2JD
 
 
@@ -1219,37 +1218,37 @@ L5 = [
 
 
 
+# Periodic terms of all degrees as arrays of [A, B, C] rows
+_VSOP_TERMS = [np.array(term) for term in (L0, L1, L2, L3, L4, L5)]
+
+
+
+
 def jd2SolLonVSOP(jd):
     """ Convert the given Julian date to solar longitude using VSOP87, J2000.0 epoch.
 
     Source: From VSOP87B.ear, ftp://ftp.imcce.fr/pub/ephem/planets/vsop87/
 
     Arguments:
-        jd: [float] julian date
+        jd: [float or ndarray] julian date
 
     Return:
-        [float] solar longitude in radians, J2000.0 epoch
+        [float or ndarray] solar longitude in radians, J2000.0 epoch
 
     """
 
     # Number of millennia since 2000
-    T = (jd - 2451545.0)/365250.0
-
-    terms = [L0, L1, L2, L3, L4, L5]
-    term_sizes = [len(L0), len(L1), len(L2), len(L3), len(L4), len(L5)]
+    T = (np.asarray(jd, dtype=np.float64) - 2451545.0)/365250.0
 
-    # Calculate periodic terms
-    S = np.zeros(6)
-    for i, term_size in enumerate(term_sizes):
+    # Calculate the Solar longitude, evaluating all periodic terms of every degree at once
+    L = np.pi
+    for i, term in enumerate(_VSOP_TERMS):
 
-        L = terms[i]
-        S[i] = np.sum([L[p][0]*np.cos((L[p][1] + L[p][2]*T)%(2*np.pi)) for p in range(term_size)])
+        A, B, C = term.T
 
+        S = np.sum(A*np.cos((B + C*T[..., None])%(2*np.pi)), axis=-1)
 
-    # Calculate the Solar longitude
-    L = np.pi
-    for i in range(6):
-        L += S[i]*(T**i)
+        L = L + S*(T**i)
 
     # Wrap the solar longitude to [0, 2pi] range
     L = L%(2*np.pi)
@@ -1266,38 +1265,38 @@ def jd2SolLonSteyaert(jd):
         Meteor Organization, 19, 31-34.
 
     Arguments:
-        jd: [float] julian date
+        jd: [float or ndarray] julian date
 
     Return:
-        [float] solar longitude in radians, J2000.0 epoch
+        [float or ndarray] solar longitude in radians, J2000.0 epoch
 
     """
 
     # Define time constants
-    A0 = [334166, 3489, 350, 342, 314, 268, 234, 132, 127, 120, 99, 90, 86, 78, 75, 51, 49, 36, 32, 28, 27, 
-        24, 21, 21, 20, 16, 13, 13]
+    A0 = np.array([334166, 3489, 350, 342, 314, 268, 234, 132, 127, 120, 99, 90, 86, 78, 75, 51, 49, 36, 32, 28, 27, 
+        24, 21, 21, 20, 16, 13, 13])
 
-    B0 = [4.669257, 4.6261, 2.744, 2.829, 3.628, 4.418, 6.135, 0.742, 2.037, 1.110, 5.233, 2.045, 3.508, 
-        1.179, 2.533, 4.58, 4.21, 2.92, 5.85, 1.90, 0.31, 0.34, 4.81, 1.87, 2.46, 0.83, 3.41, 1.08]
+    B0 = np.array([4.669257, 4.6261, 2.744, 2.829, 3.628, 4.418, 6.135, 0.742, 2.037, 1.110, 5.233, 2.045, 3.508, 
+        1.179, 2.533, 4.58, 4.21, 2.92, 5.85, 1.90, 0.31, 0.34, 4.81, 1.87, 2.46, 0.83, 3.41, 1.08])
 
-    C0 = [6283.07585, 12566.1517, 5753.385, 3.523, 77713.771, 7860.419, 3930.210, 11506.77, 529.691, 1577.344, 
+    C0 = np.array([6283.07585, 12566.1517, 5753.385, 3.523, 77713.771, 7860.419, 3930.210, 11506.77, 529.691, 1577.344, 
         5884.927, 26.298, 398.149, 5223.694, 5507.553, 18849.23, 775.52, 0.07, 11790.63, 796.3, 10977.08, 
-        5486.78, 2544.31, 5573.14, 6069.78, 213.3, 2942.46, 20.78]
+        5486.78, 2544.31, 5573.14, 6069.78, 213.3, 2942.46, 20.78])
 
-    A1 = [20606, 430, 43]
-    B1 = [2.67823, 2.635, 1.59]
-    C1 = [6283.07585, 12566.152, 3.52]
+    A1 = np.array([20606, 430, 43])
+    B1 = np.array([2.67823, 2.635, 1.59])
+    C1 = np.array([6283.07585, 12566.152, 3.52])
 
-    A2 = [872, 29]
-    B2 = [1.073, 0.44]
-    C2 = [6283.07585, 12566.15]
+    A2 = np.array([872, 29])
+    B2 = np.array([1.073, 0.44])
+    C2 = np.array([6283.07585, 12566.15])
 
     A3 = 29
     B3 = 5.84
     C3 = 6283.07585
 
     # Number of millennia since 2000
-    T = (jd - 2451545.0)/365250.0
+    T = (np.asarray(jd, dtype=np.float64) - 2451545.0)/365250.0
 
     # Mean solar longitude
     L0 = 4.8950627 + 6283.07585*T - 0.0000099*T**2
@@ -1306,9 +1305,9 @@ def jd2SolLonSteyaert(jd):
     L0 = L0%(2*np.pi)
 
     # Periodical terms
-    S0 = np.sum([A0[i]*np.cos((B0[i] + C0[i]*T)%(2*np.pi)) for i in range(28)])
-    S1 = np.sum([A1[i]*np.cos((B1[i] + C1[i]*T)%(2*np.pi)) for i in range(3)])
-    S2 = np.sum([A2[i]*np.cos((B2[i] + C2[i]*T)%(2*np.pi)) for i in range(2)])
+    S0 = np.sum(A0*np.cos((B0 + C0*T[..., None])%(2*np.pi)), axis=-1)
+    S1 = np.sum(A1*np.cos((B1 + C1*T[..., None])%(2*np.pi)), axis=-1)
+    S2 = np.sum(A2*np.cos((B2 + C2*T[..., None])%(2*np.pi)), axis=-1)
     S3 = A3*np.cos((B3 + C3*T)%(2*np.pi))
 
     # Solar longitude of J2000.0
@@ -1334,12 +1333,9 @@ def jd2SolLonJPL(jd):
 
     """
 
-    # Load the JPL ephemerids data
-    jpl_ephem_data = SPK.open(config.jpl_ephem_file)
-
     # Get the position of the Earth (km) and its velocity (km/s) at the given Julian date (J2000 epoch),
     # relative to the centre of mass of the Sun
-    earth_pos, earth_vel = calcEarthRectangularCoordJPL(jd, jpl_ephem_data, sun_centre_origin=True)
+    earth_pos, earth_vel = getJPLEphemeris().earthState(jd, sun_centre_origin=True)
 
     # Calculate the solar longitude
     la_sun = np.arctan2(earth_pos[1], earth_pos[0]) + np.pi
@@ -1347,7 +1343,19 @@ def jd2SolLonJPL(jd):
 
     return la_sun
 
-jd2SolLonJPL_vect = np.vectorize(jd2SolLonJPL)
+def jd2SolLonJPL_vect(jd):
+    """ Version of jd2SolLonJPL which takes an array of Julian dates. All dates are evaluated in one pass
+        through the ephemeris. See jd2SolLonJPL for details.
+    """
+
+    jd = np.asarray(jd, dtype=np.float64)
+
+    earth_pos, _ = getJPLEphemeris().earthStateBatch(jd.ravel(), sun_centre_origin=True)
+
+    # Calculate the solar longitude
+    la_sun = (np.arctan2(earth_pos[:, 1], earth_pos[:, 0]) + np.pi)%(2*np.pi)
+
+    return la_sun.reshape(jd.shape)
 
 
 def _solLon2jd(solFunc, year, month, L):
@@ -1460,6 +1468,287 @@ def solLon2jdJPL(*args):
 
 
 
+class SolarLongitudeChebyshev(object):
+    def __init__(self, year_beg=None, year_end=None, cache_file=None, segment_days=8.0, degree=12):
+        """ Fast solar longitude computation using piecewise Chebyshev fits of the JPL solar longitude 
+            (see jd2SolLonJPL). The fits are computed once and cached on disk. Both the forward (JD -> solar
+            longitude) and the inverse (solar longitude -> JD) computations take arrays.
+
+        Keyword arguments:
+            year_beg: [int] First year covered by the fits. config.sol_lon_cheb_years is used if None.
+            year_end: [int] Last year covered by the fits. config.sol_lon_cheb_years is used if None.
+            cache_file: [str] Path to the .npz file the fits are cached in. config.sol_lon_cheb_file is used 
+                if None.
+            segment_days: [float] Length of every fitted segment in days. 8 days by default.
+            degree: [int] Degree of the Chebyshev polynomial fitted to every segment. 12 by default, which 
+                keeps the fit error well below a milliarcsecond.
+
+        """
+
+        if year_beg is None:
+            year_beg = config.sol_lon_cheb_years[0]
+
+        if year_end is None:
+            year_end = config.sol_lon_cheb_years[1]
+
+        if cache_file is None:
+            cache_file = config.sol_lon_cheb_file
+
+        self.year_beg = int(year_beg)
+        self.year_end = int(year_end)
+        self.cache_file = cache_file
+        self.segment_days = float(segment_days)
+        self.degree = int(degree)
+
+        # Range of Julian dates covered by the fits
+        self.jd_beg = date2JD(self.year_beg, 1, 1, 0, 0, 0)
+        self.jd_end = self.jd_beg + self.segment_days*np.ceil((date2JD(self.year_end + 1, 1, 1, 0, 0, 0) \
+            - self.jd_beg)/self.segment_days)
+
+        # Chebyshev coefficients of the unwrapped solar longitude (one row per segment), and of its time 
+        # derivative (rad/day)
+        self.coeffs = None
+        self.coeffs_der = None
+
+        if not self.loadCache():
+            self.fit()
+            self.saveCache()
+
+        self.coeffs_der = np.polynomial.chebyshev.chebder(self.coeffs, axis=1)*2.0/self.segment_days
+
+
+    def cacheKey(self):
+        """ Return the parameters which the cached fits have to match to be valid. """
+
+        ephem_size = os.path.getsize(config.jpl_ephem_file) if os.path.isfile(config.jpl_ephem_file) else 0
+
+        return np.array([self.year_beg, self.year_end, self.segment_days, self.degree, ephem_size], \
+            dtype=np.float64)
+
+
+    def loadCache(self):
+        """ Load the fits from the cache file. Returns False if there is no valid cache. """
+
+        if not os.path.isfile(self.cache_file):
+            return False
+
+        try:
+            with np.load(self.cache_file) as data:
+
+                if not np.array_equal(data['key'], self.cacheKey()):
+                    return False
+
+                self.coeffs = data['coeffs']
+
+        except (IOError, OSError, ValueError, KeyError):
+            return False
+
+        return True
+
+
+    def saveCache(self):
+        """ Save the fits to the cache file. A cache which cannot be written (e.g. a read-only install 
+            directory) is skipped.
+        """
+
+        # Write to a temporary file first so a concurrent reader never sees a partial file
+        tmp_file = self.cache_file + ".{:d}.tmp.npz".format(os.getpid())
+
+        try:
+            np.savez(tmp_file, key=self.cacheKey(), coeffs=self.coeffs)
+            os.replace(tmp_file, self.cache_file)
+
+        except (IOError, OSError):
+
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+
+    def fit(self):
+        """ Fit the solar longitude computed from the JPL ephemerids in every segment. """
+
+        n_nodes = self.degree + 1
+        n_segments = int(round((self.jd_end - self.jd_beg)/self.segment_days))
+
+        # Chebyshev nodes in the [-1, 1] range, in ascending order
+        x_nodes = np.cos(np.pi*(np.arange(n_nodes) + 0.5)/n_nodes)[::-1]
+
+        # Julian dates of nodes of all segments, in ascending order
+        seg_beg = self.jd_beg + self.segment_days*np.arange(n_segments)
+        jd_nodes = seg_beg[:, None] + (x_nodes + 1)*self.segment_days/2
+
+        # Compute the solar longitude in all nodes and unwrap it, so it can be fitted across the 2 pi jump
+        la_sun = np.unwrap(jd2SolLonJPL_vect(jd_nodes.ravel())).reshape(jd_nodes.shape)
+
+        # Interpolate the values in the nodes using the discrete orthogonality of Chebyshev polynomials. The 
+        # nodes are the same in every segment, so the fit is a single matrix product
+        transform = 2.0/n_nodes*np.polynomial.chebyshev.chebvander(x_nodes, self.degree)
+        transform[:, 0] /= 2
+        self.coeffs = np.dot(la_sun, transform)
+
+
+    def _segmentCoords(self, jd):
+        """ Internal function. Return the indices of the segments and the normalized times in them. """
+
+        seg_pos = (jd - self.jd_beg)/self.segment_days
+
+        seg_indices = np.clip(np.floor(seg_pos).astype(np.int64), 0, len(self.coeffs) - 1)
+
+        x = 2*(seg_pos - seg_indices) - 1
+
+        return seg_indices, x
+
+
+    def inRange(self, jd):
+        """ Return a mask of Julian dates covered by the fits. """
+
+        return (jd >= self.jd_beg) & (jd <= self.jd_end)
+
+
+    def unwrappedSolLon(self, jd):
+        """ Evaluate the unwrapped solar longitude (radians) for the Julian dates inside the fitted range. """
+
+        seg_indices, x = self._segmentCoords(jd)
+
+        return np.polynomial.chebyshev.chebval(x, self.coeffs[seg_indices].T, tensor=False)
+
+
+    def jd2SolLon(self, jd):
+        """ Convert Julian dates to solar longitudes. Dates outside the fitted range are computed directly 
+            from the JPL ephemerids.
+
+        Arguments:
+            jd: [float or ndarray] Julian date.
+
+        Return:
+            [float or ndarray] Solar longitude in radians, J2000.0 epoch.
+        """
+
+        jd_arr = np.atleast_1d(np.array(jd, dtype=np.float64))
+
+        la_sun = np.zeros_like(jd_arr)
+
+        in_range = self.inRange(jd_arr)
+        la_sun[in_range] = self.unwrappedSolLon(jd_arr[in_range])%(2*np.pi)
+
+        if not np.all(in_range):
+            la_sun[~in_range] = jd2SolLonJPL_vect(jd_arr[~in_range])
+
+        if np.ndim(jd) == 0:
+            return float(la_sun[0])
+
+        return la_sun.reshape(np.shape(jd))
+
+
+    def solLon2jd(self, la_sun, jd_ref, tol=1e-8, max_iter=20):
+        """ Convert solar longitudes to Julian dates. As the solar longitude repeats every year, the Julian 
+            date closest to the given reference Julian date is returned.
+
+        Arguments:
+            la_sun: [float or ndarray] Solar longitude (radians), J2000 epoch.
+            jd_ref: [float or ndarray] Reference Julian date, the solution is the one within half a year
+                from it.
+
+        Keyword arguments:
+            tol: [float] Convergence tolerance (days). 1e-8 by default (about a millisecond).
+            max_iter: [int] Maximum number of Newton iterations. 20 by default.
+
+        Return:
+            [float or ndarray] Julian date.
+        """
+
+        la_sun_arr, jd_ref_arr = np.broadcast_arrays(np.array(la_sun, dtype=np.float64), 
+            np.array(jd_ref, dtype=np.float64))
+
+        la_sun_arr = la_sun_arr.ravel()
+        jd = np.copy(jd_ref_arr.ravel())
+
+        # Mean rate of change of the solar longitude (rad/day)
+        mean_rate = 2*np.pi/365.2422
+
+        # Newton iterations on the wrapped solar longitude difference - the first step from the reference 
+        # date lands within a few days of the solution
+        for _ in range(max_iter):
+
+            diff = (self.jd2SolLon(jd) - la_sun_arr + np.pi)%(2*np.pi) - np.pi
+
+            # Use the exact rate of change inside the fitted range
+            rate = np.zeros_like(jd) + mean_rate
+            in_range = self.inRange(jd)
+            seg_indices, x = self._segmentCoords(jd[in_range])
+            rate[in_range] = np.polynomial.chebyshev.chebval(x, self.coeffs_der[seg_indices].T, tensor=False)
+
+            step = diff/rate
+            jd -= step
+
+            if np.all(np.abs(step) < tol):
+                break
+
+
+        if np.ndim(la_sun) == 0 and np.ndim(jd_ref) == 0:
+            return float(jd[0])
+
+        return jd.reshape(jd_ref_arr.shape)
+
+
+
+# Process-wide solar longitude Chebyshev fits, loaded on first use
+_SOL_LON_CHEB = None
+
+
+def getSolLonChebyshev():
+    """ Return the process-wide SolarLongitudeChebyshev object, built with the default configuration. """
+
+    global _SOL_LON_CHEB
+
+    if _SOL_LON_CHEB is None:
+        _SOL_LON_CHEB = SolarLongitudeChebyshev()
+
+    return _SOL_LON_CHEB
+
+
+
+def jd2SolLonCheb(jd):
+    """ Convert the given Julian date to solar longitude using the Chebyshev fits of the JPL solar longitude,
+        J2000.0 epoch. The results match jd2SolLonJPL, but arrays of Julian dates are evaluated at once.
+
+    Arguments:
+        jd: [float or ndarray] julian date
+
+    Return:
+        [float or ndarray] solar longitude in radians, J2000.0 epoch
+
+    """
+
+    return getSolLonChebyshev().jd2SolLon(jd)
+
+
+
+def solLon2jdCheb(year, month, L):
+    """ Convert the given solar longitude (J2000) to Julian date, J2000.0 epoch using the Chebyshev fits of
+        the JPL solar longitude. The arguments can be numpy arrays.
+    
+    Arguments:
+        year: [int or ndarray] Year of the event.
+        month: [int or ndarray] Month of the event.
+        L: [float or ndarray] Solar longitude (radians), J2000 epoch.
+
+    Return:
+        JD: [float or ndarray] Julian date.
+
+    """
+
+    # Use the middle of the given month as the reference, the solution is the closest one to it
+    jd_ref = np.vectorize(lambda y, m: date2JD(int(y), int(m), 15, 12, 0, 0))(year, month)
+
+    if np.ndim(jd_ref) == 0:
+        jd_ref = float(jd_ref)
+
+    return getSolLonChebyshev().solLon2jd(L, jd_ref)
+
+
+
+
 if __name__ == "__main__":
 
     ### Test all solar longitude functions and see the difference between the solar longitudes they return
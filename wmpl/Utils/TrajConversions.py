@@ -112,6 +112,15 @@ def floatArguments(func):
 ##################
 
 
+def _broadcastOutputs(outputs):
+    """ Internal function. Broadcast a tuple of outputs of an array-native function to numpy arrays of the
+        same shape, as np.vectorize would return them.
+    """
+
+    return tuple(np.array(arr, dtype=np.float64) for arr in np.broadcast_arrays(*outputs))
+
+
+
 ### Time conversions ###
 
 
@@ -297,11 +306,12 @@ def jd2LST(julian_date, lon):
     Source: J. Meeus: Astronomical Algorithms
 
     Arguments:
-        julian_date: [float] decimal julian date, epoch J2000.0
-        lon: [float] longitude of the observer in degrees
+        julian_date: [float or ndarray] decimal julian date, epoch J2000.0
+        lon: [float or ndarray] longitude of the observer in degrees
     
     Return:
-        (LST, GST): [tuple of floats] a tuple of Local Sidereal Time and Greenwich Sidereal Time
+        (LST, GST): [tuple of floats] a tuple of Local Sidereal Time and Greenwich Sidereal Time (in 
+            degrees). Arrays are returned if any of the inputs are arrays.
     """
 
     # t = (julian_date - J2000_JD.days)/36525.0
@@ -324,21 +334,31 @@ def jd2DynamicalTimeJD(jd):
         conversion takes care of leap seconds. 
 
     Arguments:
-        jd: [float] Julian date.
+        jd: [float or ndarray] Julian date.
 
     Return:
-        [float] Dynamical time Julian date.
+        [float or ndarray] Dynamical time Julian date.
     """
 
     # Leap seconds as of 2017 (default)
     leap_secs = 37.0
 
+    if np.ndim(jd) == 0:
 
-    # Get the relevant number of leap seconds for the given JD
-    for jd_leap, ls in config.leap_seconds:
-        
-        if jd > jd_leap:
-            leap_secs = ls
+        # Get the relevant number of leap seconds for the given JD
+        for jd_leap, ls in config.leap_seconds:
+            
+            if jd > jd_leap:
+                leap_secs = ls
+
+    else:
+
+        jd = np.asarray(jd, dtype=np.float64)
+        leap_secs = np.zeros_like(jd) + leap_secs
+
+        # Get the relevant number of leap seconds for every JD
+        for jd_leap, ls in config.leap_seconds:
+            leap_secs[jd > jd_leap] = ls
             
 
     # Calculate the dynamical JD
@@ -463,9 +483,9 @@ def latLonAlt2ECEF(lat, lon, h):
     """ Convert geographical coordinates to Earth centered - Earth fixed coordinates.
 
     Arguments:
-        lat: [float] latitude in radians (+north)
-        lon: [float] longitude in radians (+east)
-        h: [float] elevation in meters (WGS84)
+        lat: [float or ndarray] latitude in radians (+north)
+        lon: [float or ndarray] longitude in radians (+east)
+        h: [float or ndarray] elevation in meters (WGS84)
 
     Return:
         (x, y, z): [tuple of floats] ECEF coordinates
@@ -473,21 +493,22 @@ def latLonAlt2ECEF(lat, lon, h):
     """
 
     # Get distance from Earth centre to the position given by geographical coordinates, in WGS84
-    N = EARTH.EQUATORIAL_RADIUS/math.sqrt(1.0 - (EARTH.E**2)*math.sin(lat)**2)
+    N = EARTH.EQUATORIAL_RADIUS/np.sqrt(1.0 - (EARTH.E**2)*np.sin(lat)**2)
 
     # Calculate ECEF coordinates
-    ecef_x = (N + h)*math.cos(lat)*math.cos(lon)
-    ecef_y = (N + h)*math.cos(lat)*math.sin(lon)
-    ecef_z = ((1 - EARTH.E**2)*N + h)*math.sin(lat)
+    ecef_x = (N + h)*np.cos(lat)*np.cos(lon)
+    ecef_y = (N + h)*np.cos(lat)*np.sin(lon)
+    ecef_z = ((1 - EARTH.E**2)*N + h)*np.sin(lat)
 
     return ecef_x, ecef_y, ecef_z
 
 
 
-@floatArguments
 def geo2Cartesian(lat_rad, lon_rad, h, julian_date, precess_j2000=False):
     """ Convert geographical Earth coordinates to Cartesian ECI coordinate system (Earth center as origin).
         The Earth is considered as an elipsoid.
+
+        All arguments can either be floats or numpy arrays, which are broadcast against each other.
     
     Arguments:
         lat_rad: [float] Latitude of the observer in radians (+N), WGS84.
@@ -503,6 +524,9 @@ def geo2Cartesian(lat_rad, lon_rad, h, julian_date, precess_j2000=False):
         
     """
 
+    lat_rad, lon_rad, h, julian_date = [np.asarray(arg, dtype=np.float64) if np.ndim(arg) else float(arg) \
+        for arg in (lat_rad, lon_rad, h, julian_date)]
+
     lon = np.degrees(lon_rad)
 
 
@@ -519,10 +543,10 @@ def geo2Cartesian(lat_rad, lon_rad, h, julian_date, precess_j2000=False):
 
 
     # Calculate the Earth radius at given latitude
-    Rh = math.sqrt(ecef_x**2 + ecef_y**2 + ecef_z**2)
+    Rh = np.sqrt(ecef_x**2 + ecef_y**2 + ecef_z**2)
 
     # Calculate the geocentric latitude (latitude which considers the Earth as an elipsoid)
-    lat_geocentric = math.atan2(ecef_z, math.sqrt(ecef_x**2 + ecef_y**2))
+    lat_geocentric = np.arctan2(ecef_z, np.sqrt(ecef_x**2 + ecef_y**2))
 
     # Calculate Cartesian ECI coordinates (in meters), in the epoch of date
     x = Rh*np.cos(lat_geocentric)*np.cos(LST_rad)
@@ -556,8 +580,13 @@ def geo2Cartesian(lat_rad, lon_rad, h, julian_date, precess_j2000=False):
         return x, y, z
 
 
-# Vectorize the geo2Cartesian function, so julian_date can be given as a numpy array
-geo2Cartesian_vect = np.vectorize(geo2Cartesian, excluded=['lat_rad', 'lon_rad', 'h'])
+def geo2Cartesian_vect(lat_rad, lon_rad, h, julian_date, precess_j2000=False):
+    """ Version of geo2Cartesian which always returns numpy arrays, so julian_date can be given as a list 
+        or a numpy array. See geo2Cartesian for details.
+    """
+
+    return _broadcastOutputs(geo2Cartesian(lat_rad, lon_rad, h, np.asarray(julian_date, dtype=np.float64), \
+        precess_j2000=precess_j2000))
 
 
 # # DAVE's CLARK EQs
@@ -618,9 +647,9 @@ def ecef2LatLonAlt(x, y, z):
         elevation).
 
     Arguments:
-        x: [float] ECEF x coordinate
-        y: [float] ECEF y coordinate
-        z: [float] ECEF z coordinate
+        x: [float or ndarray] ECEF x coordinate
+        y: [float or ndarray] ECEF y coordinate
+        z: [float or ndarray] ECEF z coordinate
 
     Return:
         (lat, lon, alt): [tuple of floats] latitude and longitude in radians, WGS84 elevation in meters
@@ -642,18 +671,26 @@ def ecef2LatLonAlt(x, y, z):
         p - (EARTH.E**2)*EARTH.EQUATORIAL_RADIUS*np.cos(theta)**3)
 
     # Get distance from Earth centre to the position given by geographical coordinates, in WGS84
-    N = EARTH.EQUATORIAL_RADIUS/math.sqrt(1.0 - (EARTH.E**2)*math.sin(lat)**2)
+    N = EARTH.EQUATORIAL_RADIUS/np.sqrt(1.0 - (EARTH.E**2)*np.sin(lat)**2)
 
     
     # Calculate the height in meters
 
     # Correct for numerical instability in altitude near exact poles (and make sure cos(lat) is not 0!)
-    if((np.abs(x) < 1000) and (np.abs(y) < 1000)):
-        alt = np.abs(z) - EARTH.POLAR_RADIUS
+    near_pole = (np.abs(x) < 1000) & (np.abs(y) < 1000)
+
+    if np.ndim(near_pole) == 0:
+
+        if near_pole:
+            alt = np.abs(z) - EARTH.POLAR_RADIUS
+
+        else:
+            # Calculate altitude anywhere else
+            alt = p/np.cos(lat) - N
 
     else:
-        # Calculate altitude anywhere else
-        alt = p/np.cos(lat) - N
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alt = np.where(near_pole, np.abs(z) - EARTH.POLAR_RADIUS, p/np.cos(lat) - N)
 
 
     return lat, lon, alt
@@ -662,6 +699,7 @@ def ecef2LatLonAlt(x, y, z):
 
 def cartesian2Geo(julian_date, x, y, z, precess_j2000=False):
     """ Convert Cartesian ECI coordinates of a point (origin in Earth's centre) to geographical coordinates.
+        The arguments can either be floats or numpy arrays.
     
     Arguments:
         julian_date: [float] decimal julian date
@@ -721,7 +759,7 @@ def cartesian2Geo(julian_date, x, y, z, precess_j2000=False):
 
 def altAz2RADec(azim, elev, jd, lat, lon):
     """ Convert azimuth and altitude in a given time and position on Earth to right ascension and 
-        declination. 
+        declination. The arguments can either be floats or numpy arrays.
 
     Arguments:
         azim: [float] azimuth (+east of due north) in radians
@@ -750,13 +788,20 @@ def altAz2RADec(azim, elev, jd, lat, lon):
 
     return ra, dec
 
-# Vectorize the altAz2RADec function so it can take numpy arrays for: azim, elev, jd
-altAz2RADec_vect = np.vectorize(altAz2RADec, excluded=['lat', 'lon'])
+def altAz2RADec_vect(azim, elev, jd, lat, lon):
+    """ Version of altAz2RADec which always returns numpy arrays, so azim, elev and jd can be given as 
+        lists or numpy arrays. See altAz2RADec for details.
+    """
+
+    azim, elev, jd = [np.asarray(arg, dtype=np.float64) for arg in (azim, elev, jd)]
+
+    return _broadcastOutputs(altAz2RADec(azim, elev, jd, lat, lon))
 
 
 
 def raDec2AltAz(ra, dec, jd, lat, lon):
-    """ Convert right ascension and declination to azimuth (+east of sue north) and altitude. 
+    """ Convert right ascension and declination to azimuth (+east of sue north) and altitude. The arguments 
+        can either be floats or numpy arrays.
 
     Arguments:
         ra: [float] right ascension in radians
@@ -794,8 +839,14 @@ def raDec2AltAz(ra, dec, jd, lat, lon):
 
     return azim, elev
 
-# Vectorize the raDec2AltAz function so it can take numpy arrays for: ra, dec, jd
-raDec2AltAz_vect = np.vectorize(raDec2AltAz, excluded=['lat', 'lon'])
+def raDec2AltAz_vect(ra, dec, jd, lat, lon):
+    """ Version of raDec2AltAz which always returns numpy arrays, so ra, dec and jd can be given as 
+        lists or numpy arrays. See raDec2AltAz for details.
+    """
+
+    ra, dec, jd = [np.asarray(arg, dtype=np.float64) for arg in (ra, dec, jd)]
+
+    return _broadcastOutputs(raDec2AltAz(ra, dec, jd, lat, lon))
 
 
 
@@ -1056,6 +1107,8 @@ def equatorialCoordPrecession(start_epoch, final_epoch, ra, dec):
         account.
 
         Implemented from: Jean Meeus - Astronomical Algorithms, 2nd edition, pages 134-135
+
+        The arguments can either be floats or numpy arrays.
     
     Arguments:
         start_epoch: [float] Julian date of the starting epoch
@@ -1078,7 +1131,7 @@ def equatorialCoordPrecession(start_epoch, final_epoch, ra, dec):
     theta = ((2004.3109 - 0.85330*T - 0.000217*T**2)*t - (0.42665 + 0.000217*T)*t**2 - 0.041833*t**3)/3600
 
     # Convert parameters to radians
-    zeta, z, theta = map(math.radians, (zeta, z, theta))
+    zeta, z, theta = map(np.radians, (zeta, z, theta))
 
     # Calculate the next set of parameters
     A = np.cos(dec)  *np.sin(ra + zeta)
@@ -1089,10 +1142,17 @@ def equatorialCoordPrecession(start_epoch, final_epoch, ra, dec):
     ra_corr = np.arctan2(A, B) + z
 
     # Calculate declination (apply a different equation if close to the pole, closer then 0.5 degrees)
-    if (np.pi/2 - np.abs(dec)) < np.radians(0.5):
-        dec_corr = np.arccos(np.sqrt(A**2 + B**2))
+    near_pole = (np.pi/2 - np.abs(dec)) < np.radians(0.5)
+
+    if np.ndim(near_pole) == 0:
+
+        if near_pole:
+            dec_corr = np.arccos(np.sqrt(A**2 + B**2))
+        else:
+            dec_corr = np.arcsin(C)
+
     else:
-        dec_corr = np.arcsin(C)
+        dec_corr = np.where(near_pole, np.arccos(np.sqrt(A**2 + B**2)), np.arcsin(C))
 
     # Wrap right ascension to [0, 2*pi] range
     ra_corr = ra_corr%(2*np.pi)
@@ -1102,8 +1162,14 @@ def equatorialCoordPrecession(start_epoch, final_epoch, ra, dec):
 
     return ra_corr, dec_corr
 
-# Vectorize the equatorialCoordPrecession, so ra and dec can be passed as numpy arrays
-equatorialCoordPrecession_vect = np.vectorize(equatorialCoordPrecession, excluded=['start_epoch'])
+def equatorialCoordPrecession_vect(start_epoch, final_epoch, ra, dec):
+    """ Version of equatorialCoordPrecession which always returns numpy arrays, so final_epoch, ra and dec 
+        can be given as lists or numpy arrays. See equatorialCoordPrecession for details.
+    """
+
+    final_epoch, ra, dec = [np.asarray(arg, dtype=np.float64) for arg in (final_epoch, ra, dec)]
+
+    return _broadcastOutputs(equatorialCoordPrecession(start_epoch, final_epoch, ra, dec))
 
 
 
@@ -1227,7 +1293,7 @@ if __name__ == "__main__":
 
 
     ### Corrected heliocentric ecliptic coordinats test (Tsuchiya et al. 2017) example ###
-    from jplephem.spk import SPK
+    from wmpl.Utils.Earth import getJPLEphemeris
 
     ## EXAMPLE 1
     # jd = date2JD(2008, 11, 1, 13, 33, 38)
@@ -1254,13 +1320,10 @@ if __name__ == "__main__":
     # vh: 38.71
     ###########
     
-    # Load the JPL ephemerids data
-    jpl_ephem_data = SPK.open(config.jpl_ephem_file)
-    
     # Get the position of the Earth (km) and its velocity (km/s) at the given Julian date (J2000 epoch)
     # The position is given in the ecliptic coordinates, origin of the coordinate system is in the Solar 
     # system barycentre
-    earth_pos, earth_vel = wmpl.Utils.Earth.calcEarthRectangularCoordJPL(jd, jpl_ephem_data)
+    earth_pos, earth_vel = getJPLEphemeris().earthState(jd)
 
     # Calculate corrected heliocentrc coordinates
     L_h, B_h, met_v_h = correctedEclipticCoord(L_g, B_g, v_g, earth_vel)